@@ -0,0 +1,237 @@
+import csv
+import heapq
+import json
+import math
+import random
+import zlib
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.common.config import get_cfg
+
+# Arrival models for sensor_sim. All of them are open loop: send times are
+# fixed by the model and the run's start time, never by how fast earlier
+# sends completed, so a slow collector cannot throttle the offered load and
+# hide its own latency.
+#
+#   constant  evenly spaced sends at telemetry_rate, burst_rate inside the
+#             burst window (the original behaviour)
+#   poisson   same rates, exponential inter-arrival times
+#   mmpp      Poisson arrivals whose rate switches between telemetry_rate
+#             and burst_rate, with exponential dwell times (on/off bursts)
+#   diurnal   Poisson arrivals whose rate follows a cosine from
+#             telemetry_rate (trough) to burst_rate (peak) every period_s
+#   replay    the messages of a recorded trace_events.csv or MQTT capture,
+#             with their original inter-arrival times
+
+ARRIVAL_MODELS = ("constant", "poisson", "mmpp", "diurnal", "replay")
+
+
+class BurstProfile:
+    def __init__(self, rate: float, burst_rate: float, burst_start_s: float, burst_duration_s: float) -> None:
+        self.rate = rate
+        self.burst_rate = burst_rate
+        self.burst_start_s = burst_start_s
+        self.burst_end_s = burst_start_s + burst_duration_s
+
+    def rate_at(self, elapsed_s: float) -> float:
+        if self.burst_start_s <= elapsed_s < self.burst_end_s:
+            return self.burst_rate
+        return self.rate
+
+
+class MmppProfile:
+    # Two-state Markov-modulated rate. The state sequence comes from a seeded
+    # RNG, so every sensor_sim shard sees the same on/off periods.
+    def __init__(self, low_rate: float, high_rate: float, mean_low_s: float, mean_high_s: float, seed: int) -> None:
+        self.low_rate = low_rate
+        self.high_rate = high_rate
+        self.mean_low_s = mean_low_s
+        self.mean_high_s = mean_high_s
+        self._rng = random.Random(seed)
+        self._high = False
+        self._switch_s = self._rng.expovariate(1.0 / mean_low_s)
+
+    def rate_at(self, elapsed_s: float) -> float:
+        # elapsed_s must not decrease between calls
+        while elapsed_s >= self._switch_s:
+            self._high = not self._high
+            mean_s = self.mean_high_s if self._high else self.mean_low_s
+            self._switch_s += self._rng.expovariate(1.0 / mean_s)
+        return self.high_rate if self._high else self.low_rate
+
+
+class DiurnalProfile:
+    def __init__(self, min_rate: float, max_rate: float, period_s: float) -> None:
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.period_s = period_s
+
+    def rate_at(self, elapsed_s: float) -> float:
+        phase = (1.0 - math.cos(2.0 * math.pi * elapsed_s / self.period_s)) / 2.0
+        return self.min_rate + (self.max_rate - self.min_rate) * phase
+
+
+def profile_from_cfg(cfg: Dict[str, Any], model: Optional[str] = None) -> Any:
+    model = model or str(get_cfg(cfg, "sensor_sim.arrival.model", "constant"))
+    rate = float(get_cfg(cfg, "sensor_sim.telemetry_rate", 50))
+    burst_rate = float(get_cfg(cfg, "sensor_sim.burst_rate", rate))
+    if model == "mmpp":
+        return MmppProfile(
+            rate,
+            burst_rate,
+            float(get_cfg(cfg, "sensor_sim.arrival.mmpp.mean_low_s", 10)),
+            float(get_cfg(cfg, "sensor_sim.arrival.mmpp.mean_high_s", 2)),
+            int(get_cfg(cfg, "sensor_sim.arrival.seed", 1)),
+        )
+    if model == "diurnal":
+        return DiurnalProfile(rate, burst_rate, float(get_cfg(cfg, "sensor_sim.arrival.diurnal.period_s", 60)))
+    return BurstProfile(
+        rate,
+        burst_rate,
+        float(get_cfg(cfg, "sensor_sim.burst_start_s", 0)),
+        float(get_cfg(cfg, "sensor_sim.burst_duration_s", 0)),
+    )
+
+
+class ReplayRecord(NamedTuple):
+    offset_ms: float
+    device_id: str
+    msg_type: str
+    values: Optional[Dict[str, float]]
+    alarm: Optional[Dict[str, Any]]
+
+
+def _load_trace_csv(path: str) -> List[ReplayRecord]:
+    # trace_events.csv carries no sensor values; they are regenerated on send
+    out = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            t = row.get("t_sensor_ms") or row.get("t_pc_rx_ms")
+            if not t:
+                continue
+            out.append(ReplayRecord(float(t), row["device_id"], row["msg_type"], None, None))
+    return out
+
+
+def _load_capture(path: str) -> List[ReplayRecord]:
+    # One published JSON payload per line, as printed by
+    # `mosquitto_sub -t 'fire_system/#'`; lines that are not sensor
+    # messages (status, binary payloads) are skipped
+    out = []
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(data, dict) or data.get("t_sensor_ms") is None or not data.get("device_id"):
+                continue
+            out.append(
+                ReplayRecord(
+                    float(data["t_sensor_ms"]),
+                    str(data["device_id"]),
+                    str(data.get("type", "telemetry")),
+                    data.get("values"),
+                    data.get("alarm"),
+                )
+            )
+    return out
+
+
+def load_replay(path: str, shard: int = 0, shards: int = 1, speed: float = 1.0) -> List[ReplayRecord]:
+    # Records of this shard's devices, sorted, with offset_ms relative to the
+    # first record of the whole file and divided by speed
+    records = _load_trace_csv(path) if path.lower().endswith(".csv") else _load_capture(path)
+    if not records:
+        return []
+    records.sort(key=lambda r: r.offset_ms)
+    t0 = records[0].offset_ms
+    return [
+        r._replace(offset_ms=(r.offset_ms - t0) / speed)
+        for r in records
+        if shards == 1 or zlib.crc32(r.device_id.encode("utf-8")) % shards == shard
+    ]
+
+
+class ReplaySchedule:
+    def __init__(self, records: List[ReplayRecord], start_ms: float) -> None:
+        self._records = records
+        self._start_ms = start_ms
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self._records) - self._next
+
+    def next_ms(self) -> float:
+        if self._next >= len(self._records):
+            return float("inf")
+        return self._start_ms + self._records[self._next].offset_ms
+
+    def due(self, now_ms: float) -> Iterator[Tuple[ReplayRecord, float]]:
+        records = self._records
+        while self._next < len(records):
+            t = self._start_ms + records[self._next].offset_ms
+            if t > now_ms:
+                return
+            self._next += 1
+            yield records[self._next - 1], t
+
+
+class FireSpread:
+    # A fire starting at device `origin` at start_s and spreading over a
+    # square grid of devices (index = row * width + col) to the 4
+    # neighbours of every burning device, each hop taking spread_ms scaled
+    # by a random factor in [0.5, 1.5]. Ignition times are computed up front
+    # from a seeded RNG so that all shards agree on them. A burning device
+    # raises an alarm on ignition and every alarm_repeat_ms after that, and
+    # its telemetry reports fire values.
+    def __init__(
+        self,
+        device_count: int,
+        origin: int,
+        start_s: float,
+        spread_ms: float,
+        alarm_repeat_ms: float,
+        max_devices: int,
+        seed: int,
+    ) -> None:
+        self.alarm_repeat_ms = alarm_repeat_ms
+        width = max(1, math.ceil(math.sqrt(device_count)))
+        rng = random.Random(seed)
+        limit = max_devices if max_devices > 0 else device_count
+        self.ignition_ms: Dict[int, float] = {}
+        heap = [(start_s * 1000.0, origin % device_count)]
+        while heap and len(self.ignition_ms) < limit:
+            t, dev = heapq.heappop(heap)
+            if dev in self.ignition_ms:
+                continue
+            self.ignition_ms[dev] = t
+            row, col = divmod(dev, width)
+            for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)):
+                n = r * width + c
+                if 0 <= r and 0 <= c < width and n < device_count and n not in self.ignition_ms:
+                    heapq.heappush(heap, (t + spread_ms * rng.uniform(0.5, 1.5), n))
+
+    def burning(self, device_index: int, elapsed_ms: float) -> bool:
+        t = self.ignition_ms.get(device_index)
+        return t is not None and elapsed_ms >= t
+
+    def alarm_schedule(self, devices: List[int], start_ms: float) -> List[Tuple[float, int]]:
+        # Heap of (first alarm ms, device) for the given devices
+        heap = [(start_ms + self.ignition_ms[d], d) for d in devices if d in self.ignition_ms]
+        heapq.heapify(heap)
+        return heap
+
+
+def fire_spread_from_cfg(cfg: Dict[str, Any], device_count: int) -> Optional[FireSpread]:
+    if not bool(get_cfg(cfg, "sensor_sim.fire_spread.enabled", False)):
+        return None
+    return FireSpread(
+        device_count,
+        int(get_cfg(cfg, "sensor_sim.fire_spread.origin", 0)),
+        float(get_cfg(cfg, "sensor_sim.fire_spread.start_s", 10)),
+        float(get_cfg(cfg, "sensor_sim.fire_spread.spread_ms", 2000)),
+        float(get_cfg(cfg, "sensor_sim.fire_spread.alarm_repeat_ms", 1000)),
+        int(get_cfg(cfg, "sensor_sim.fire_spread.max_devices", 0)),
+        int(get_cfg(cfg, "sensor_sim.arrival.seed", 1)),
+    )
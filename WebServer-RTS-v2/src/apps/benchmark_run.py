@@ -1,14 +1,26 @@
 import argparse
+import asyncio
+import bisect
 import csv
 import json
 import os
+import socket
 import subprocess
 import sys
+import threading
 import time
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence
 
+from src.apps import collector_async, collector_main, sensor_sim
 from src.common.config import get_cfg, load_config
-from src.common.metrics import jitter, miss_rate, percentile, freshness_ratio
+from src.common.log import setup_logging
+from src.common.metrics import freshness_ratio, jitter_sorted, miss_rate, percentile_sorted
+from src.common.trace_bin import NULL_I64, export_csv, has_binary_trace, load_binary_trace
+
+try:
+    import numpy as np
+except Exception:  # pragma: no cover
+    np = None
 
 
 TRACE_FINAL_FIELDS = [
@@ -16,6 +28,7 @@ TRACE_FINAL_FIELDS = [
     "device_id",
     "msg_type",
     "t_sensor_ms",
+    "t_intended_ms",
     "t_pc_rx_ms",
     "t_proc_start_ms",
     "t_proc_end_ms",
@@ -24,6 +37,7 @@ TRACE_FINAL_FIELDS = [
     "t_dashboard_emit_ms",
     "deadline_ms",
     "end_to_end_ms",
+    "response_time_ms",
     "db_time_ms",
     "non_db_time_ms",
     "deadline_miss",
@@ -45,6 +59,101 @@ def _safe_int(value: str) -> Optional[int]:
         return None
 
 
+# Trace note of telemetry the pipeline shed as expired (pipeline.mark_shed)
+SHED_NOTE = "shed_expired"
+
+EVENT_INT_FIELDS = [
+    "t_sensor_ms",
+    "t_intended_ms",
+    "t_pc_rx_ms",
+    "t_proc_start_ms",
+    "t_proc_end_ms",
+    "t_db_enqueue_ms",
+    "t_dashboard_emit_ms",
+    "deadline_ms",
+    "avi_ms",
+]
+
+
+def _final_row(
+    msg_id: str,
+    device_id: str,
+    msg_type: str,
+    ev: Dict[str, Optional[int]],
+    notes: str,
+    t_db_ack_ms: Optional[int],
+) -> Dict[str, object]:
+    t_sensor_ms = ev["t_sensor_ms"]
+    t_intended_ms = ev.get("t_intended_ms")
+    t_pc_rx_ms = ev["t_pc_rx_ms"]
+    t_db_enqueue_ms = ev["t_db_enqueue_ms"]
+    t_dashboard_emit_ms = ev["t_dashboard_emit_ms"]
+    deadline_ms = ev["deadline_ms"]
+    avi_ms = ev["avi_ms"]
+
+    # Suppressed status writes and shed telemetry never had anything to
+    # acknowledge
+    shed = SHED_NOTE in notes
+    if t_db_ack_ms is None and "state_suppressed" not in notes and not shed:
+        if notes:
+            notes = notes + ";db_ack_missing"
+        else:
+            notes = "db_ack_missing"
+
+    # end_to_end_ms is the service time, from when the sensor actually sent;
+    # response_time_ms counts from when it meant to send, so it includes any
+    # delay in the sender itself (coordinated omission). Without an intended
+    # time the two are equal.
+    ts_base = t_sensor_ms if t_sensor_ms is not None else t_pc_rx_ms
+    end_to_end_ms = None
+    if t_dashboard_emit_ms is not None and ts_base is not None:
+        end_to_end_ms = t_dashboard_emit_ms - ts_base
+    response_time_ms = None
+    if end_to_end_ms is not None:
+        response_time_ms = t_dashboard_emit_ms - t_intended_ms if t_intended_ms is not None else end_to_end_ms
+
+    db_time_ms = None
+    if t_db_ack_ms is not None and t_db_enqueue_ms is not None:
+        db_time_ms = t_db_ack_ms - t_db_enqueue_ms
+
+    non_db_time_ms = None
+    if t_dashboard_emit_ms is not None and t_pc_rx_ms is not None and db_time_ms is not None:
+        non_db_time_ms = t_dashboard_emit_ms - t_pc_rx_ms - db_time_ms
+
+    # Shed telemetry expired before it was processed and never reaches the
+    # dashboard: it has no end_to_end_ms but always missed its deadline
+    deadline_miss = 1 if shed else None
+    if end_to_end_ms is not None and deadline_ms is not None:
+        deadline_miss = 1 if end_to_end_ms > deadline_ms else 0
+
+    is_fresh = None
+    if t_dashboard_emit_ms is not None and ts_base is not None and avi_ms is not None:
+        is_fresh = 1 if (t_dashboard_emit_ms - ts_base) <= avi_ms else 0
+
+    derived = {
+        "t_db_ack_ms": t_db_ack_ms,
+        "end_to_end_ms": end_to_end_ms,
+        "response_time_ms": response_time_ms,
+        "db_time_ms": db_time_ms,
+        "non_db_time_ms": non_db_time_ms,
+        "deadline_miss": deadline_miss,
+        "is_fresh": is_fresh,
+    }
+    out_row: Dict[str, object] = {"msg_id": msg_id, "device_id": device_id, "msg_type": msg_type}
+    for k in TRACE_FINAL_FIELDS[3:-1]:
+        v = ev[k] if k in ev else derived[k]
+        out_row[k] = v if v is not None else ""
+    out_row["notes"] = notes
+    return out_row
+
+
+def _write_final(rows: List[Dict[str, object]], final_path: str) -> None:
+    with open(final_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=TRACE_FINAL_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
 def join_trace(events_path: str, ack_path: str, final_path: str) -> List[Dict[str, object]]:
     ack_map: Dict[str, Optional[int]] = {}
     if os.path.exists(ack_path):
@@ -62,96 +171,97 @@ def join_trace(events_path: str, ack_path: str, final_path: str) -> List[Dict[st
         reader = csv.DictReader(f)
         for row in reader:
             msg_id = row.get("msg_id", "")
-            t_sensor_ms = _safe_int(row.get("t_sensor_ms", ""))
-            t_pc_rx_ms = _safe_int(row.get("t_pc_rx_ms", ""))
-            t_proc_start_ms = _safe_int(row.get("t_proc_start_ms", ""))
-            t_proc_end_ms = _safe_int(row.get("t_proc_end_ms", ""))
-            t_db_enqueue_ms = _safe_int(row.get("t_db_enqueue_ms", ""))
-            t_dashboard_emit_ms = _safe_int(row.get("t_dashboard_emit_ms", ""))
-            deadline_ms = _safe_int(row.get("deadline_ms", ""))
-            avi_ms = _safe_int(row.get("avi_ms", ""))
-            notes = row.get("notes", "") or ""
-
-            t_db_ack_ms = ack_map.get(msg_id)
-            if t_db_ack_ms is None:
-                if notes:
-                    notes = notes + ";db_ack_missing"
-                else:
-                    notes = "db_ack_missing"
-
-            ts_base = t_sensor_ms if t_sensor_ms is not None else t_pc_rx_ms
-            end_to_end_ms = None
-            if t_dashboard_emit_ms is not None and ts_base is not None:
-                end_to_end_ms = t_dashboard_emit_ms - ts_base
-
-            db_time_ms = None
-            if t_db_ack_ms is not None and t_db_enqueue_ms is not None:
-                db_time_ms = t_db_ack_ms - t_db_enqueue_ms
-
-            non_db_time_ms = None
-            if t_dashboard_emit_ms is not None and t_pc_rx_ms is not None and db_time_ms is not None:
-                non_db_time_ms = t_dashboard_emit_ms - t_pc_rx_ms - db_time_ms
-
-            deadline_miss = None
-            if end_to_end_ms is not None and deadline_ms is not None:
-                deadline_miss = 1 if end_to_end_ms > deadline_ms else 0
-
-            is_fresh = None
-            if t_dashboard_emit_ms is not None and ts_base is not None and avi_ms is not None:
-                is_fresh = 1 if (t_dashboard_emit_ms - ts_base) <= avi_ms else 0
-
-            out_row = {
-                "msg_id": msg_id,
-                "device_id": row.get("device_id", ""),
-                "msg_type": row.get("msg_type", ""),
-                "t_sensor_ms": t_sensor_ms if t_sensor_ms is not None else "",
-                "t_pc_rx_ms": t_pc_rx_ms if t_pc_rx_ms is not None else "",
-                "t_proc_start_ms": t_proc_start_ms if t_proc_start_ms is not None else "",
-                "t_proc_end_ms": t_proc_end_ms if t_proc_end_ms is not None else "",
-                "t_db_enqueue_ms": t_db_enqueue_ms if t_db_enqueue_ms is not None else "",
-                "t_db_ack_ms": t_db_ack_ms if t_db_ack_ms is not None else "",
-                "t_dashboard_emit_ms": t_dashboard_emit_ms if t_dashboard_emit_ms is not None else "",
-                "deadline_ms": deadline_ms if deadline_ms is not None else "",
-                "end_to_end_ms": end_to_end_ms if end_to_end_ms is not None else "",
-                "db_time_ms": db_time_ms if db_time_ms is not None else "",
-                "non_db_time_ms": non_db_time_ms if non_db_time_ms is not None else "",
-                "deadline_miss": deadline_miss if deadline_miss is not None else "",
-                "avi_ms": avi_ms if avi_ms is not None else "",
-                "is_fresh": is_fresh if is_fresh is not None else "",
-                "notes": notes,
-            }
-            rows.append(out_row)
+            ev = {k: _safe_int(row.get(k, "")) for k in EVENT_INT_FIELDS}
+            rows.append(
+                _final_row(
+                    msg_id,
+                    row.get("device_id", ""),
+                    row.get("msg_type", ""),
+                    ev,
+                    row.get("notes", "") or "",
+                    ack_map.get(msg_id),
+                )
+            )
+
+    _write_final(rows, final_path)
+    return rows
 
-    with open(final_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=TRACE_FINAL_FIELDS)
-        writer.writeheader()
-        writer.writerows(rows)
 
-    return rows
+def _send_ms(row: Dict[str, object]) -> Optional[int]:
+    # Send-side timeline of a row: intended, else actual send, else receive
+    for k in ("t_intended_ms", "t_sensor_ms", "t_pc_rx_ms"):
+        v = _safe_int(str(row.get(k, "")))
+        if v is not None:
+            return v
+    return None
+
 
+def _measured_s(duration_s: float, warmup_s: float) -> float:
+    return max(0.0, duration_s - warmup_s)
+
+
+def _shed_miss_rate(sorted_vals: Sequence[float], deadline_ms: int, shed: int) -> Optional[float]:
+    # Miss rate over delivered and shed messages; every shed one is a miss
+    total = len(sorted_vals) + shed
+    if not total:
+        return None
+    return (len(sorted_vals) - bisect.bisect_right(sorted_vals, deadline_ms) + shed) / total
+
+
+def compute_summary(
+    rows: List[Dict[str, object]],
+    cfg: Dict[str, object],
+    duration_s: int,
+    stats_path: str,
+    warmup_s: float = 0,
+) -> Dict[str, object]:
+    # Messages sent during the first warmup_s of the run are left out of the
+    # KPIs (they stay in trace_final.csv)
+    if warmup_s > 0:
+        sends = [_send_ms(r) for r in rows]
+        known = [t for t in sends if t is not None]
+        if known:
+            cutoff = min(known) + warmup_s * 1000
+            rows = [r for r, t in zip(rows, sends) if t is not None and t >= cutoff]
 
-def compute_summary(rows: List[Dict[str, object]], cfg: Dict[str, object], duration_s: int, stats_path: str) -> Dict[str, object]:
     alarm_e2e: List[Optional[int]] = []
     telemetry_e2e: List[Optional[int]] = []
+    alarm_response: List[Optional[int]] = []
+    telemetry_response: List[Optional[int]] = []
     db_times: List[Optional[int]] = []
+    alarm_db_times: List[int] = []
+    transport_times: List[int] = []
     fresh_telemetry: List[int] = []
     fresh_state: List[int] = []
+    telemetry_shed = 0
 
     avi_state_ms = int(get_cfg(cfg, "freshness.avi_state_ms", 2000))
 
     for row in rows:
         msg_type = row.get("msg_type")
         end_to_end = _safe_int(str(row.get("end_to_end_ms", "")))
+        response = _safe_int(str(row.get("response_time_ms", "")))
         db_time = _safe_int(str(row.get("db_time_ms", "")))
         is_fresh = row.get("is_fresh", "")
 
         if msg_type == "alarm":
             alarm_e2e.append(end_to_end)
+            alarm_response.append(response)
         else:
             telemetry_e2e.append(end_to_end)
+            telemetry_response.append(response)
+            if SHED_NOTE in str(row.get("notes", "")):
+                telemetry_shed += 1
 
         if db_time is not None:
             db_times.append(db_time)
+            if msg_type == "alarm":
+                alarm_db_times.append(db_time)
+
+        t_sensor = _safe_int(str(row.get("t_sensor_ms", "")))
+        t_rx = _safe_int(str(row.get("t_pc_rx_ms", "")))
+        if t_sensor is not None and t_rx is not None:
+            transport_times.append(t_rx - t_sensor)
 
         if msg_type == "telemetry" and is_fresh != "":
             fresh_telemetry.append(int(is_fresh))
@@ -167,33 +277,340 @@ def compute_summary(rows: List[Dict[str, object]], cfg: Dict[str, object], durat
     alarm_deadline = int(get_cfg(cfg, "deadlines.alarm_deadline_ms"))
     telemetry_deadline = int(get_cfg(cfg, "deadlines.telemetry_deadline_ms"))
 
-    summary = {
+    alarm_sorted = sorted(v for v in alarm_e2e if v is not None)
+    telemetry_sorted = sorted(v for v in telemetry_e2e if v is not None)
+    alarm_response_sorted = sorted(v for v in alarm_response if v is not None)
+    telemetry_response_sorted = sorted(v for v in telemetry_response if v is not None)
+    summary = _summary_from_sorted(
+        len(rows),
+        _measured_s(duration_s, warmup_s),
+        alarm_sorted,
+        telemetry_sorted,
+        sorted(db_times),
+        miss_rate(alarm_sorted, alarm_deadline),
+        _shed_miss_rate(telemetry_sorted, telemetry_deadline, telemetry_shed),
+        freshness_ratio(fresh_telemetry),
+        freshness_ratio(fresh_state),
+        alarm_response_sorted,
+        telemetry_response_sorted,
+        miss_rate(alarm_response_sorted, alarm_deadline),
+        _shed_miss_rate(telemetry_response_sorted, telemetry_deadline, telemetry_shed),
+        sorted(transport_times),
+        sorted(alarm_db_times),
+    )
+    summary["telemetry_shed"] = telemetry_shed
+    summary["warmup_s"] = warmup_s
+    _attach_run_stats(summary, stats_path)
+    return summary
+
+
+def _summary_from_sorted(
+    n_rows: int,
+    duration_s: float,
+    alarm_sorted: Sequence[float],
+    telemetry_sorted: Sequence[float],
+    db_sorted: Sequence[float],
+    alarm_miss_rate: Optional[float],
+    telemetry_miss_rate: Optional[float],
+    fresh_telemetry_ratio: Optional[float],
+    fresh_state_ratio: Optional[float],
+    alarm_response_sorted: Sequence[float],
+    telemetry_response_sorted: Sequence[float],
+    alarm_response_miss_rate: Optional[float],
+    telemetry_response_miss_rate: Optional[float],
+    transport_sorted: Sequence[float],
+    alarm_db_sorted: Sequence[float],
+) -> Dict[str, object]:
+    # Every percentile/jitter of a series is read from one sorted copy.
+    # alarm_*/telemetry_* are service times (from the actual send);
+    # *_response_* count from the intended send time. transport_* is send to
+    # collector receive (t_pc_rx_ms - t_sensor_ms), the share of the latency
+    # spent in the broker/transport rather than in the pipeline.
+    return {
         "duration_s": duration_s,
-        "throughput_msg_s": round(len(rows) / duration_s, 2) if duration_s > 0 else 0,
-        "alarm_p50_ms": percentile(alarm_e2e, 50),
-        "alarm_p95_ms": percentile(alarm_e2e, 95),
-        "alarm_p99_ms": percentile(alarm_e2e, 99),
-        "alarm_jitter_ms": jitter(alarm_e2e),
-        "alarm_deadline_miss_rate": miss_rate(alarm_e2e, alarm_deadline),
-        "telemetry_p50_ms": percentile(telemetry_e2e, 50),
-        "telemetry_p95_ms": percentile(telemetry_e2e, 95),
-        "telemetry_p99_ms": percentile(telemetry_e2e, 99),
-        "telemetry_jitter_ms": jitter(telemetry_e2e),
-        "telemetry_deadline_miss_rate": miss_rate(telemetry_e2e, telemetry_deadline),
-        "db_time_p95_ms": percentile(db_times, 95),
-        "db_time_p99_ms": percentile(db_times, 99),
-        "freshness_ratio_telemetry": freshness_ratio(fresh_telemetry),
-        "freshness_ratio_state": freshness_ratio(fresh_state),
+        "throughput_msg_s": round(n_rows / duration_s, 2) if duration_s > 0 else 0,
+        "alarm_p50_ms": percentile_sorted(alarm_sorted, 50),
+        "alarm_p95_ms": percentile_sorted(alarm_sorted, 95),
+        "alarm_p99_ms": percentile_sorted(alarm_sorted, 99),
+        "alarm_jitter_ms": jitter_sorted(alarm_sorted),
+        "alarm_deadline_miss_rate": alarm_miss_rate,
+        "telemetry_p50_ms": percentile_sorted(telemetry_sorted, 50),
+        "telemetry_p95_ms": percentile_sorted(telemetry_sorted, 95),
+        "telemetry_p99_ms": percentile_sorted(telemetry_sorted, 99),
+        "telemetry_jitter_ms": jitter_sorted(telemetry_sorted),
+        "telemetry_deadline_miss_rate": telemetry_miss_rate,
+        "alarm_response_p50_ms": percentile_sorted(alarm_response_sorted, 50),
+        "alarm_response_p95_ms": percentile_sorted(alarm_response_sorted, 95),
+        "alarm_response_p99_ms": percentile_sorted(alarm_response_sorted, 99),
+        "alarm_response_deadline_miss_rate": alarm_response_miss_rate,
+        "telemetry_response_p50_ms": percentile_sorted(telemetry_response_sorted, 50),
+        "telemetry_response_p95_ms": percentile_sorted(telemetry_response_sorted, 95),
+        "telemetry_response_p99_ms": percentile_sorted(telemetry_response_sorted, 99),
+        "telemetry_response_deadline_miss_rate": telemetry_response_miss_rate,
+        "transport_p50_ms": percentile_sorted(transport_sorted, 50),
+        "transport_p95_ms": percentile_sorted(transport_sorted, 95),
+        "transport_p99_ms": percentile_sorted(transport_sorted, 99),
+        "db_time_p95_ms": percentile_sorted(db_sorted, 95),
+        "db_time_p99_ms": percentile_sorted(db_sorted, 99),
+        "alarm_db_time_p95_ms": percentile_sorted(alarm_db_sorted, 95),
+        "alarm_db_time_p99_ms": percentile_sorted(alarm_db_sorted, 99),
+        "freshness_ratio_telemetry": fresh_telemetry_ratio,
+        "freshness_ratio_state": fresh_state_ratio,
     }
 
+
+def _attach_run_stats(summary: Dict[str, object], stats_path: str) -> None:
     if os.path.exists(stats_path):
         with open(stats_path, "r", encoding="utf-8") as f:
             stats = json.load(f)
         summary["dropped_pipeline"] = stats.get("dropped_pipeline")
+        summary["dropped_alarm"] = stats.get("dropped_alarm")
+        summary["shed_pipeline"] = stats.get("shed_pipeline")
         summary["dropped_db"] = stats.get("dropped_db")
+        summary["db_errors"] = stats.get("db_errors")
+        summary["alarm_hedges"] = (stats.get("hedge") or {}).get("hedged")
         summary["queue_max_pipeline"] = stats.get("queue_max_pipeline")
         summary["queue_max_db"] = stats.get("queue_max_db")
+        summary["state_writes_suppressed"] = stats.get("state_writes_suppressed")
+
+
+def _parse_int_column(values: List[str]) -> "np.ndarray":
+    arr = np.array(values, dtype=str)
+    missing = arr == ""
+    try:
+        out = np.where(missing, "0", arr).astype(np.float64).astype(np.int64)
+    except ValueError:
+        parsed = [_safe_int(v) for v in values]
+        return np.array([NULL_I64 if v is None else v for v in parsed], dtype=np.int64)
+    out[missing] = NULL_I64
+    return out
+
+
+def load_trace_columns_csv(events_path: str, ack_path: str) -> Dict[str, "np.ndarray"]:
+    with open(events_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        raw = [list(col) for col in zip(*reader)] or [[] for _ in header]
+    by_name = dict(zip(header, raw))
+    n = len(raw[0]) if raw else 0
+
+    def text(name: str) -> "np.ndarray":
+        return np.array(by_name.get(name, [""] * n), dtype=object)
+
+    cols: Dict[str, np.ndarray] = {
+        "msg_id": text("msg_id"),
+        "device_id": text("device_id"),
+        "msg_type": text("msg_type"),
+        "notes": text("notes"),
+    }
+    for k in EVENT_INT_FIELDS:
+        cols[k] = _parse_int_column(by_name[k]) if k in by_name else np.full(n, NULL_I64, dtype=np.int64)
+    cols["key"] = np.array(by_name.get("msg_id", []), dtype=str)
+    cols["is_alarm"] = cols["msg_type"] == "alarm"
+    cols["is_telemetry"] = cols["msg_type"] == "telemetry"
+
+    ack_key = np.zeros(0, dtype=str)
+    ack_ms = np.zeros(0, dtype=np.int64)
+    if os.path.exists(ack_path):
+        with open(ack_path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            ids: List[str] = []
+            acks: List[str] = []
+            for row in reader:
+                ids.append(row.get("msg_id", ""))
+                acks.append(row.get("t_db_ack_ms", "") or "")
+        ack_key = np.array(ids, dtype=str)
+        ack_ms = _parse_int_column(acks)
+    cols["ack_key"] = ack_key
+    cols["ack_ms"] = ack_ms
+    return cols
+
+
+def load_trace_columns_binary(results_dir: str) -> Dict[str, "np.ndarray"]:
+    events, acks, strings = load_binary_trace(results_dir)
+    table = np.array(strings, dtype=object)
+
+    def code(value: str) -> int:
+        try:
+            return strings.index(value)
+        except ValueError:
+            return -1
+
+    msg_type = events["msg_type"]
+    cols: Dict[str, np.ndarray] = {
+        "msg_id": table[events["msg_id"]],
+        "device_id": table[events["device_id"]],
+        "msg_type": table[msg_type],
+        "notes": table[events["notes"]],
+        "key": np.asarray(events["msg_id"]),
+        "is_alarm": msg_type == code("alarm"),
+        "is_telemetry": msg_type == code("telemetry"),
+        "ack_key": np.asarray(acks["msg_id"]),
+        "ack_ms": np.asarray(acks["t_db_ack_ms"]),
+    }
+    for k in EVENT_INT_FIELDS:
+        cols[k] = np.asarray(events[k])
+    return cols
+
+
+def join_trace_columns(cols: Dict[str, "np.ndarray"]) -> Dict[str, "np.ndarray"]:
+    key = cols["key"]
+    ack_key = cols["ack_key"]
+    ack_ms = np.full(len(key), NULL_I64, dtype=np.int64)
+    if len(ack_key) > 0 and len(key) > 0:
+        # Stable sort + side="right" picks the last ack per msg_id, like the dict join
+        order = np.argsort(ack_key, kind="stable")
+        sorted_keys = ack_key[order]
+        pos = np.searchsorted(sorted_keys, key, side="right") - 1
+        pos_c = np.clip(pos, 0, None)
+        matched = (pos >= 0) & (sorted_keys[pos_c] == key)
+        ack_ms = np.where(matched, cols["ack_ms"][order][pos_c], NULL_I64)
+    ack_ms[ack_ms < 0] = NULL_I64
+
+    def ok(a: "np.ndarray") -> "np.ndarray":
+        return a != NULL_I64
+
+    sensor = cols["t_sensor_ms"]
+    intended = cols["t_intended_ms"]
+    rx = cols["t_pc_rx_ms"]
+    enq = cols["t_db_enqueue_ms"]
+    emit = cols["t_dashboard_emit_ms"]
+    deadline = cols["deadline_ms"]
+    avi = cols["avi_ms"]
+
+    ts_base = np.where(ok(sensor), sensor, rx)
+    # Response time counts from the intended send time where there is one
+    response_base = np.where(ok(intended), intended, ts_base)
+    e2e_ok = ok(emit) & ok(ts_base)
+    db_ok = ok(ack_ms) & ok(enq)
+    nondb_ok = ok(emit) & ok(rx) & db_ok
+    miss_ok = e2e_ok & ok(deadline)
+    fresh_ok = e2e_ok & ok(avi)
+
+    with np.errstate(over="ignore"):
+        e2e = emit - ts_base
+        response = emit - response_base
+        db_time = ack_ms - enq
+        nondb = emit - rx - db_time
+
+    notes = cols["notes"].copy()
+    note_text = notes.astype(str)
+    shed = np.char.find(note_text, SHED_NOTE) >= 0
+    missing = ~ok(ack_ms) & (np.char.find(note_text, "state_suppressed") < 0) & ~shed
+    if missing.any():
+        empty = notes == ""
+        notes[missing & empty] = "db_ack_missing"
+        tagged = missing & ~empty
+        notes[tagged] = notes[tagged] + ";db_ack_missing"
+
+    out = dict(cols)
+    out.update(
+        {
+            "t_db_ack_ms": ack_ms,
+            "ts_base": ts_base,
+            "send_ms": np.where(ok(intended), intended, ts_base),
+            "e2e_ok": e2e_ok,
+            "end_to_end_ms": np.where(e2e_ok, e2e, NULL_I64),
+            "response_time_ms": np.where(e2e_ok, response, NULL_I64),
+            "db_time_ms": np.where(db_ok, db_time, NULL_I64),
+            "non_db_time_ms": np.where(nondb_ok, nondb, NULL_I64),
+            "deadline_miss": np.where(miss_ok, (e2e > deadline).astype(np.int64), np.where(shed, 1, NULL_I64)),
+            "is_fresh": np.where(fresh_ok, (e2e <= avi).astype(np.int64), NULL_I64),
+            "notes": notes,
+            "shed": shed,
+        }
+    )
+    return out
+
+
+def write_final_columns(cols: Dict[str, "np.ndarray"], final_path: str) -> None:
+    out_cols: List[List[object]] = []
+    for k in TRACE_FINAL_FIELDS:
+        arr = cols[k]
+        if arr.dtype != object:
+            # csv writes None as an empty field, matching the row-based join
+            missing = arr == NULL_I64
+            arr = arr.astype(object)
+            arr[missing] = None
+        out_cols.append(arr.tolist())
+    with open(final_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(TRACE_FINAL_FIELDS)
+        writer.writerows(zip(*out_cols))
+
+
+def _py(value: object) -> object:
+    return value.item() if hasattr(value, "item") else value
+
+
+def compute_summary_columns(
+    cols: Dict[str, "np.ndarray"],
+    cfg: Dict[str, object],
+    duration_s: int,
+    stats_path: str,
+    warmup_s: float = 0,
+) -> Dict[str, object]:
+    if warmup_s > 0:
+        send = cols["send_ms"]
+        known = send != NULL_I64
+        if known.any():
+            keep = known & (send >= send[known].min() + int(warmup_s * 1000))
+            n = len(send)
+            cols = {
+                k: (v[keep] if k not in ("ack_key", "ack_ms") and len(v) == n else v) for k, v in cols.items()
+            }
+    avi_state_ms = int(get_cfg(cfg, "freshness.avi_state_ms", 2000))
+    alarm_deadline = int(get_cfg(cfg, "deadlines.alarm_deadline_ms"))
+    telemetry_deadline = int(get_cfg(cfg, "deadlines.telemetry_deadline_ms"))
 
+    e2e = cols["end_to_end_ms"]
+    e2e_ok = cols["e2e_ok"]
+    is_alarm = cols["is_alarm"]
+    alarm_sorted = np.sort(e2e[e2e_ok & is_alarm])
+    telemetry_sorted = np.sort(e2e[e2e_ok & ~is_alarm])
+    response = cols["response_time_ms"]
+    alarm_response_sorted = np.sort(response[e2e_ok & is_alarm])
+    telemetry_response_sorted = np.sort(response[e2e_ok & ~is_alarm])
+    db_time = cols["db_time_ms"]
+    db_sorted = np.sort(db_time[db_time != NULL_I64])
+    alarm_db_sorted = np.sort(db_time[(db_time != NULL_I64) & is_alarm])
+    sensor = cols["t_sensor_ms"]
+    rx = cols["t_pc_rx_ms"]
+    transport_ok = (sensor != NULL_I64) & (rx != NULL_I64)
+    transport_sorted = np.sort(rx[transport_ok] - sensor[transport_ok])
+
+    def rate(hits: int, total: int) -> Optional[float]:
+        return hits / total if total else None
+
+    def misses(vals: "np.ndarray", deadline: int) -> int:
+        return int(len(vals) - np.searchsorted(vals, deadline, side="right"))
+
+    is_fresh = cols["is_fresh"]
+    fresh_tel = is_fresh[cols["is_telemetry"] & (is_fresh != NULL_I64)]
+    telemetry_shed = int(np.count_nonzero(cols["shed"] & ~is_alarm))
+    state_age = e2e[e2e_ok]
+
+    summary = _summary_from_sorted(
+        len(e2e),
+        _measured_s(duration_s, warmup_s),
+        alarm_sorted,
+        telemetry_sorted,
+        db_sorted,
+        rate(misses(alarm_sorted, alarm_deadline), len(alarm_sorted)),
+        _shed_miss_rate(telemetry_sorted, telemetry_deadline, telemetry_shed),
+        rate(int(np.count_nonzero(fresh_tel == 1)), len(fresh_tel)),
+        rate(int(np.count_nonzero(state_age <= avi_state_ms)), len(state_age)),
+        alarm_response_sorted,
+        telemetry_response_sorted,
+        rate(misses(alarm_response_sorted, alarm_deadline), len(alarm_response_sorted)),
+        _shed_miss_rate(telemetry_response_sorted, telemetry_deadline, telemetry_shed),
+        transport_sorted,
+        alarm_db_sorted,
+    )
+    summary = {k: _py(v) for k, v in summary.items()}
+    summary["telemetry_shed"] = telemetry_shed
+    summary["warmup_s"] = warmup_s
+    _attach_run_stats(summary, stats_path)
     return summary
 
 
@@ -210,22 +627,95 @@ def write_summary(summary: Dict[str, object], results_dir: str) -> None:
         writer.writerow(summary)
 
 
+def _wait_for_port(host: str, port: int, timeout_s: float) -> bool:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def _attach_sensor_stats(summary: Dict[str, object], sensor_stats_path: str) -> None:
+    # Sends the simulator skipped (sensor_sim.max_lag_ms) are offered load
+    # that never existed, so a run that skipped any is not comparable
+    if os.path.exists(sensor_stats_path):
+        with open(sensor_stats_path, "r", encoding="utf-8") as f:
+            stats = json.load(f)
+        summary["sensor_skipped"] = stats.get("skipped")
+        summary["sensor_skipped_alarms"] = stats.get("skipped_alarms")
+
+
+def _run_loopback(
+    cfg: Dict[str, object],
+    collector: str,
+    results_dir: str,
+    duration_s: int,
+    feedback_path: str,
+    sensor_stats_path: str,
+) -> None:
+    # mqtt.transport: loopback. The collector runs on this thread (it installs
+    # the signal handlers) and sensor_sim on a second one, both publishing
+    # and subscribing on the process's loopback bus. They share one GIL, so
+    # this measures pipeline cost without a broker, not a two-process setup.
+    setup_logging("benchmark")
+    opts = {
+        "duration_s": duration_s,
+        "feedback_path": feedback_path,
+        "adaptive": False,
+        "wire_format": None,
+        "arrival": None,
+        "replay": None,
+        "stats_path": sensor_stats_path,
+    }
+
+    def _sensor() -> None:
+        time.sleep(1.0)
+        sensor_sim.run(cfg, opts)
+
+    sensor_thread = threading.Thread(target=_sensor, name="sensor-sim", daemon=True)
+    sensor_thread.start()
+    collector_args = argparse.Namespace(duration_s=duration_s + 2)
+    if collector == "async":
+        asyncio.run(collector_async.run(collector_args, cfg, results_dir))
+    else:
+        collector_main.run(collector_args, cfg, results_dir)
+    sensor_thread.join()
+
+
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", required=True)
     parser.add_argument("--results-dir", required=True)
     parser.add_argument("--duration-s", type=int, default=None)
+    parser.add_argument("--export-csv", action="store_true", help="Also export binary traces to CSV")
+    parser.add_argument(
+        "--warmup-s", type=float, default=None, help="Leave the first seconds out of the summary (benchmark.warmup_s)"
+    )
+    parser.add_argument("--skip-final-trace", action="store_true", help="Do not write trace_final.csv")
+    parser.add_argument(
+        "--collector",
+        choices=("thread", "async"),
+        default="thread",
+        help="Collector runtime: threaded collector_main or asyncio collector_async",
+    )
     args = parser.parse_args()
 
     cfg = load_config(args.config)
     os.makedirs(args.results_dir, exist_ok=True)
 
     duration_s = args.duration_s or int(get_cfg(cfg, "benchmark.duration_s", 30))
+    warmup_s = args.warmup_s if args.warmup_s is not None else float(get_cfg(cfg, "benchmark.warmup_s", 0))
+    transport = get_cfg(cfg, "mqtt.transport", "mqtt")
+    feedback_path = os.path.join(args.results_dir, "feedback.json")
+    sensor_stats_path = os.path.join(args.results_dir, "sensor_stats.json")
 
     collector_cmd = [
         sys.executable,
         "-m",
-        "src.apps.collector_main",
+        "src.apps.collector_async" if args.collector == "async" else "src.apps.collector_main",
         "--config",
         args.config,
         "--results-dir",
@@ -242,27 +732,61 @@ def main() -> int:
         "--duration-s",
         str(duration_s),
         "--feedback-path",
-        os.path.join(args.results_dir, "feedback.json"),
+        feedback_path,
+        "--stats-path",
+        sensor_stats_path,
     ]
 
-    collector_proc = subprocess.Popen(collector_cmd)
-    time.sleep(1.0)
-    sensor_proc = subprocess.Popen(sensor_cmd)
-
-    sensor_proc.wait()
-    try:
-        collector_proc.wait(timeout=duration_s + 5)
-    except subprocess.TimeoutExpired:
-        collector_proc.terminate()
-        collector_proc.wait(timeout=5)
+    if transport == "loopback":
+        _run_loopback(cfg, args.collector, args.results_dir, duration_s, feedback_path, sensor_stats_path)
+    else:
+        broker_proc: Optional[subprocess.Popen] = None
+        if transport == "local":
+            # Stand-in broker on mqtt.host:mqtt.port instead of Mosquitto
+            broker_proc = subprocess.Popen([sys.executable, "-m", "src.comm.local_broker", "--config", args.config])
+            if not _wait_for_port(str(get_cfg(cfg, "mqtt.host")), int(get_cfg(cfg, "mqtt.port")), 10.0):
+                broker_proc.terminate()
+                print("local broker did not start", file=sys.stderr)
+                return 1
+        try:
+            collector_proc = subprocess.Popen(collector_cmd)
+            time.sleep(1.0)
+            sensor_proc = subprocess.Popen(sensor_cmd)
+
+            sensor_proc.wait()
+            try:
+                collector_proc.wait(timeout=duration_s + 5)
+            except subprocess.TimeoutExpired:
+                collector_proc.terminate()
+                collector_proc.wait(timeout=5)
+        finally:
+            if broker_proc is not None:
+                broker_proc.terminate()
+                broker_proc.wait(timeout=5)
 
     events_path = os.path.join(args.results_dir, "trace_events.csv")
     ack_path = os.path.join(args.results_dir, "trace_db_ack.csv")
     final_path = os.path.join(args.results_dir, "trace_final.csv")
 
-    rows = join_trace(events_path, ack_path, final_path)
+    binary = has_binary_trace(args.results_dir)
+    if binary and (args.export_csv or np is None):
+        export_csv(args.results_dir)
 
-    summary = compute_summary(rows, cfg, duration_s, os.path.join(args.results_dir, "run_stats.json"))
+    stats_path = os.path.join(args.results_dir, "run_stats.json")
+    if np is not None:
+        if binary:
+            cols = load_trace_columns_binary(args.results_dir)
+        else:
+            cols = load_trace_columns_csv(events_path, ack_path)
+        cols = join_trace_columns(cols)
+        if not args.skip_final_trace:
+            write_final_columns(cols, final_path)
+        summary = compute_summary_columns(cols, cfg, duration_s, stats_path, warmup_s)
+    else:
+        rows = join_trace(events_path, ack_path, final_path)
+        summary = compute_summary(rows, cfg, duration_s, stats_path, warmup_s)
+    summary["transport"] = transport
+    _attach_sensor_stats(summary, sensor_stats_path)
     write_summary(summary, args.results_dir)
 
     return 0
@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+from typing import Dict, Optional
+
+from src.apps.run_observer import RunObserver, Stats
+from src.common.codec import codec_from_cfg
+from src.common.config import ConfigError, get_cfg, load_config
+from src.common.log import setup_logging
+from src.common.models import Message
+from src.common.time_utils import wall_ms
+from src.common.trace_bin import TraceSinks
+from src.common.wire import wire_from_cfg
+from src.comm.mqtt_async import async_client_from_cfg
+from src.dashboard.consumer import DashboardConsumer
+from src.dashboard.metrics_server import LiveMetrics, MetricsServer
+from src.processing.async_pipeline import AsyncPipeline
+from src.processing.delivery import AsyncDelivery, decode_message
+from src.rtdb.async_backend import AsyncSimBackend, build_async_backend
+
+# Same inputs and outputs as collector_main, but receive, rules and DB writes
+# all run as tasks on one event loop. Only file I/O (trace flush, mock RTDB
+# flush) and blocking SDK calls are handed to executor threads.
+
+
+async def _flush_periodically(interval_s: float, trace_sinks: TraceSinks, backend: object) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval_s)
+        await loop.run_in_executor(None, trace_sinks.flush)
+        await loop.run_in_executor(None, backend.flush)
+
+
+async def run(args: argparse.Namespace, cfg: Dict[str, object], results_dir: str) -> int:
+    logger = logging.getLogger("collector")
+    loop = asyncio.get_running_loop()
+    if bool(get_cfg(cfg, "rtdb.writer.wal.enabled", False)):
+        # AsyncDbWriter has no write-ahead log; running without one would
+        # lose the writes the config asks to keep across a crash
+        raise ConfigError("rtdb.writer.wal is not supported by the async collector; use collector_main")
+
+    trace_sinks = TraceSinks(cfg, results_dir, background=False)
+    backend = build_async_backend(cfg, results_dir)
+
+    live: Optional[LiveMetrics] = None
+    if bool(get_cfg(cfg, "metrics.http.enabled", False)):
+        live = LiveMetrics(cfg)
+
+    write_mode = get_cfg(cfg, "rtdb.write_mode", "sync")
+    codec = codec_from_cfg(cfg)
+    wire = wire_from_cfg(cfg)
+    stats = Stats()
+    observer = RunObserver(cfg, results_dir, trace_sinks.events, live)
+    delivery = AsyncDelivery(
+        cfg,
+        backend,
+        trace_sinks.acks,
+        DashboardConsumer(enabled=True, codec=codec),
+        on_db_time=observer.observe_async_db,
+    )
+
+    async def on_processed(msg: Message) -> None:
+        observer.observe(*await delivery.deliver_async(msg))
+
+    delivery.start()
+    pipeline = AsyncPipeline(cfg, on_processed)
+    pipeline.start()
+
+    metrics_server: Optional[MetricsServer] = None
+    if live:
+        # Gauges are read from the HTTP thread; plain int/len reads are safe
+        for name in pipeline.queue_depths():
+            live.add_gauge("rts_queue_depth", {"stage": "pipeline", "queue": name}, lambda n=name: pipeline.queue_depths()[n])
+        live.add_gauge("rts_dropped_total", {"stage": "pipeline"}, lambda: pipeline.drop_count_telemetry)
+        writer = delivery.writer
+        if writer:
+            for name in writer.queue_depths():
+                live.add_gauge("rts_queue_depth", {"stage": "db", "queue": name}, lambda n=name: writer.queue_depths()[n])
+        live.add_gauge("rts_dropped_total", {"stage": "db"}, lambda: delivery.drop_count_telemetry)
+        metrics_server = MetricsServer(
+            live,
+            str(get_cfg(cfg, "metrics.http.host", "127.0.0.1")),
+            int(get_cfg(cfg, "metrics.http.port", 9108)),
+        )
+        metrics_server.start()
+
+    flush_interval_s = max(1, int(get_cfg(cfg, "trace.flush_interval_ms", 200))) / 1000.0
+    flusher = loop.create_task(_flush_periodically(flush_interval_s, trace_sinks, backend))
+
+    def on_message(topic: str, payload: bytes) -> None:
+        t_pc_rx = wall_ms()
+        msg = decode_message(topic, payload, codec, wire)
+        if msg is None:
+            return
+        stats.received[msg.msg_type] = stats.received.get(msg.msg_type, 0) + 1
+        if live:
+            live.observe_received(msg.msg_type)
+        msg.t_pc_rx_ms = t_pc_rx
+        pipeline.enqueue(msg)
+
+    mqtt_client = async_client_from_cfg(cfg)
+    mqtt_client.set_message_handler(on_message)
+
+    stop_event = asyncio.Event()
+    try:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop_event.set)
+    except NotImplementedError:
+        # Windows event loops have no add_signal_handler
+        def _handle_stop(signum: int, frame: object) -> None:
+            loop.call_soon_threadsafe(stop_event.set)
+
+        signal.signal(signal.SIGINT, _handle_stop)
+        signal.signal(signal.SIGTERM, _handle_stop)
+
+    try:
+        await mqtt_client.connect()
+        mqtt_client.subscribe(get_cfg(cfg, "mqtt.alert_topic"), qos=1)
+        mqtt_client.subscribe(get_cfg(cfg, "mqtt.telemetry_topic"), qos=0)
+        mqtt_client.subscribe(get_cfg(cfg, "mqtt.status_topic"), qos=0)
+
+        logger.info("Async collector running. Press Ctrl+C to stop.")
+        try:
+            await asyncio.wait_for(stop_event.wait(), args.duration_s)
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        logger.info("Shutting down collector")
+        await mqtt_client.disconnect()
+        if metrics_server:
+            metrics_server.stop()
+        await pipeline.stop()
+        await delivery.drain()
+        flusher.cancel()
+        await backend.close()
+        trace_sinks.close()
+        stats.dropped_pipeline = pipeline.drop_count_telemetry
+        stats.shed_pipeline = pipeline.shed_count
+        stats.pipeline_workers = pipeline.workers
+        stats.pipeline_shards = pipeline.shard_stats()
+        stats.queue_max_pipeline = pipeline.queue_max_observed
+        stats.dropped_db = delivery.drop_count_telemetry
+        stats.db_errors = delivery.error_count + (delivery.writer.error_count if delivery.writer else 0)
+        if delivery.async_hedger:
+            stats.hedge = delivery.async_hedger.policy.stats()
+        if isinstance(backend, AsyncSimBackend):
+            stats.rtdb_sim = backend.model.stats()
+        stats.queue_max_db = delivery.pending_max_observed
+        state_stats = delivery.state_cache.stats()
+        stats.state_writes = state_stats["written"]
+        stats.state_writes_suppressed = state_stats["suppressed"]
+        with open(os.path.join(results_dir, "run_stats.json"), "w", encoding="utf-8") as f:
+            json.dump(stats.to_dict(), f, indent=2)
+        db_time = observer.db_time_async if write_mode == "async" else observer.db_time_sync
+        observer.write_sketches(results_dir, db_time)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", required=True)
+    parser.add_argument("--results-dir", default=None)
+    parser.add_argument("--duration-s", type=int, default=None)
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    results_dir = args.results_dir or os.path.join("results", "run")
+    os.makedirs(results_dir, exist_ok=True)
+
+    setup_logging("collector")
+
+    if sys.platform == "win32":
+        # paho's socket is driven with add_reader/add_writer, which the
+        # default Proactor loop does not support
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    return asyncio.run(run(args, cfg, results_dir))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
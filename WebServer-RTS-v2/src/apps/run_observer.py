@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.common.config import get_cfg
+from src.common.metrics import LatencySketch, SketchSet
+from src.common.models import TraceEvent
+from src.dashboard.metrics_server import LiveMetrics
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.received = {"alarm": 0, "telemetry": 0, "status": 0}
+        self.dropped_pipeline = 0
+        # pipeline.mode: process only; alarms that found their ring full
+        self.dropped_alarm = 0
+        self.shed_pipeline = 0
+        self.dropped_db = 0
+        self.db_errors = 0
+        self.queue_max_pipeline = 0
+        self.queue_max_db = 0
+        self.state_writes = 0
+        self.state_writes_suppressed = 0
+        self.pipeline_workers = 1
+        self.pipeline_shards: List[Dict[str, object]] = []
+        # rtdb.mode: sim only; see RtdbSimModel.stats
+        self.rtdb_sim: Optional[Dict[str, int]] = None
+        # rtdb.writer.wal.enabled only; see DbWriter.wal_stats
+        self.wal: Optional[Dict[str, int]] = None
+        # rtdb.alarm_write.strategy: hedged only; see HedgePolicy.stats
+        self.hedge: Optional[Dict[str, object]] = None
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "received": self.received,
+            "dropped_pipeline": self.dropped_pipeline,
+            "dropped_alarm": self.dropped_alarm,
+            "shed_pipeline": self.shed_pipeline,
+            "dropped_db": self.dropped_db,
+            "db_errors": self.db_errors,
+            "queue_max_pipeline": self.queue_max_pipeline,
+            "queue_max_db": self.queue_max_db,
+            "state_writes": self.state_writes,
+            "state_writes_suppressed": self.state_writes_suppressed,
+            "pipeline_workers": self.pipeline_workers,
+            "pipeline_shards": self.pipeline_shards,
+            "rtdb_sim": self.rtdb_sim,
+            "wal": self.wal,
+            "hedge": self.hedge,
+        }
+
+
+class RunObserver:
+    # Per-message bookkeeping shared by the threaded and asyncio collectors:
+    # trace row, latency sketches, live metrics and the freshness feedback
+    # file read by the simulator. Safe to call from several pipeline workers.
+
+    def __init__(self, cfg: Dict[str, object], results_dir: str, trace_writer: object, live: Optional[LiveMetrics]) -> None:
+        self._trace_writer = trace_writer
+        self._live = live
+
+        sketch_alpha = float(get_cfg(cfg, "metrics.sketch_alpha", 0.01))
+        deadlines = (
+            int(get_cfg(cfg, "deadlines.alarm_deadline_ms")),
+            int(get_cfg(cfg, "deadlines.telemetry_deadline_ms")),
+        )
+        self.e2e_by_type = SketchSet(sketch_alpha, deadlines=deadlines)
+        self.e2e_by_device = SketchSet(sketch_alpha, deadlines=deadlines)
+        self.db_time_sync = LatencySketch(sketch_alpha)
+        self.db_time_async = LatencySketch(sketch_alpha)
+        self._sketch_lock = threading.Lock()
+
+        self._feedback_enabled = bool(get_cfg(cfg, "feedback.enabled", True))
+        self._feedback_interval_s = int(get_cfg(cfg, "feedback.interval_s", 5))
+        self._feedback_min_ratio = float(get_cfg(cfg, "feedback.min_freshness_ratio", 0.8))
+        self._feedback_rate_scale = float(get_cfg(cfg, "feedback.rate_scale", 0.5))
+        self._feedback_path = os.path.join(results_dir, "feedback.json")
+        self._feedback_lock = threading.Lock()
+        self._feedback_last_ts = time.monotonic()
+        self._telemetry_fresh = 0
+        self._telemetry_total = 0
+
+    def observe(self, trace: TraceEvent, db_time_ms: Optional[int]) -> None:
+        msg_type = trace.msg_type
+        t_dashboard_emit_ms = trace.t_dashboard_emit_ms
+
+        self._trace_writer.write_event(trace)
+
+        ts_base = trace.t_sensor_ms or trace.t_pc_rx_ms
+        # Shed messages have no emit time: no latency, and they count as stale
+        e2e_ms = t_dashboard_emit_ms - ts_base if t_dashboard_emit_ms is not None else None
+        if e2e_ms is not None:
+            # observe runs on every pipeline worker, so shared aggregates are locked
+            with self._sketch_lock:
+                self.e2e_by_type.add(msg_type, e2e_ms)
+                self.e2e_by_device.add(trace.device_id, e2e_ms)
+                if db_time_ms is not None:
+                    self.db_time_sync.add(db_time_ms)
+            if self._live:
+                if db_time_ms is not None:
+                    self._live.observe_db(db_time_ms)
+                self._live.observe_processed(msg_type, e2e_ms)
+
+        if self._feedback_enabled and msg_type == "telemetry":
+            self._observe_freshness(e2e_ms is not None and e2e_ms <= trace.avi_ms)
+
+    def observe_async_db(self, db_time_ms: int) -> None:
+        # DB times of writes acknowledged after the message's trace was written
+        with self._sketch_lock:
+            self.db_time_async.add(db_time_ms)
+        if self._live:
+            self._live.observe_db(db_time_ms)
+
+    def _observe_freshness(self, fresh: bool) -> None:
+        with self._feedback_lock:
+            if fresh:
+                self._telemetry_fresh += 1
+            self._telemetry_total += 1
+
+            if (time.monotonic() - self._feedback_last_ts) >= self._feedback_interval_s:
+                total = self._telemetry_total
+                ratio = self._telemetry_fresh / total if total > 0 else 1.0
+                scale = self._feedback_rate_scale if ratio < self._feedback_min_ratio else 1.0
+                payload = {
+                    "freshness_ratio_telemetry": round(ratio, 3),
+                    "telemetry_rate_scale": scale,
+                }
+                with open(self._feedback_path, "w", encoding="utf-8") as f:
+                    json.dump(payload, f, indent=2)
+                self._telemetry_fresh = 0
+                self._telemetry_total = 0
+                self._feedback_last_ts = time.monotonic()
+
+    def write_sketches(self, results_dir: str, db_time: LatencySketch) -> None:
+        sketches = {
+            "e2e_by_type": self.e2e_by_type.to_dict(),
+            "e2e_by_device": self.e2e_by_device.to_dict(),
+            "db_time": db_time.to_dict(),
+        }
+        with open(os.path.join(results_dir, "latency_sketches.json"), "w", encoding="utf-8") as f:
+            json.dump(sketches, f)
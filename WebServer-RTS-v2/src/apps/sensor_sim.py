@@ -1,15 +1,35 @@
 import argparse
+import heapq
 import json
 import logging
+import multiprocessing as mp
 import random
 import time
 import uuid
-from typing import Dict, List
+from typing import Any, Dict, List, Optional
 
+from src.apps.arrivals import (
+    ARRIVAL_MODELS,
+    ReplayRecord,
+    ReplaySchedule,
+    fire_spread_from_cfg,
+    load_replay,
+    profile_from_cfg,
+)
+from src.apps.sim_scheduler import DeviceScheduler, LatenessStats, perf_ms
+from src.common.codec import codec_from_cfg
 from src.common.config import get_cfg, load_config
 from src.common.log import setup_logging
-from src.common.time_utils import monotonic_ms, wall_ms
-from src.comm.mqtt_client import MqttClient
+from src.common.time_utils import wall_ms
+from src.common.wire import wire_from_cfg
+from src.comm.mqtt_client import client_from_cfg
+
+# Longest sleep between scheduler wakeups, so burst edges and feedback
+# changes are picked up promptly even when the next send is far away
+_MAX_SLEEP_MS = 10.0
+# Relative rate change below which pending send times are not rescaled
+# (diurnal rates change a little on every wakeup)
+_RATE_TOLERANCE = 0.01
 
 
 def _build_values(alarm: bool) -> Dict[str, float]:
@@ -28,61 +48,143 @@ def _build_values(alarm: bool) -> Dict[str, float]:
     }
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--config", required=True)
-    parser.add_argument("--duration-s", type=int, default=None)
-    parser.add_argument("--feedback-path", default=None)
-    parser.add_argument("--adaptive", action="store_true")
-    args = parser.parse_args()
-
-    cfg = load_config(args.config)
+def _run_shard(
+    cfg: Dict[str, Any],
+    opts: Dict[str, Any],
+    shard: int,
+    shards: int,
+    barrier: Optional[Any] = None,
+    results: Optional[Any] = None,
+) -> Dict[str, float]:
+    # One MQTT connection publishing for the devices whose global index is
+    # shard (mod shards); every shard covers the whole run duration
     setup_logging("sensor_sim")
     logger = logging.getLogger("sensor_sim")
 
-    duration_s = args.duration_s or int(get_cfg(cfg, "benchmark.duration_s", 30))
-
+    duration_s = opts["duration_s"]
     device_count = int(get_cfg(cfg, "sensor_sim.device_count", 1))
     prefix = str(get_cfg(cfg, "sensor_sim.device_id_prefix", "esp32-"))
     device_ids: List[str] = [f"{prefix}{i + 1:02d}" for i in range(device_count)]
+    shard_devices = list(range(shard, device_count, shards))
 
-    telemetry_rate = float(get_cfg(cfg, "sensor_sim.telemetry_rate", 50))
+    model = opts["arrival"] or str(get_cfg(cfg, "sensor_sim.arrival.model", "constant"))
+    seed = int(get_cfg(cfg, "sensor_sim.arrival.seed", 1))
+    profile = profile_from_cfg(cfg, model)
     alarm_rate = float(get_cfg(cfg, "sensor_sim.alarm_rate", 0.2))
-    burst_rate = float(get_cfg(cfg, "sensor_sim.burst_rate", telemetry_rate))
-    burst_duration_s = float(get_cfg(cfg, "sensor_sim.burst_duration_s", 0))
-    burst_start_s = float(get_cfg(cfg, "sensor_sim.burst_start_s", 0))
-
-    mqtt_client = MqttClient(
-        host=get_cfg(cfg, "mqtt.host"),
-        port=int(get_cfg(cfg, "mqtt.port")),
-        keepalive_s=int(get_cfg(cfg, "mqtt.keepalive_s")),
-    )
+    max_lag_ms = float(get_cfg(cfg, "sensor_sim.max_lag_ms", 0))
+    # Replay reproduces the recorded traffic, alarms included
+    replay_records: List[ReplayRecord] = []
+    if model == "replay":
+        replay_path = opts["replay"] or str(get_cfg(cfg, "sensor_sim.arrival.replay.path", ""))
+        replay_speed = float(get_cfg(cfg, "sensor_sim.arrival.replay.speed", 1.0))
+        replay_records = load_replay(replay_path, shard, shards, replay_speed)
+        alarm_rate = 0.0
+    fire = fire_spread_from_cfg(cfg, device_count) if model != "replay" else None
+
+    mqtt_client = client_from_cfg(cfg, codec=codec_from_cfg(cfg))
     mqtt_client.connect()
 
+    # Alarms stay JSON; binary telemetry uses the compact struct in common.wire
+    wire_format = opts["wire_format"] or str(get_cfg(cfg, "sensor_sim.wire_format", "json"))
+    wire = wire_from_cfg(cfg)
+
     telemetry_topic = get_cfg(cfg, "mqtt.telemetry_topic")
     alert_topic = get_cfg(cfg, "mqtt.alert_topic")
 
-    seq_by_device: Dict[str, int] = {d: 0 for d in device_ids}
+    seq_by_device: Dict[str, int] = {}
+    # Maps scheduled perf_ms() times to wall ms; set when the run starts
+    wall_offset_ms = 0.0
+
+    # Every message carries both when it was meant to be sent (t_intended_ms,
+    # from the schedule) and when it was (t_sensor_ms). Latency measured
+    # from the intended time includes the simulator's own queueing, so a
+    # stalled sender cannot hide latency (coordinated omission).
+    def publish_telemetry(
+        device_id: str, wire_index: Optional[int], values: Dict[str, float], t_sched_ms: float
+    ) -> None:
+        seq = seq_by_device[device_id] = seq_by_device.get(device_id, 0) + 1
+        t_intended_ms = int(t_sched_ms + wall_offset_ms)
+        if wire_format == "binary" and wire_index is not None:
+            payload: Any = wire.encode(wire_index, seq, wall_ms(), values, t_intended_ms)
+        else:
+            payload = {
+                "msg_id": str(uuid.uuid4()),
+                "device_id": device_id,
+                "type": "telemetry",
+                "t_sensor_ms": wall_ms(),
+                "t_intended_ms": t_intended_ms,
+                "seq": seq,
+                "values": values,
+            }
+        mqtt_client.publish(telemetry_topic, payload, qos=0)
 
-    adaptive_enabled = args.adaptive or bool(get_cfg(cfg, "sensor_sim.adaptive", False))
-    feedback_path = args.feedback_path
-    feedback_check_ms = 1000
+    def publish_alarm(
+        device_id: str, values: Dict[str, float], t_sched_ms: float, alarm: Optional[Dict[str, Any]] = None
+    ) -> None:
+        seq = seq_by_device[device_id] = seq_by_device.get(device_id, 0) + 1
+        payload = {
+            "msg_id": str(uuid.uuid4()),
+            "device_id": device_id,
+            "type": "alarm",
+            "t_sensor_ms": wall_ms(),
+            "t_intended_ms": int(t_sched_ms + wall_offset_ms),
+            "seq": seq,
+            "values": values,
+            "alarm": alarm or {"fire_detected": True, "level": "ALARM"},
+        }
+        mqtt_client.publish(alert_topic, payload, qos=1)
+
+    adaptive_enabled = opts["adaptive"] or bool(get_cfg(cfg, "sensor_sim.adaptive", False))
+    feedback_path = opts["feedback_path"]
+    feedback_check_ms = 1000.0
     rate_scale = 1.0
 
-    start_ms = monotonic_ms()
-    next_telemetry_ms = start_ms
-    next_alarm_ms = start_ms
-    alarm_period_ms = max(1, int(1000 / alarm_rate)) if alarm_rate > 0 else None
+    if barrier is not None:
+        # Start all shards together once their connections are up; a shard
+        # that failed to connect breaks the barrier instead of hanging the rest
+        barrier.wait(timeout=30)
+
+    start_ms = perf_ms()
+    wall_offset_ms = time.time() * 1000.0 - start_ms
+    end_ms = start_ms + duration_s * 1000.0
+    replay: Optional[ReplaySchedule] = None
+    scheduler: Optional[DeviceScheduler] = None
+    if model == "replay":
+        replay = ReplaySchedule(replay_records, start_ms)
+    else:
+        rng = random.Random(seed * 1000003 + shard) if model != "constant" else None
+        scheduler = DeviceScheduler(
+            shard_devices, device_count, max(0.1, profile.rate_at(0.0)), start_ms, max_lag_ms, rng
+        )
+    # Alarms run on their own absolute timeline; shards split the rate
+    alarm_period_ms = shards * 1000.0 / alarm_rate if alarm_rate > 0 and shard_devices else None
+    next_alarm_ms = start_ms + shard * 1000.0 / alarm_rate if alarm_period_ms is not None else float("inf")
+    fire_alarms = fire.alarm_schedule(shard_devices, start_ms) if fire is not None else []
     next_feedback_ms = start_ms + feedback_check_ms
+    replay_wire_index: Dict[str, Optional[int]] = {}
 
-    telemetry_index = 0
+    lateness = LatenessStats()
+    alarms_sent = 0
+    alarms_skipped = 0
+    stopped_ms = end_ms
 
-    logger.info("Sensor simulator running for %s seconds", duration_s)
+    logger.info(
+        "Sensor simulator shard %s/%s running %s for %s seconds (%s arrivals%s)",
+        shard + 1,
+        shards,
+        f"{len(replay_records)} recorded messages" if replay is not None else f"{len(shard_devices)} devices",
+        duration_s,
+        model,
+        f", fire spreading to {len(fire.ignition_ms)} devices" if fire is not None else "",
+    )
 
     try:
-        while (monotonic_ms() - start_ms) < duration_s * 1000:
-            now_ms = monotonic_ms()
-            elapsed_s = (now_ms - start_ms) / 1000.0
+        while True:
+            now_ms = perf_ms()
+            if now_ms >= end_ms or (replay is not None and not replay):
+                stopped_ms = now_ms
+                break
+            elapsed_ms = now_ms - start_ms
 
             if adaptive_enabled and feedback_path and now_ms >= next_feedback_ms:
                 try:
@@ -91,51 +193,173 @@ def main() -> int:
                     rate_scale = float(data.get("telemetry_rate_scale", 1.0))
                 except Exception:
                     pass
-                next_feedback_ms = now_ms + feedback_check_ms
-
-            current_rate = telemetry_rate
-            if burst_duration_s > 0 and burst_start_s <= elapsed_s < (burst_start_s + burst_duration_s):
-                current_rate = burst_rate
-            current_rate = max(0.1, current_rate * rate_scale)
-
-            telemetry_period_ms = max(1, int(1000 / current_rate)) if current_rate > 0 else 1000
-
-            if now_ms >= next_telemetry_ms:
-                device_id = device_ids[telemetry_index % len(device_ids)]
-                seq_by_device[device_id] += 1
-                payload = {
-                    "msg_id": str(uuid.uuid4()),
-                    "device_id": device_id,
-                    "type": "telemetry",
-                    "t_sensor_ms": wall_ms(),
-                    "seq": seq_by_device[device_id],
-                    "values": _build_values(alarm=False),
-                }
-                mqtt_client.publish(telemetry_topic, payload, qos=0)
-                telemetry_index += 1
-                next_telemetry_ms = now_ms + telemetry_period_ms
+                next_feedback_ms += feedback_check_ms
+
+            if scheduler is not None:
+                current_rate = max(0.1, profile.rate_at(elapsed_ms / 1000.0) * rate_scale)
+                scheduler.set_rate(current_rate, now_ms, _RATE_TOLERANCE)
+                for device_index, t_sched_ms in scheduler.due(now_ms):
+                    on_fire = fire is not None and fire.burning(device_index, t_sched_ms - start_ms)
+                    publish_telemetry(
+                        device_ids[device_index], device_index + 1, _build_values(alarm=on_fire), t_sched_ms
+                    )
+                    lateness.add(perf_ms() - t_sched_ms)
+            else:
+                for record, t_sched_ms in replay.due(now_ms):
+                    if record.msg_type == "alarm":
+                        publish_alarm(
+                            record.device_id, record.values or _build_values(alarm=True), t_sched_ms, record.alarm
+                        )
+                        alarms_sent += 1
+                        continue
+                    wire_index = replay_wire_index.get(record.device_id, -1)
+                    if wire_index == -1:
+                        try:
+                            wire_index = wire.device_index(record.device_id)
+                        except ValueError:
+                            wire_index = None
+                        replay_wire_index[record.device_id] = wire_index
+                    publish_telemetry(
+                        record.device_id, wire_index, record.values or _build_values(alarm=False), t_sched_ms
+                    )
+                    lateness.add(perf_ms() - t_sched_ms)
 
             if alarm_period_ms is not None and now_ms >= next_alarm_ms:
-                device_id = random.choice(device_ids)
-                seq_by_device[device_id] += 1
-                payload = {
-                    "msg_id": str(uuid.uuid4()),
-                    "device_id": device_id,
-                    "type": "alarm",
-                    "t_sensor_ms": wall_ms(),
-                    "seq": seq_by_device[device_id],
-                    "values": _build_values(alarm=True),
-                    "alarm": {"fire_detected": True, "level": "ALARM"},
-                }
-                mqtt_client.publish(alert_topic, payload, qos=1)
-                next_alarm_ms = now_ms + alarm_period_ms
-
-            time.sleep(0.001)
+                publish_alarm(device_ids[random.choice(shard_devices)], _build_values(alarm=True), next_alarm_ms)
+                alarms_sent += 1
+                next_alarm_ms += alarm_period_ms
+                if 0 < max_lag_ms < now_ms - next_alarm_ms:
+                    # The alarm just sent carried the oldest missed slot
+                    missed = int((now_ms - next_alarm_ms) // alarm_period_ms) + 1
+                    alarms_skipped += missed
+                    next_alarm_ms += missed * alarm_period_ms
+
+            while fire_alarms and fire_alarms[0][0] <= now_ms:
+                t_alarm_ms, device_index = fire_alarms[0]
+                publish_alarm(device_ids[device_index], _build_values(alarm=True), t_alarm_ms)
+                alarms_sent += 1
+                heapq.heapreplace(fire_alarms, (t_alarm_ms + fire.alarm_repeat_ms, device_index))
+
+            wake_ms = min(
+                scheduler.next_ms() if scheduler is not None else replay.next_ms(),
+                next_alarm_ms,
+                fire_alarms[0][0] if fire_alarms else end_ms,
+                end_ms,
+                now_ms + _MAX_SLEEP_MS,
+            )
+            delay_ms = wake_ms - perf_ms()
+            if delay_ms > 0:
+                time.sleep(delay_ms / 1000.0)
     finally:
         mqtt_client.disconnect()
-        logger.info("Sensor simulator stopped")
 
-    return 0
+    stats = lateness.to_dict()
+    stats["skipped"] = scheduler.skipped if scheduler is not None else 0
+    stats["alarms"] = alarms_sent
+    stats["skipped_alarms"] = alarms_skipped
+    stats["duration_s"] = (stopped_ms - start_ms) / 1000.0
+    if results is not None:
+        results.put((shard, stats))
+    return stats
+
+
+def _merge_stats(stats: List[Dict[str, float]]) -> Dict[str, float]:
+    sent = sum(s["sent"] for s in stats)
+    return {
+        "sent": sent,
+        "alarms": sum(s["alarms"] for s in stats),
+        "skipped": sum(s["skipped"] for s in stats),
+        "skipped_alarms": sum(s["skipped_alarms"] for s in stats),
+        "rate": sent / max(s["duration_s"] for s in stats) if stats else 0.0,
+        "lateness_mean_ms": sum(s["lateness_mean_ms"] * s["sent"] for s in stats) / sent if sent else 0.0,
+        "lateness_max_ms": max((s["lateness_max_ms"] for s in stats), default=0.0),
+        "late_over_1ms": sum(s["late_over_1ms"] for s in stats),
+    }
+
+
+def run(cfg: Dict[str, Any], opts: Dict[str, Any], shards: int = 1) -> int:
+    logger = logging.getLogger("sensor_sim")
+    if shards > 1 and get_cfg(cfg, "mqtt.transport", "mqtt") == "loopback":
+        # Other processes cannot reach this process's loopback bus
+        logger.warning("mqtt.transport loopback publishes from one process; ignoring processes=%s", shards)
+        shards = 1
+
+    failed = 0
+    if shards == 1:
+        stats = [_run_shard(cfg, opts, 0, 1)]
+    else:
+        ctx = mp.get_context("spawn")
+        barrier = ctx.Barrier(shards)
+        results = ctx.Queue()
+        procs = [
+            ctx.Process(
+                target=_run_shard,
+                args=(cfg, opts, i, shards, barrier, results),
+                name=f"sensor-sim-{i}",
+                daemon=True,
+            )
+            for i in range(shards)
+        ]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+            if proc.exitcode != 0:
+                logger.warning("Sensor simulator shard %s exited with code %s", proc.name, proc.exitcode)
+                failed += 1
+        stats = [results.get(timeout=5)[1] for proc in procs if proc.exitcode == 0]
+
+    summary = _merge_stats(stats)
+    if opts.get("stats_path"):
+        # Read by benchmark_run for summary.json
+        with open(opts["stats_path"], "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    logger.info(
+        "Sensor simulator stopped: %s telemetry (%.0f msg/s), %s alarms, %s skipped slots (%s alarms),"
+        " send lateness mean %.3f ms max %.1f ms, %s sends >1 ms late",
+        summary["sent"],
+        summary["rate"],
+        summary["alarms"],
+        summary["skipped"],
+        summary["skipped_alarms"],
+        summary["lateness_mean_ms"],
+        summary["lateness_max_ms"],
+        summary["late_over_1ms"],
+    )
+    return 1 if failed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", required=True)
+    parser.add_argument("--duration-s", type=int, default=None)
+    parser.add_argument("--feedback-path", default=None)
+    parser.add_argument("--adaptive", action="store_true")
+    parser.add_argument("--wire-format", choices=("json", "binary"), default=None, help="Telemetry payload format")
+    parser.add_argument("--arrival", choices=ARRIVAL_MODELS, default=None, help="Arrival model")
+    parser.add_argument("--replay", default=None, help="trace_events.csv or MQTT capture (JSON lines) to replay")
+    parser.add_argument("--processes", type=int, default=None, help="Publisher processes (one MQTT connection each)")
+    parser.add_argument("--stats-path", default=None, help="Write the send statistics (JSON) here")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    setup_logging("sensor_sim")
+
+    opts = {
+        "duration_s": args.duration_s or int(get_cfg(cfg, "benchmark.duration_s", 30)),
+        "feedback_path": args.feedback_path,
+        "adaptive": args.adaptive,
+        "wire_format": args.wire_format,
+        "arrival": args.arrival,
+        "replay": args.replay,
+        "stats_path": args.stats_path,
+    }
+    model = args.arrival or str(get_cfg(cfg, "sensor_sim.arrival.model", "constant"))
+    if model == "replay" and not (args.replay or get_cfg(cfg, "sensor_sim.arrival.replay.path", "")):
+        parser.error("replay arrivals need --replay or sensor_sim.arrival.replay.path")
+    device_count = int(get_cfg(cfg, "sensor_sim.device_count", 1))
+    shards = max(1, min(device_count, args.processes or int(get_cfg(cfg, "sensor_sim.processes", 1))))
+    return run(cfg, opts, shards)
 
 
 if __name__ == "__main__":
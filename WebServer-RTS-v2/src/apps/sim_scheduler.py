@@ -0,0 +1,107 @@
+import heapq
+import random
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+def perf_ms() -> float:
+    # Sub-millisecond monotonic clock for scheduling sends
+    return time.perf_counter() * 1000.0
+
+
+class DeviceScheduler:
+    # Absolute timeline of next-fire times for a set of virtual devices.
+    # `rate` is the aggregate telemetry rate of all `total_devices` (so each
+    # device fires every total_devices / rate s), and devices are phased by
+    # their global index so shards owning disjoint device sets interleave
+    # into one evenly spaced stream. The next fire time is the previous
+    # *scheduled* time plus the period, so lateness never accumulates; after
+    # a stall, overdue sends are emitted back to back until the schedule has
+    # caught up. With max_lag_ms > 0 a device further behind than that sends
+    # once, stamped with its oldest missed slot, and skips the rest (counted
+    # in `skipped`); 0 never skips, so offered load is kept and the stall
+    # shows up in response times. With an rng, intervals are
+    # exponential with the same mean, making each device (and so the
+    # aggregate stream) a Poisson process.
+    def __init__(
+        self,
+        devices: Sequence[int],
+        total_devices: int,
+        rate: float,
+        start_ms: float,
+        max_lag_ms: float = 0.0,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.total_devices = max(1, total_devices)
+        self.max_lag_ms = max_lag_ms
+        self.rate = rate
+        self.period_ms = self.total_devices * 1000.0 / rate
+        self._rng = rng
+        if rng is None:
+            step_ms = 1000.0 / rate
+            self._heap: List[Tuple[float, int]] = [(start_ms + g * step_ms, g) for g in devices]
+        else:
+            self._heap = [(start_ms + rng.expovariate(1.0 / self.period_ms), g) for g in devices]
+        heapq.heapify(self._heap)
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def next_ms(self) -> float:
+        return self._heap[0][0] if self._heap else float("inf")
+
+    def set_rate(self, rate: float, now_ms: float, tolerance: float = 0.0) -> None:
+        # Rescale the pending part of every device's period, so a burst takes
+        # effect immediately instead of after one old period. The transform
+        # is monotonic, so the heap order is unchanged (and for exponential
+        # intervals, memoryless). Changes within `tolerance` (relative) are
+        # ignored, so a smoothly varying rate does not rescale on every wake.
+        if abs(rate - self.rate) <= self.rate * tolerance:
+            return
+        scale = self.rate / rate
+        self._heap = [(t if t <= now_ms else now_ms + (t - now_ms) * scale, g) for t, g in self._heap]
+        self.rate = rate
+        self.period_ms = self.total_devices * 1000.0 / rate
+
+    def due(self, now_ms: float) -> Iterator[Tuple[int, float]]:
+        # Yields (global device index, scheduled ms) for every send due at
+        # now_ms, in schedule order
+        heap = self._heap
+        while heap and heap[0][0] <= now_ms:
+            t, g = heap[0]
+            period = self.period_ms
+            interval = period if self._rng is None else self._rng.expovariate(1.0 / period)
+            next_t = t + interval
+            lag = now_ms - t
+            if 0 < self.max_lag_ms < lag:
+                missed = int(lag // period)
+                self.skipped += missed
+                next_t += missed * period
+            heapq.heapreplace(heap, (next_t, g))
+            yield g, t
+
+
+class LatenessStats:
+    # Send lateness (actual - scheduled) in ms
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.late_1ms = 0
+
+    def add(self, lateness_ms: float) -> None:
+        self.count += 1
+        self.total_ms += lateness_ms
+        if lateness_ms > self.max_ms:
+            self.max_ms = lateness_ms
+        if lateness_ms > 1.0:
+            self.late_1ms += 1
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "sent": self.count,
+            "lateness_mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "lateness_max_ms": self.max_ms,
+            "late_over_1ms": self.late_1ms,
+        }
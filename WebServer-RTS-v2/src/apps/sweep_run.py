@@ -0,0 +1,344 @@
+import argparse
+import csv
+import itertools
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import yaml
+
+from src.common.config import ConfigError, get_cfg, load_config, set_cfg, validate_config
+from src.common.log import setup_logging
+
+# Runs benchmark_run over a matrix of config overrides, with repetitions,
+# and aggregates every point into one table (mean and 95% confidence
+# interval per metric). Each run gets its own directory holding the exact
+# config it used.
+#
+#   python -m src.apps.sweep_run --config configs/baseline.yaml --config configs/improved.yaml \
+#       --set sensor_sim.telemetry_rate=100,400,1600 --set rtdb.writer.batch_limit=50,200 \
+#       --reps 3 --duration-s 30 --warmup-s 5 --results-dir results/sweep
+#
+#   python -m src.apps.sweep_run --matrix sweep.yaml
+#
+# A matrix file has the same fields:
+#
+#   configs: [configs/baseline.yaml, configs/improved.yaml]
+#   matrix:
+#     rtdb.writer.telemetry_drop_policy: [none, keep_latest]
+#     rtdb.mock.ack_delay_ms: [20, 80]
+#   reps: 3
+#   duration_s: 30
+#   warmup_s: 5
+#   find_max_rate: false
+#
+# With --find-max-rate, each point instead searches for the highest
+# sensor_sim.telemetry_rate that is sustainable: in every repetition the
+# alarm deadline miss rate (on response time) is at most --max-alarm-miss
+# and the collector keeps up with --min-throughput of the offered rate. The
+# rate doubles until a probe fails, then is bisected --rate-steps times.
+# Bursts and adaptive rate are switched off for the search unless the
+# matrix sets them.
+
+SWEEP_METRICS = [
+    "throughput_msg_s",
+    "alarm_p99_ms",
+    "alarm_response_p99_ms",
+    "alarm_deadline_miss_rate",
+    "alarm_response_deadline_miss_rate",
+    "telemetry_p99_ms",
+    "telemetry_response_p99_ms",
+    "telemetry_response_deadline_miss_rate",
+    "transport_p99_ms",
+    "db_time_p99_ms",
+    "alarm_db_time_p99_ms",
+    "freshness_ratio_state",
+    "dropped_pipeline",
+    "dropped_db",
+]
+
+RATE_KEY = "sensor_sim.telemetry_rate"
+
+# Two-sided 95% Student t critical values by degrees of freedom; between
+# listed values the next lower df is used, which errs on the wide side
+_T95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+    9: 2.262, 10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042,
+}
+
+
+def _t95(df: int) -> float:
+    if df > 30:
+        return 1.96
+    return _T95[max(k for k in _T95 if k <= df)]
+
+
+def mean_ci(values: Sequence[float]) -> Tuple[Optional[float], Optional[float]]:
+    # Mean and half-width of its 95% confidence interval (None for n < 2)
+    n = len(values)
+    if n == 0:
+        return None, None
+    mean = sum(values) / n
+    if n < 2:
+        return mean, None
+    var = sum((v - mean) ** 2 for v in values) / (n - 1)
+    return mean, _t95(n - 1) * math.sqrt(var / n)
+
+
+def parse_axis(spec: str) -> Tuple[str, List[Any]]:
+    # "dotted.key=v1,v2,..."; values are parsed as YAML scalars
+    if "=" not in spec:
+        raise ValueError(f"Expected key=v1,v2,... but got {spec!r}")
+    key, _, values = spec.partition("=")
+    return key.strip(), [yaml.safe_load(v) for v in values.split(",")]
+
+
+def build_points(configs: List[str], axes: Dict[str, List[Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+    keys = list(axes)
+    return [
+        (config, dict(zip(keys, combo)))
+        for config in configs
+        for combo in itertools.product(*(axes[k] for k in keys))
+    ]
+
+
+def point_config(config_path: str, overrides: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = load_config(config_path)
+    for key, value in overrides.items():
+        set_cfg(cfg, key, value)
+    return validate_config(cfg)
+
+
+class SweepRunner:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.results_dir = args.results_dir
+        self.reps = args.reps
+        self._logger = logging.getLogger("sweep")
+        self.runs = 0
+
+    def run_once(self, cfg: Dict[str, Any], run_dir: str) -> Optional[Dict[str, Any]]:
+        os.makedirs(run_dir, exist_ok=True)
+        config_path = os.path.join(run_dir, "config.yaml")
+        with open(config_path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(cfg, f, sort_keys=False)
+        cmd = [
+            sys.executable,
+            "-m",
+            "src.apps.benchmark_run",
+            "--config",
+            config_path,
+            "--results-dir",
+            run_dir,
+            "--collector",
+            self.args.collector,
+            "--skip-final-trace",
+        ]
+        if self.args.duration_s:
+            cmd += ["--duration-s", str(self.args.duration_s)]
+        if self.args.warmup_s is not None:
+            cmd += ["--warmup-s", str(self.args.warmup_s)]
+        self.runs += 1
+        rc = subprocess.run(cmd).returncode
+        summary_path = os.path.join(run_dir, "summary.json")
+        if rc != 0 or not os.path.exists(summary_path):
+            self._logger.warning("Run %s failed (exit code %s)", run_dir, rc)
+            return None
+        with open(summary_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def run_point(self, name: str, cfg: Dict[str, Any]) -> List[Dict[str, Any]]:
+        summaries = []
+        for rep in range(self.reps):
+            self._logger.info("Point %s rep %s/%s", name, rep + 1, self.reps)
+            summary = self.run_once(cfg, os.path.join(self.results_dir, name, f"rep{rep}"))
+            if summary is not None:
+                summaries.append(summary)
+        return summaries
+
+    def sustainable(self, cfg: Dict[str, Any], summaries: List[Dict[str, Any]]) -> bool:
+        if len(summaries) < self.reps:
+            return False
+        offered = float(get_cfg(cfg, RATE_KEY)) + float(get_cfg(cfg, "sensor_sim.alarm_rate", 0))
+        for s in summaries:
+            miss = s.get("alarm_response_deadline_miss_rate", s.get("alarm_deadline_miss_rate"))
+            # No alarms means the deadlines were not shown to hold
+            if miss is None or miss > self.args.max_alarm_miss:
+                return False
+            if (s.get("throughput_msg_s") or 0) < self.args.min_throughput * offered:
+                return False
+        return True
+
+    def find_max_rate(
+        self, name: str, cfg: Dict[str, Any], overrides: Dict[str, Any]
+    ) -> Tuple[Optional[float], List[Dict[str, Any]]]:
+        probes = []
+        for key, value in (("sensor_sim.burst_duration_s", 0), ("sensor_sim.adaptive", False)):
+            if key not in overrides:
+                set_cfg(cfg, key, value)
+
+        def probe(rate: float) -> bool:
+            set_cfg(cfg, RATE_KEY, round(rate, 3))
+            summaries = self.run_point(f"{name}_rate{rate:g}", cfg)
+            ok = self.sustainable(cfg, summaries)
+            self._logger.info("Point %s at %g msg/s: %s", name, rate, "sustainable" if ok else "not sustainable")
+            probes.append({"rate": rate, "sustainable": ok, "summaries": summaries})
+            return ok
+
+        rate = self.args.rate_start or float(get_cfg(cfg, RATE_KEY, 50))
+        lo, hi = 0.0, None
+        while hi is None:
+            if probe(rate):
+                lo = rate
+                if rate * 2 > self.args.rate_max:
+                    break
+                rate *= 2
+            else:
+                hi = rate
+        if hi is not None:
+            for _ in range(self.args.rate_steps):
+                mid = (lo + hi) / 2
+                if probe(mid):
+                    lo = mid
+                else:
+                    hi = mid
+        return (lo or None), probes
+
+
+def _row(name: str, config: str, overrides: Dict[str, Any], summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    row: Dict[str, Any] = {"point": name, "config": config}
+    row.update(overrides)
+    row["reps_ok"] = len(summaries)
+    for metric in SWEEP_METRICS:
+        mean, ci = mean_ci([s[metric] for s in summaries if s.get(metric) is not None])
+        row[f"{metric}_mean"] = mean
+        row[f"{metric}_ci95"] = ci
+    return row
+
+
+def _fmt(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def write_table(rows: List[Dict[str, Any]], results_dir: str, show: bool = True) -> None:
+    fields: List[str] = []
+    for row in rows:
+        fields += [k for k in row if k not in fields]
+    with open(os.path.join(results_dir, "sweep_summary.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(results_dir, "sweep_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    if not show:
+        return
+
+    shown = [k for k in fields if not k.endswith("_mean") and not k.endswith("_ci95")]
+    metrics = [
+        "throughput_msg_s",
+        "alarm_response_p99_ms",
+        "alarm_response_deadline_miss_rate",
+        "telemetry_response_p99_ms",
+    ]
+    header = shown + metrics
+    lines = [header]
+    for row in rows:
+        cells = [_fmt(os.path.basename(row[k]) if k == "config" else row.get(k)) for k in shown]
+        for m in metrics:
+            mean, ci = row.get(f"{m}_mean"), row.get(f"{m}_ci95")
+            cells.append(_fmt(mean) + (f" ±{_fmt(ci)}" if ci is not None else ""))
+        lines.append(cells)
+    widths = [max(len(str(line[i])) for line in lines) for i in range(len(header))]
+    for line in lines:
+        print("  ".join(str(c).ljust(w) for c, w in zip(line, widths)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", action="append", default=[], help="Base config; repeat to sweep over configs")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=V1,V2", help="Matrix axis (dotted key)")
+    parser.add_argument("--matrix", default=None, help="YAML file with configs/matrix/reps/duration_s/warmup_s")
+    parser.add_argument("--results-dir", default=os.path.join("results", "sweep"))
+    parser.add_argument("--reps", type=int, default=None)
+    parser.add_argument("--duration-s", type=int, default=None)
+    parser.add_argument("--warmup-s", type=float, default=None)
+    parser.add_argument("--collector", choices=("thread", "async"), default="thread")
+    parser.add_argument(
+        "--find-max-rate", action="store_true", help="Search the max sustainable telemetry rate per point"
+    )
+    parser.add_argument("--rate-start", type=float, default=None, help="First rate probed (default: the config's rate)")
+    parser.add_argument("--rate-max", type=float, default=1e6)
+    parser.add_argument("--rate-steps", type=int, default=4, help="Bisection steps after the first failing rate")
+    parser.add_argument("--max-alarm-miss", type=float, default=0.0, help="Allowed alarm deadline miss rate")
+    parser.add_argument("--min-throughput", type=float, default=0.95, help="Required fraction of the offered rate")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and list the points without running them")
+    args = parser.parse_args()
+
+    setup_logging("sweep")
+    logger = logging.getLogger("sweep")
+
+    spec: Dict[str, Any] = {}
+    if args.matrix:
+        with open(args.matrix, "r", encoding="utf-8") as f:
+            spec = yaml.safe_load(f) or {}
+    configs = args.config or list(spec.get("configs") or [])
+    if not configs:
+        parser.error("at least one --config (or configs: in --matrix) is required")
+    axes: Dict[str, List[Any]] = {k: v if isinstance(v, list) else [v] for k, v in (spec.get("matrix") or {}).items()}
+    for text in args.set:
+        try:
+            key, values = parse_axis(text)
+        except ValueError as exc:
+            parser.error(str(exc))
+        axes[key] = values
+    args.reps = args.reps or int(spec.get("reps", 1))
+    args.duration_s = args.duration_s or spec.get("duration_s")
+    if args.warmup_s is None and spec.get("warmup_s") is not None:
+        args.warmup_s = float(spec["warmup_s"])
+    args.find_max_rate = args.find_max_rate or bool(spec.get("find_max_rate", False))
+
+    points = build_points(configs, axes)
+    # Fail on a bad override before spending time on the first runs
+    point_cfgs = []
+    for config, overrides in points:
+        try:
+            point_cfgs.append(point_config(config, overrides))
+        except ConfigError as exc:
+            logger.error("Invalid point %s %s: %s", config, overrides, exc)
+            return 2
+    logger.info("Sweep: %s points x %s reps -> %s", len(points), args.reps, args.results_dir)
+    if args.dry_run:
+        for i, (config, overrides) in enumerate(points):
+            print(f"p{i:02d}  {config}  {overrides}")
+        return 0
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    runner = SweepRunner(args)
+    rows = []
+    for i, ((config, overrides), cfg) in enumerate(zip(points, point_cfgs)):
+        name = f"p{i:02d}"
+        if args.find_max_rate:
+            max_rate, probes = runner.find_max_rate(name, cfg, overrides)
+            last_ok = [p for p in probes if p["sustainable"]]
+            row = _row(name, config, overrides, last_ok[-1]["summaries"] if last_ok else [])
+            row["max_sustainable_rate"] = max_rate
+            row["probes"] = len(probes)
+        else:
+            row = _row(name, config, overrides, runner.run_point(name, cfg))
+        rows.append(row)
+        # Rewritten after every point, so an interrupted sweep keeps its results
+        write_table(rows, args.results_dir, show=i == len(points) - 1)
+    logger.info("Sweep finished: %s benchmark runs, table in %s", runner.runs, args.results_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,114 @@
+import argparse
+import json
+import random
+import time
+import uuid
+from typing import Callable, Dict, List
+
+from src.common.codec import JsonCodec, available_codecs, get_codec
+from src.common.models import Message
+from src.common.time_utils import wall_ms
+from src.rtdb.payloads import build_state, build_telemetry
+
+# Single-threaded (msgs/s per core) cost of the collector's JSON work per
+# message for each installed codec: decode the MQTT payload into a Message,
+# then encode the mock RTDB lines (state + telemetry) and the dashboard
+# record. "json (before)" is the previous path: str decode + json.loads +
+# Message.from_dict, and json.dumps with default separators.
+#
+#   python -m src.bench.codec_bench --n 200000
+
+
+def make_payloads(n: int, devices: int = 200, seed: int = 1) -> List[bytes]:
+    # Same shape as sensor_sim telemetry
+    rng = random.Random(seed)
+    now = wall_ms()
+    out = []
+    for i in range(n):
+        out.append(
+            json.dumps(
+                {
+                    "msg_id": str(uuid.UUID(int=rng.getrandbits(128))),
+                    "device_id": f"esp32-{i % devices + 1:02d}",
+                    "type": "telemetry",
+                    "t_sensor_ms": now + i,
+                    "seq": i // devices + 1,
+                    "values": {
+                        "temp": rng.uniform(20, 40),
+                        "smoke": rng.uniform(0.1, 0.6),
+                        "gas": rng.uniform(0.05, 0.4),
+                        "flame": 0.0,
+                    },
+                }
+            ).encode("utf-8")
+        )
+    return out
+
+
+def _encode_outputs(msg: Message, dumps: Callable[[object], object]) -> None:
+    dumps({"path": f"/devices/{msg.device_id}/state", "data": build_state(msg, "NORMAL", 2000, "sim")})
+    dumps({"path": f"/telemetry/{msg.device_id}", "data": build_telemetry(msg)})
+    dumps({"msg_id": msg.msg_id, "type": msg.msg_type, "severity": "NORMAL"})
+
+
+def _rate(fn: Callable[[], None], n: int) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return n / (time.perf_counter() - t0)
+
+
+def bench_legacy(payloads: List[bytes]) -> Dict[str, float]:
+    msgs: List[Message] = []
+
+    def decode() -> None:
+        for p in payloads:
+            msgs.append(Message.from_dict(json.loads(p.decode("utf-8"))))
+
+    def encode() -> None:
+        for m in msgs:
+            _encode_outputs(m, json.dumps)
+
+    n = len(payloads)
+    return {"decode": _rate(decode, n), "encode": _rate(encode, n)}
+
+
+def bench_codec(codec: JsonCodec, payloads: List[bytes]) -> Dict[str, float]:
+    msgs: List[Message] = []
+
+    def decode() -> None:
+        decode_message = codec.decode_message
+        for p in payloads:
+            msgs.append(decode_message(p))
+
+    def encode() -> None:
+        for m in msgs:
+            _encode_outputs(m, codec.dumps)
+
+    n = len(payloads)
+    return {"decode": _rate(decode, n), "encode": _rate(encode, n)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200000)
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.n)
+    results = {"json (before)": bench_legacy(payloads)}
+    for name, ok in available_codecs().items():
+        if ok:
+            results[name] = bench_codec(get_codec(name), payloads)
+
+    print(f"messages: {args.n}, payload {sum(map(len, payloads)) / len(payloads):.0f} B avg")
+    print(f"{'codec':<16}{'decode msg/s':>14}{'encode msg/s':>14}{'total msg/s':>14}")
+    for name, r in results.items():
+        total = 1.0 / (1.0 / r["decode"] + 1.0 / r["encode"])
+        print(f"{name:<16}{r['decode']:>14,.0f}{r['encode']:>14,.0f}{total:>14,.0f}")
+    missing = [n for n, ok in available_codecs().items() if not ok]
+    if missing:
+        print(f"not installed: {', '.join(missing)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
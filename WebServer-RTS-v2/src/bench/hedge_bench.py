@@ -0,0 +1,119 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from src.common.codec import get_codec
+from src.rtdb.hedge import HEDGE, HedgedWriter, HedgePolicy
+from src.rtdb.rtdb_interface import BatchOp
+from src.rtdb.sim_backend import LognormalLatency, RtdbSimModel, SimBackend
+
+# Alarm write latency with and without hedging against rtdb.mode: sim with a
+# lognormal latency (--median-ms, --sigma), from --threads concurrent
+# writers. Afterwards every /alarms/{id} written more than once is checked to
+# have been written with the same document, so the RTDB ends up with exactly
+# one record per alarm either way, and the device state is checked to have
+# been written once per alarm (a raced state could roll a device back).
+#
+#   python -m src.bench.hedge_bench --n 2000 --sigma 1.0
+
+
+def _ops(i: int) -> List[BatchOp]:
+    device_id = f"esp32-{i % 50:02d}"
+    values = {"temp": 71.5, "smoke": 0.82, "gas": 0.4, "flame": 1.0}
+    return [
+        ("state", device_id, {"ts_ms": 1_700_000_000_000 + i, "severity": "CRITICAL", "values": values}),
+        ("alarm", f"alarm-{i}", {"deviceId": device_id, "ts_ms": 1_700_000_000_000 + i, "severity": "CRITICAL"}),
+    ]
+
+
+def _run(name: str, args: argparse.Namespace, base_dir: str, hedged: bool) -> Dict[str, object]:
+    model = RtdbSimModel(LognormalLatency(args.median_ms, args.sigma), seed=args.seed)
+    path = os.path.join(base_dir, f"{name}.jsonl")
+    backend = SimBackend(path, model)
+    writer = HedgedWriter(backend, HedgePolicy(args.percentile, args.min_delay_ms, budget=args.budget), args.threads)
+    times: List[float] = []
+    hedge_wins = [0]
+    lock = threading.Lock()
+
+    def _worker(start: int) -> None:
+        for i in range(start, args.n, args.threads):
+            ops = _ops(i)
+            t0 = time.perf_counter()
+            if hedged:
+                attempt = writer.write_batch(ops)[1]
+            else:
+                backend.write_batch(ops)
+                attempt = 0
+            elapsed = (time.perf_counter() - t0) * 1000.0
+            with lock:
+                times.append(elapsed)
+                hedge_wins[0] += attempt == HEDGE
+
+    threads = [threading.Thread(target=_worker, args=(t,)) for t in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.close()
+
+    docs: Dict[str, set] = defaultdict(set)
+    states = 0
+    codec = get_codec()
+    with open(path, "rb") as f:
+        for line in f:
+            record = codec.loads(line)
+            if record["path"].startswith("/alarms/"):
+                docs[record["path"]].add(codec.dumps(record["data"]))
+            elif record["path"].startswith("/devices/"):
+                states += 1
+    times.sort()
+    return {
+        "p50": times[len(times) // 2],
+        "p95": times[int(len(times) * 0.95)],
+        "p99": times[int(len(times) * 0.99)],
+        "writes": model.writes,
+        "hedge_wins": hedge_wins[0],
+        "alarms": len(docs),
+        "conflicts": sum(1 for d in docs.values() if len(d) > 1),
+        "states": states,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--median-ms", type=float, default=10.0)
+    parser.add_argument("--sigma", type=float, default=1.0)
+    parser.add_argument("--percentile", type=float, default=95)
+    parser.add_argument("--min-delay-ms", type=float, default=5)
+    parser.add_argument("--budget", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    base_dir = tempfile.mkdtemp(prefix="hedge_bench_")
+    try:
+        rows = {"single write": _run("single", args, base_dir, False), "hedged": _run("hedged", args, base_dir, True)}
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    print(f"alarms: {args.n}, lognormal median {args.median_ms} ms sigma {args.sigma}, {args.threads} writers")
+    print(
+        f"{'mode':<14}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'writes':>8}{'hedge won':>11}{'alarms':>8}"
+        f"{'conflicts':>11}{'states':>8}"
+    )
+    for name, r in rows.items():
+        print(
+            f"{name:<14}{r['p50']:>9.1f}{r['p95']:>9.1f}{r['p99']:>9.1f}{r['writes']:>8}"
+            f"{r['hedge_wins']:>11}{r['alarms']:>8}{r['conflicts']:>11}{r['states']:>8}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,203 @@
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from src.common.models import Message, TraceEvent
+from src.common.time_utils import wall_ms
+from src.processing import rules
+from src.processing.pipeline import classify_into
+from src.rtdb.payloads import build_alarm, build_state, build_telemetry
+
+# Per-message memory and allocation cost of the collector's data path, from
+# decoded JSON to trace event, for the previous representation (dict-backed
+# dataclasses, an `item` dict per message, three RTDB documents per message
+# and a row dict per trace) against slotted Message/TraceEvent filled in
+# place. Every object a stage creates is kept alive until the measurement,
+# so traced blocks/msg counts allocations that outlive the expression
+# evaluating them.
+#
+#   python -m src.bench.models_bench --n 100000
+
+
+@dataclass
+class _DictMessage:
+    msg_id: str
+    device_id: str
+    msg_type: str
+    t_sensor_ms: Optional[int]
+    seq: int
+    values: Dict[str, Any]
+    alarm: Optional[Dict[str, Any]] = None
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "_DictMessage":
+        return _DictMessage(
+            msg_id=str(data.get("msg_id", "")),
+            device_id=str(data.get("device_id", "")),
+            msg_type=str(data.get("type", "")),
+            t_sensor_ms=data.get("t_sensor_ms"),
+            seq=int(data.get("seq", 0)),
+            values=dict(data.get("values") or {}),
+            alarm=data.get("alarm"),
+        )
+
+
+@dataclass
+class _DictTraceEvent:
+    msg_id: str
+    device_id: str
+    msg_type: str
+    t_sensor_ms: Optional[int]
+    t_pc_rx_ms: int
+    t_proc_start_ms: int
+    t_proc_end_ms: int
+    t_db_enqueue_ms: Optional[int]
+    t_dashboard_emit_ms: Optional[int]
+    deadline_ms: int
+    avi_ms: int
+    notes: str = ""
+
+
+def _row(trace: Any) -> Dict[str, Any]:
+    return {
+        "msg_id": trace.msg_id,
+        "device_id": trace.device_id,
+        "msg_type": trace.msg_type,
+        "t_sensor_ms": trace.t_sensor_ms if trace.t_sensor_ms is not None else "",
+        "t_pc_rx_ms": trace.t_pc_rx_ms,
+        "t_proc_start_ms": trace.t_proc_start_ms,
+        "t_proc_end_ms": trace.t_proc_end_ms,
+        "t_db_enqueue_ms": trace.t_db_enqueue_ms if trace.t_db_enqueue_ms is not None else "",
+        "t_dashboard_emit_ms": trace.t_dashboard_emit_ms if trace.t_dashboard_emit_ms is not None else "",
+        "deadline_ms": trace.deadline_ms,
+        "avi_ms": trace.avi_ms,
+        "notes": trace.notes,
+    }
+
+
+def dict_path(data: Dict[str, Any], t_rx: int) -> List[object]:
+    msg = _DictMessage.from_dict(data)
+    item: Dict[str, object] = {"message": msg, "t_pc_rx_ms": t_rx}
+    t_start = wall_ms()
+    severity, rule_note = rules.classify(msg)
+    item["severity"] = severity
+    item["rule_note"] = rule_note
+    item["t_proc_start_ms"] = t_start
+    item["t_proc_end_ms"] = wall_ms()
+    item["worker"] = 0
+    t_enq = wall_ms()
+    state = build_state(msg, severity, 2000, "sim")
+    alarm = build_alarm(msg, severity)
+    telemetry = build_telemetry(msg)
+    record = {
+        "msg_id": msg.msg_id,
+        "device_id": msg.device_id,
+        "msg_type": msg.msg_type,
+        "state": state,
+        "alarm": alarm,
+        "telemetry": telemetry,
+        "t_db_enqueue_ms": t_enq,
+        "deadline_at_ms": (msg.t_sensor_ms or t_rx) + 300,
+    }
+    trace = _DictTraceEvent(
+        msg.msg_id, msg.device_id, msg.msg_type, msg.t_sensor_ms, t_rx,
+        t_start, int(item["t_proc_end_ms"]), t_enq, wall_ms(), 300, 5000, rule_note,
+    )
+    return [item, record, trace, _row(trace)]
+
+
+def slotted_path(data: Dict[str, Any], t_rx: int) -> List[object]:
+    msg = Message.from_dict(data)
+    msg.t_pc_rx_ms = t_rx
+    classify_into(msg, wall_ms())
+    msg.t_db_enqueue_ms = wall_ms()
+    # Documents are built at write time, and only for written paths; with
+    # the state cache off that is state plus the telemetry/alarm document
+    state = build_state(msg, msg.severity, 2000, "sim")
+    payload = build_alarm(msg, msg.severity) if msg.msg_type == "alarm" else build_telemetry(msg)
+    msg.t_dashboard_emit_ms = wall_ms()
+    trace = TraceEvent(
+        msg.msg_id, msg.device_id, msg.msg_type, msg.t_sensor_ms, msg.t_pc_rx_ms,
+        msg.t_proc_start_ms, msg.t_proc_end_ms, msg.t_db_enqueue_ms, msg.t_dashboard_emit_ms,
+        300, 5000, msg.notes,
+    )
+    return [msg, state, payload, trace]
+
+
+def make_inputs(n: int, devices: int = 200, seed: int = 1) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    now = wall_ms()
+    out = []
+    for i in range(n):
+        out.append(
+            {
+                "msg_id": f"esp32-{i % devices:03d}-{i}",
+                "device_id": f"esp32-{i % devices:03d}",
+                "type": "alarm" if i % 50 == 0 else "telemetry",
+                "t_sensor_ms": now + i,
+                "seq": i,
+                "values": {
+                    "temp": round(rng.uniform(20, 40), 2),
+                    "smoke": round(rng.random() * 0.3, 3),
+                    "gas": round(rng.random() * 0.3, 3),
+                    "flame": 0,
+                },
+            }
+        )
+    return out
+
+
+def measure(path: Callable[[Dict[str, Any], int], List[object]], inputs: List[Dict[str, Any]]) -> Dict[str, float]:
+    n = len(inputs)
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.take_snapshot()
+    kept = [path(data, 0) for data in inputs]
+    snap = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    diff = snap.compare_to(base, "filename")
+    size = sum(d.size_diff for d in diff)
+    blocks = sum(d.count_diff for d in diff)
+    # Subtract the result lists themselves, which are bench scaffolding
+    scaffold = sys.getsizeof(kept) + sum(sys.getsizeof(k) for k in kept)
+    del kept
+
+    gc.collect()
+    t0 = time.perf_counter()
+    for data in inputs:
+        path(data, 0)
+    elapsed = time.perf_counter() - t0
+    return {
+        "bytes_per_msg": (size - scaffold) / n,
+        "blocks_per_msg": blocks / n - 1,
+        "us_per_msg": elapsed / n * 1e6,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100000)
+    args = parser.parse_args()
+
+    inputs = make_inputs(args.n)
+    results = {"dict (before)": measure(dict_path, inputs), "slotted (after)": measure(slotted_path, inputs)}
+
+    before = _DictMessage.from_dict(inputs[1])
+    print(f"messages: {args.n}")
+    print(
+        f"Message instance: {sys.getsizeof(before)}B + {sys.getsizeof(before.__dict__)}B __dict__"
+        f" -> {sys.getsizeof(Message.from_dict(inputs[1]))}B slotted (with pipeline fields)"
+    )
+    print(f"{'representation':<18}{'bytes/msg':>12}{'blocks/msg':>12}{'us/msg':>10}")
+    for name, r in results.items():
+        print(f"{name:<18}{r['bytes_per_msg']:>12.0f}{r['blocks_per_msg']:>12.1f}{r['us_per_msg']:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
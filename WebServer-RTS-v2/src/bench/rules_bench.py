@@ -0,0 +1,144 @@
+import argparse
+import random
+import time
+from typing import Callable, Dict, List, Tuple
+
+from src.common.models import Message
+from src.common.sched_queue import SchedQueue
+from src.common.time_utils import wall_ms
+from src.processing.pipeline import classify_batch_into, classify_into
+from src.processing.rules import RuleSet
+
+# Classification throughput of the pipeline's two paths over --n synthetic
+# telemetry messages (a pool of --pool messages, classified repeatedly):
+#
+#   per message  classify_into() on each message, as pipeline.classify_batch: 1
+#   batch N      classify_batch_into() on N messages at once (NumPy)
+#
+# for the default thresholds and for zoned/per-device thresholds, and with the
+# shard's queue in front (put, then get() per message or get_many() per
+# batch). Batched results are checked against the per-message ones.
+#
+#   python -m src.bench.rules_bench --n 1000000
+
+
+def _messages(n: int, devices: int, seed: int) -> List[Message]:
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        device_id = f"esp32-{i % devices:04d}"
+        hot = rnd.random() < 0.05
+        out.append(
+            Message(
+                msg_id=f"{device_id}-{i}",
+                device_id=device_id,
+                msg_type="telemetry",
+                t_sensor_ms=0,
+                seq=i,
+                values={
+                    "temp": round(rnd.uniform(55, 80) if hot else rnd.uniform(18, 40), 2),
+                    "smoke": round(rnd.uniform(0.5, 0.9) if hot else rnd.uniform(0, 0.3), 4),
+                    "gas": round(rnd.uniform(0, 0.8) if hot else rnd.uniform(0, 0.3), 4),
+                    "flame": float(hot and rnd.random() < 0.3),
+                },
+            )
+        )
+    return out
+
+
+def _zoned(devices: int) -> RuleSet:
+    # Ten zones by device id prefix, plus every 50th device tuned on its own
+    zones = {
+        f"zone-{z}": {"devices": [f"esp32-{z}*"], "thresholds": {"temp": 50.0 + 3 * z, "smoke": 0.5 + 0.02 * z}}
+        for z in range(10)
+    }
+    tuned = {f"esp32-{d:04d}": {"gas": 0.4, "temp": None} for d in range(0, devices, 50)}
+    return RuleSet(zones=zones, devices=tuned)
+
+
+def _per_message(pool: List[Message], n: int, rules: RuleSet) -> None:
+    done = 0
+    while done < n:
+        for msg in pool[: n - done]:
+            classify_into(msg, wall_ms(), rules)
+        done += min(len(pool), n - done)
+
+
+def _batched(pool: List[Message], n: int, rules: RuleSet, size: int) -> None:
+    done = 0
+    while done < n:
+        for i in range(0, min(len(pool), n - done), size):
+            classify_batch_into(pool[i : min(i + size, n - done)], wall_ms(), rules)
+        done += min(len(pool), n - done)
+
+
+def _queued(pool: List[Message], n: int, rules: RuleSet, size: int) -> float:
+    # Seconds spent taking messages off a SchedQueue and classifying them;
+    # filling the queue is not timed
+    queue = SchedQueue({"telemetry": 0})
+    elapsed = 0.0
+    done = 0
+    while done < n:
+        chunk = pool[: n - done]
+        for msg in chunk:
+            queue.put("telemetry", msg)
+        t0 = time.perf_counter()
+        if size == 1:
+            for _ in range(len(chunk)):
+                classify_into(queue.get(timeout=0)[1], wall_ms(), rules)
+        else:
+            while True:
+                batch = queue.get_many("telemetry", size)
+                if not batch:
+                    break
+                classify_batch_into(batch, wall_ms(), rules)
+        elapsed += time.perf_counter() - t0
+        done += len(chunk)
+    return elapsed
+
+
+def _timed(fn: Callable[[], None]) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--pool", type=int, default=100_000, help="Distinct messages, classified n / pool times")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--batches", default="16,64,256,1024")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    pool = _messages(min(args.pool, args.n), args.devices, args.seed)
+    sizes = [int(s) for s in args.batches.split(",")]
+    print(f"messages: {args.n} (pool {len(pool)}, {args.devices} devices)")
+    print(f"{'rules':<9}{'path':<14}{'msg/s':>12}{'ns/msg':>9}{'queued msg/s':>15}{'ns/msg':>9}")
+    for name, rules in (("default", RuleSet()), ("zoned", _zoned(args.devices))):
+        _per_message(pool, len(pool), rules)
+        expected: List[Tuple[str, str]] = [(m.severity, m.notes) for m in pool]
+        rows: Dict[str, Tuple[float, float]] = {
+            "per message": (_timed(lambda: _per_message(pool, args.n, rules)), _queued(pool, args.n, rules, 1))
+        }
+        for size in sizes:
+            for msg in pool:
+                msg.severity = msg.notes = ""
+            _batched(pool, len(pool), rules, size)
+            if [(m.severity, m.notes) for m in pool] != expected:
+                raise SystemExit(f"batch {size}: results differ from per-message classification")
+            rows[f"batch {size}"] = (
+                _timed(lambda: _batched(pool, args.n, rules, size)),
+                _queued(pool, args.n, rules, size),
+            )
+        for path, (plain_s, queued_s) in rows.items():
+            print(
+                f"{name:<9}{path:<14}{args.n / plain_s:>12,.0f}{plain_s / args.n * 1e9:>9.0f}"
+                f"{args.n / queued_s:>15,.0f}{queued_s / args.n * 1e9:>9.0f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
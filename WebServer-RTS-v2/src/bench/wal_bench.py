@@ -0,0 +1,98 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from src.common.config import set_cfg, validate_config
+from src.common.models import Message
+from src.common.time_utils import wall_ms
+from src.rtdb.db_writer import DbWriter
+from src.rtdb.mock_backend import MockBackend
+
+# Cost of DbWriter.enqueue() for alarms without the write-ahead log, with
+# group commit and with an fsync per append, measured per call on a running
+# writer whose backend acks immediately. The WAL directory is created under
+# --dir (a temp directory by default), so run it on the disk the collector
+# would use.
+#
+#   python -m src.bench.wal_bench --n 20000
+
+
+class _NullAcks:
+    def write_ack(self, msg_id: str, ack_ms: Optional[int]) -> None:
+        pass
+
+
+def _alarm(i: int) -> Message:
+    msg = Message(
+        msg_id=f"alarm-{i}",
+        device_id=f"esp32-{i % 50:02d}",
+        msg_type="alarm",
+        t_sensor_ms=wall_ms(),
+        seq=i,
+        values={"temp": 71.5, "smoke": 0.82, "gas": 0.4, "flame": 1.0},
+        alarm={"kind": "fire", "level": "high"},
+        severity="CRITICAL",
+    )
+    msg.t_db_enqueue_ms = wall_ms()
+    return msg
+
+
+def _run(name: str, n: int, base_dir: str, wal: bool, fsync_interval_ms: int) -> Dict[str, float]:
+    cfg = validate_config({})
+    set_cfg(cfg, "rtdb.writer.alarm_queue_max", n + 1)
+    set_cfg(cfg, "rtdb.writer.wal.enabled", wal)
+    set_cfg(cfg, "rtdb.writer.wal.dir", os.path.join(base_dir, name))
+    set_cfg(cfg, "rtdb.writer.wal.fsync_interval_ms", fsync_interval_ms)
+    writer = DbWriter(MockBackend(os.path.join(base_dir, "mock_rtdb.jsonl")), _NullAcks(), cfg)
+    writer.start()
+    msgs = [_alarm(i) for i in range(n)]
+    times: List[int] = []
+    clock = time.perf_counter_ns
+    for msg in msgs:
+        t0 = clock()
+        writer.enqueue(msg)
+        times.append(clock() - t0)
+    writer.stop()
+    times.sort()
+    stats = writer.wal_stats()
+    return {
+        "mean_us": sum(times) / len(times) / 1000.0,
+        "p50_us": times[len(times) // 2] / 1000.0,
+        "p99_us": times[int(len(times) * 0.99)] / 1000.0,
+        "fsyncs": stats["commits"] if stats else 0,
+        "pending": stats["pending"] if stats else 0,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dir", default=None, help="Directory for the WAL files (default: a temp directory)")
+    args = parser.parse_args()
+
+    base_dir = tempfile.mkdtemp(prefix="wal_bench_", dir=args.dir)
+    try:
+        rows = {
+            "no wal": _run("off", args.n, base_dir, False, 10),
+            "wal, commit 10 ms": _run("group", args.n, base_dir, True, 10),
+            # An fsync per alarm is orders of magnitude slower; fewer samples
+            "wal, fsync each": _run("each", max(1, args.n // 20), base_dir, True, 0),
+        }
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    print(f"alarms: {args.n}")
+    print(f"{'mode':<20}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'fsyncs':>8}{'unacked':>9}")
+    for name, r in rows.items():
+        print(
+            f"{name:<20}{r['mean_us']:>10.1f}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}"
+            f"{r['fsyncs']:>8.0f}{r['pending']:>9.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
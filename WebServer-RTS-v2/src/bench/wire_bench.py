@@ -0,0 +1,52 @@
+import argparse
+import time
+from typing import Callable, Dict, List
+
+from src.bench.codec_bench import make_payloads
+from src.common.codec import available_codecs, get_codec
+from src.common.models import Message
+from src.common.wire import TelemetryWire
+
+# Payload size and decode cost per telemetry message: sensor_sim JSON (with
+# each installed JSON codec) against the compact binary format, for the same
+# readings. Decoding goes all the way to a Message, as in the collector.
+#
+#   python -m src.bench.wire_bench --n 200000
+
+
+def _us_per_msg(decode: Callable[[bytes], Message], payloads: List[bytes]) -> float:
+    t0 = time.perf_counter()
+    for p in payloads:
+        decode(p)
+    return (time.perf_counter() - t0) / len(payloads) * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200000)
+    args = parser.parse_args()
+
+    json_payloads = make_payloads(args.n)
+    wire = TelemetryWire("esp32-")
+    stdlib = get_codec("stdlib")
+    binary_payloads = []
+    for p in json_payloads:
+        msg = stdlib.decode_message(p)
+        binary_payloads.append(wire.encode(wire.device_index(msg.device_id), msg.seq, msg.t_sensor_ms, msg.values))
+
+    rows: Dict[str, Dict[str, float]] = {}
+    json_bytes = sum(map(len, json_payloads)) / args.n
+    for name, ok in available_codecs().items():
+        if ok:
+            rows[f"json/{name}"] = {"bytes": json_bytes, "us": _us_per_msg(get_codec(name).decode_message, json_payloads)}
+    rows["binary"] = {"bytes": sum(map(len, binary_payloads)) / args.n, "us": _us_per_msg(wire.decode, binary_payloads)}
+
+    print(f"messages: {args.n}")
+    print(f"{'format':<16}{'bytes/msg':>12}{'decode us/msg':>16}{'msg/s':>12}")
+    for name, r in rows.items():
+        print(f"{name:<16}{r['bytes']:>12.0f}{r['us']:>16.2f}{1e6 / r['us']:>12,.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
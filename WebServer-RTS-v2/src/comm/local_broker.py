@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import logging
+import signal
+import struct
+from typing import Dict, List, Optional, Set, Tuple
+
+from paho.mqtt.client import topic_matches_sub
+
+from src.common.config import get_cfg, load_config
+from src.common.log import setup_logging
+
+# Minimal MQTT 3.1.1 broker in pure Python (asyncio), enough for sensor_sim
+# and the collectors to run without an external Mosquitto:
+#
+#   CONNECT/CONNACK, SUBSCRIBE/SUBACK, UNSUBSCRIBE/UNSUBACK, PINGREQ/PINGRESP,
+#   DISCONNECT, and PUBLISH at QoS 0/1/2 (acknowledged to the publisher)
+#
+# Messages are forwarded at min(publish QoS, granted QoS), with granted QoS
+# capped at 1. There are no retained messages, wills, persistent sessions or
+# redelivery: a subscriber's outgoing buffer is bounded by max_buffer_bytes,
+# over which QoS 0 messages to it are dropped (and counted), much as
+# Mosquitto drops when max_queued_messages is reached.
+#
+#   python -m src.comm.local_broker --config configs/baseline.yaml
+#   python -m src.comm.local_broker --host 127.0.0.1 --port 1883
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+_U16 = struct.Struct("!H")
+_PINGRESP = bytes((PINGRESP << 4, 0))
+
+
+def _remaining_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        n, digit = divmod(n, 128)
+        out.append(digit | 0x80 if n else digit)
+        if not n:
+            return bytes(out)
+
+
+def _packet(first_byte: int, body: bytes) -> bytes:
+    return bytes((first_byte,)) + _remaining_length(len(body)) + body
+
+
+def _ack(ptype: int, packet_id: int, flags: int = 0) -> bytes:
+    return bytes((ptype << 4 | flags, 2)) + _U16.pack(packet_id)
+
+
+def _string(data: bytes, pos: int) -> Tuple[str, int]:
+    (n,) = _U16.unpack_from(data, pos)
+    pos += 2
+    return data[pos : pos + n].decode("utf-8"), pos + n
+
+
+class _Session(asyncio.Protocol):
+    def __init__(self, broker: "LocalBroker") -> None:
+        self.broker = broker
+        self.transport: Optional[asyncio.Transport] = None
+        self.client_id = ""
+        self._buf = bytearray()
+        self._next_id = 0
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore[assignment]
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.broker.remove(self)
+
+    def data_received(self, data: bytes) -> None:
+        buf = self._buf
+        buf += data
+        pos = 0
+        end = len(buf)
+        while end - pos >= 2:
+            # Fixed header: type/flags byte, then a 1-4 byte remaining length
+            length = 0
+            shift = 0
+            digit = 0x80
+            i = pos + 1
+            while digit & 0x80 and i < end:
+                digit = buf[i]
+                length |= (digit & 0x7F) << shift
+                shift += 7
+                i += 1
+            if shift > 28:
+                self._close("malformed remaining length")
+                return
+            if digit & 0x80 or i + length > end:
+                break
+            first = buf[pos]
+            body = bytes(buf[i : i + length])
+            pos = i + length
+            try:
+                self._handle(first >> 4, first & 0x0F, body)
+            except (struct.error, UnicodeDecodeError, IndexError) as exc:
+                self._close(f"malformed packet: {exc}")
+                return
+            if self.transport is None or self.transport.is_closing():
+                return
+        del buf[:pos]
+
+    def _handle(self, ptype: int, flags: int, body: bytes) -> None:
+        if ptype == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, pos = _string(body, 0)
+            if qos:
+                (packet_id,) = _U16.unpack_from(body, pos)
+                pos += 2
+                self.transport.write(_ack(PUBACK if qos == 1 else PUBREC, packet_id))
+            self.broker.route(topic, body[pos:], qos)
+        elif ptype == PUBREL:
+            self.transport.write(_ack(PUBCOMP, _U16.unpack_from(body, 0)[0]))
+        elif ptype in (PUBACK, PUBREC, PUBCOMP):
+            # Acks for what we forwarded; nothing is kept for redelivery
+            if ptype == PUBREC:
+                self.transport.write(_ack(PUBREL, _U16.unpack_from(body, 0)[0], 0x02))
+        elif ptype == CONNECT:
+            self._connect(body)
+        elif ptype == SUBSCRIBE:
+            (packet_id,) = _U16.unpack_from(body, 0)
+            pos = 2
+            granted = bytearray()
+            while pos < len(body):
+                topic_filter, pos = _string(body, pos)
+                qos = min(body[pos] & 0x03, 1)
+                pos += 1
+                self.broker.subscribe(self, topic_filter, qos)
+                granted.append(qos)
+            self.transport.write(_packet(SUBACK << 4, _U16.pack(packet_id) + bytes(granted)))
+        elif ptype == UNSUBSCRIBE:
+            (packet_id,) = _U16.unpack_from(body, 0)
+            pos = 2
+            while pos < len(body):
+                topic_filter, pos = _string(body, pos)
+                self.broker.unsubscribe(self, topic_filter)
+            self.transport.write(_ack(UNSUBACK, packet_id))
+        elif ptype == PINGREQ:
+            self.transport.write(_PINGRESP)
+        elif ptype == DISCONNECT:
+            self.transport.close()
+        else:
+            self._close(f"unexpected packet type {ptype}")
+
+    def _connect(self, body: bytes) -> None:
+        protocol, pos = _string(body, 0)
+        level = body[pos]
+        if protocol not in ("MQTT", "MQIsdp") or level not in (3, 4):
+            # Unacceptable protocol version
+            self.transport.write(bytes((CONNACK << 4, 2, 0, 1)))
+            self.transport.close()
+            return
+        pos += 4  # level, connect flags, keepalive
+        self.client_id, _ = _string(body, pos)
+        self.transport.write(bytes((CONNACK << 4, 2, 0, 0)))
+
+    def _close(self, reason: str) -> None:
+        logging.getLogger("broker").warning("Closing %s: %s", self.client_id or "client", reason)
+        self.transport.close()
+
+    def forward(self, topic_bytes: bytes, payload: bytes, qos: int) -> bool:
+        # False when the message was dropped for a full outgoing buffer
+        transport = self.transport
+        if transport is None or transport.is_closing():
+            return False
+        if qos == 0:
+            if transport.get_write_buffer_size() > self.broker.max_buffer_bytes:
+                return False
+            transport.write(_packet(PUBLISH << 4, topic_bytes + payload))
+            return True
+        self._next_id = self._next_id % 0xFFFF + 1
+        transport.write(_packet(PUBLISH << 4 | qos << 1, topic_bytes + _U16.pack(self._next_id) + payload))
+        return True
+
+
+class LocalBroker:
+    def __init__(self, host: str = "127.0.0.1", port: int = 1883, max_buffer_bytes: int = 64 * 1024 * 1024) -> None:
+        self.host = host
+        self.port = port
+        self.max_buffer_bytes = max_buffer_bytes
+        self._sessions: Set[_Session] = set()
+        self._subs: Dict[_Session, List[Tuple[str, int]]] = {}
+        # topic -> [(session, granted qos)]; cleared whenever subscriptions change
+        self._routes: Dict[str, List[Tuple[_Session, int]]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.received = 0
+        self.forwarded = 0
+        self.dropped = 0
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: self._add(_Session(self)), self.host, self.port)
+
+    async def serve(self, stop: Optional[asyncio.Event] = None) -> None:
+        await self.start()
+        logging.getLogger("broker").info("Local MQTT broker listening on %s:%s", self.host, self.port)
+        try:
+            if stop is None:
+                await asyncio.Future()
+            else:
+                await stop.wait()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for session in list(self._sessions):
+            if session.transport is not None:
+                session.transport.close()
+
+    def _add(self, session: _Session) -> _Session:
+        self._sessions.add(session)
+        return session
+
+    def remove(self, session: _Session) -> None:
+        self._sessions.discard(session)
+        if self._subs.pop(session, None) is not None:
+            self._routes = {}
+
+    def subscribe(self, session: _Session, topic_filter: str, qos: int) -> None:
+        subs = [s for s in self._subs.get(session, []) if s[0] != topic_filter]
+        subs.append((topic_filter, qos))
+        self._subs[session] = subs
+        self._routes = {}
+
+    def unsubscribe(self, session: _Session, topic_filter: str) -> None:
+        self._subs[session] = [s for s in self._subs.get(session, []) if s[0] != topic_filter]
+        self._routes = {}
+
+    def route(self, topic: str, payload: bytes, qos: int) -> None:
+        self.received += 1
+        targets = self._routes.get(topic)
+        if targets is None:
+            targets = []
+            for session, subs in self._subs.items():
+                # Overlapping filters deliver once, at the highest granted QoS
+                granted = [q for f, q in subs if topic_matches_sub(f, topic)]
+                if granted:
+                    targets.append((session, max(granted)))
+            self._routes[topic] = targets
+        if not targets:
+            return
+        encoded = topic.encode("utf-8")
+        topic_bytes = _U16.pack(len(encoded)) + encoded
+        for session, granted in targets:
+            if session.forward(topic_bytes, payload, min(qos, granted)):
+                self.forwarded += 1
+            else:
+                self.dropped += 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default=None, help="Listen on mqtt.host/mqtt.port of this config")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args()
+
+    cfg = load_config(args.config) if args.config else {}
+    host = args.host or str(get_cfg(cfg, "mqtt.host", "127.0.0.1"))
+    port = args.port or int(get_cfg(cfg, "mqtt.port", 1883))
+
+    setup_logging("local_broker")
+    logger = logging.getLogger("broker")
+    broker = LocalBroker(host, port)
+
+    async def _serve() -> None:
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        try:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signum, stop.set)
+        except NotImplementedError:
+            # Windows event loops have no add_signal_handler
+            def _handle_stop(signum: int, frame: object) -> None:
+                loop.call_soon_threadsafe(stop.set)
+
+            signal.signal(signal.SIGINT, _handle_stop)
+            signal.signal(signal.SIGTERM, _handle_stop)
+        await broker.serve(stop)
+
+    try:
+        asyncio.run(_serve())
+    finally:
+        logger.info(
+            "Local MQTT broker stopped: %s received, %s forwarded, %s dropped",
+            broker.received,
+            broker.forwarded,
+            broker.dropped,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
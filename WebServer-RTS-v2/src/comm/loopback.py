@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from paho.mqtt.client import topic_matches_sub
+
+from src.common.codec import JsonCodec, get_codec
+
+# In-process MQTT stand-in: publishers and subscribers in the same process
+# exchange payloads through a LoopbackBus instead of a broker socket. Every
+# client has its own unbounded FIFO and delivery thread, so handlers run off
+# the publisher's thread exactly as with paho's network thread, and the
+# payload bytes are handed over without a copy. QoS is accepted and ignored:
+# nothing is lost in-process. Timestamps stay comparable with the broker
+# transports, and the difference between the two is the transport's share
+# of the end-to-end latency.
+
+_STOP = object()
+
+
+class LoopbackBus:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subs: List[Tuple[str, Any]] = []
+        # topic -> matching clients; cleared whenever subscriptions change
+        self._routes: Dict[str, List[Any]] = {}
+        self.published = 0
+
+    def subscribe(self, client: Any, topic_filter: str) -> None:
+        with self._lock:
+            self._subs.append((topic_filter, client))
+            self._routes = {}
+
+    def unsubscribe_all(self, client: Any) -> None:
+        with self._lock:
+            self._subs = [(f, c) for f, c in self._subs if c is not client]
+            self._routes = {}
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        routes = self._routes
+        clients = routes.get(topic)
+        if clients is None:
+            with self._lock:
+                clients = []
+                for topic_filter, client in self._subs:
+                    if client not in clients and topic_matches_sub(topic_filter, topic):
+                        clients.append(client)
+                self._routes[topic] = clients
+        self.published += 1
+        for client in clients:
+            client._deliver(topic, payload)
+
+
+_default_bus = LoopbackBus()
+
+
+def default_bus() -> LoopbackBus:
+    return _default_bus
+
+
+def _to_bytes(payload: Any, codec: JsonCodec) -> bytes:
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, bytearray):
+        return bytes(payload)
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    return codec.dumps(payload)
+
+
+class LoopbackClient:
+    # Same interface as MqttClient
+    def __init__(self, bus: Optional[LoopbackBus] = None, codec: Optional[JsonCodec] = None) -> None:
+        self.bus = bus or default_bus()
+        self.codec = codec or get_codec()
+        self._on_message_cb: Optional[Callable[[str, bytes], None]] = None
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._logger = logging.getLogger("mqtt")
+
+    def set_message_handler(self, handler: Callable[[str, bytes], None]) -> None:
+        self._on_message_cb = handler
+
+    def connect(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="loopback-rx", daemon=True)
+        self._thread.start()
+        self._logger.info("Loopback transport connected")
+
+    def disconnect(self) -> None:
+        self.bus.unsubscribe_all(self)
+        if self._thread is not None:
+            # Messages already queued are delivered before the thread exits
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def subscribe(self, topic: str, qos: int = 0) -> None:
+        self.bus.subscribe(self, topic)
+
+    def publish(self, topic: str, payload: Any, qos: int = 0) -> None:
+        self.bus.publish(topic, _to_bytes(payload, self.codec))
+
+    def _deliver(self, topic: str, payload: bytes) -> None:
+        self._queue.put((topic, payload))
+
+    def _run(self) -> None:
+        get = self._queue.get
+        while True:
+            item = get()
+            if item is _STOP:
+                return
+            if self._on_message_cb:
+                self._on_message_cb(*item)
+
+
+class AsyncLoopbackClient:
+    # Same interface as AsyncMqttClient: handlers run on the event loop.
+    # Deliveries from other threads are batched, so a burst costs one loop
+    # wakeup instead of one per message.
+    def __init__(self, bus: Optional[LoopbackBus] = None) -> None:
+        self.bus = bus or default_bus()
+        self._on_message_cb: Optional[Callable[[str, bytes], None]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[str, bytes]] = []
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger("mqtt")
+
+    def set_message_handler(self, handler: Callable[[str, bytes], None]) -> None:
+        self._on_message_cb = handler
+
+    async def connect(self, timeout_s: float = 10.0) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._logger.info("Loopback transport connected")
+
+    async def disconnect(self) -> None:
+        self.bus.unsubscribe_all(self)
+        self._drain()
+
+    def subscribe(self, topic: str, qos: int = 0) -> None:
+        self.bus.subscribe(self, topic)
+
+    def _deliver(self, topic: str, payload: bytes) -> None:
+        with self._lock:
+            self._pending.append((topic, payload))
+            wake = len(self._pending) == 1
+        if wake:
+            self._loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if self._on_message_cb:
+            for topic, payload in batch:
+                self._on_message_cb(topic, payload)
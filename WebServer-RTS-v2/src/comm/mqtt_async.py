@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import socket
+from typing import Any, Callable, Dict, Optional, Union
+
+import paho.mqtt.client as mqtt
+
+from src.common.config import get_cfg
+from src.comm.loopback import AsyncLoopbackClient
+
+
+class AsyncMqttClient:
+    # paho driven by the asyncio loop instead of loop_start(): the socket is
+    # registered with add_reader/add_writer and loop_misc() runs as a task,
+    # so message callbacks run on the event loop thread. Needs a selector
+    # event loop (on Windows, WindowsSelectorEventLoopPolicy).
+
+    def __init__(self, host: str, port: int, keepalive_s: int = 60) -> None:
+        self.host = host
+        self.port = port
+        self.keepalive_s = keepalive_s
+        self.client = mqtt.Client()
+        self._on_message_cb: Optional[Callable[[str, bytes], None]] = None
+        self._logger = logging.getLogger("mqtt")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._misc: Optional[asyncio.Task] = None
+        self._connected: Optional[asyncio.Future] = None
+
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def set_message_handler(self, handler: Callable[[str, bytes], None]) -> None:
+        self._on_message_cb = handler
+
+    async def connect(self, timeout_s: float = 10.0) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._connected = self._loop.create_future()
+        self.client.connect(self.host, self.port, self.keepalive_s)
+        await asyncio.wait_for(self._connected, timeout_s)
+
+    async def disconnect(self) -> None:
+        self.client.disconnect()
+        if self._misc is not None:
+            try:
+                await asyncio.wait_for(self._misc, 2.0)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+
+    def subscribe(self, topic: str, qos: int = 0) -> None:
+        self.client.subscribe(topic, qos=qos)
+
+    def _on_socket_open(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        self._loop.add_reader(sock, client.loop_read)
+        self._misc = self._loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        self._loop.remove_reader(sock)
+        if self._misc is not None:
+            self._misc.cancel()
+
+    def _on_socket_register_write(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        self._loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client: mqtt.Client, userdata: Any, sock: socket.socket) -> None:
+        self._loop.remove_writer(sock)
+
+    async def _misc_loop(self) -> None:
+        # Keepalive pings and retries; paho expects this about once a second
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1.0)
+
+    def _on_connect(self, client: mqtt.Client, userdata: Any, flags: dict, rc: int) -> None:
+        if rc == 0:
+            self._logger.info("MQTT connected")
+            if self._connected is not None and not self._connected.done():
+                self._connected.set_result(True)
+        else:
+            self._logger.warning("MQTT connect failed rc=%s", rc)
+            if self._connected is not None and not self._connected.done():
+                self._connected.set_exception(ConnectionError(f"MQTT connect failed rc={rc}"))
+
+    def _on_disconnect(self, client: mqtt.Client, userdata: Any, rc: int) -> None:
+        self._logger.warning("MQTT disconnected rc=%s", rc)
+
+    def _on_message(self, client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        if self._on_message_cb:
+            self._on_message_cb(msg.topic, msg.payload)
+
+
+def async_client_from_cfg(cfg: Dict[str, Any]) -> Union[AsyncMqttClient, AsyncLoopbackClient]:
+    # See TRANSPORTS in src.comm.mqtt_client
+    if get_cfg(cfg, "mqtt.transport", "mqtt") == "loopback":
+        return AsyncLoopbackClient()
+    return AsyncMqttClient(
+        host=get_cfg(cfg, "mqtt.host"),
+        port=int(get_cfg(cfg, "mqtt.port")),
+        keepalive_s=int(get_cfg(cfg, "mqtt.keepalive_s")),
+    )
@@ -1,16 +1,30 @@
-import json
 import logging
 import threading
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Dict, Optional, Union
 
 import paho.mqtt.client as mqtt
 
+from src.common.codec import JsonCodec, get_codec
+from src.common.config import get_cfg
+from src.comm.loopback import LoopbackClient
+
+# mqtt.transport selects what carries messages between sensor_sim and the
+# collectors:
+#
+#   mqtt      an external broker (Mosquitto) on mqtt.host:mqtt.port
+#   local     the same MQTT client, talking to the pure-Python stand-in in
+#             src.comm.local_broker (benchmark_run starts it)
+#   loopback  no socket at all: in-process queues (src.comm.loopback), for
+#             sensor_sim and a collector running in one process
+TRANSPORTS = ("mqtt", "local", "loopback")
+
 
 class MqttClient:
-    def __init__(self, host: str, port: int, keepalive_s: int = 60) -> None:
+    def __init__(self, host: str, port: int, keepalive_s: int = 60, codec: Optional[JsonCodec] = None) -> None:
         self.host = host
         self.port = port
         self.keepalive_s = keepalive_s
+        self.codec = codec or get_codec()
         self.client = mqtt.Client()
         self._on_message_cb: Optional[Callable[[str, bytes], None]] = None
         self._lock = threading.Lock()
@@ -35,8 +49,8 @@ class MqttClient:
         self.client.subscribe(topic, qos=qos)
 
     def publish(self, topic: str, payload: Any, qos: int = 0) -> None:
-        if not isinstance(payload, str):
-            payload = json.dumps(payload)
+        if not isinstance(payload, (str, bytes, bytearray)):
+            payload = self.codec.dumps(payload)
         self.client.publish(topic, payload=payload, qos=qos)
 
     def _on_connect(self, client: mqtt.Client, userdata: Any, flags: dict, rc: int) -> None:
@@ -51,3 +65,14 @@ class MqttClient:
     def _on_message(self, client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
         if self._on_message_cb:
             self._on_message_cb(msg.topic, msg.payload)
+
+
+def client_from_cfg(cfg: Dict[str, Any], codec: Optional[JsonCodec] = None) -> Union[MqttClient, LoopbackClient]:
+    if get_cfg(cfg, "mqtt.transport", "mqtt") == "loopback":
+        return LoopbackClient(codec=codec)
+    return MqttClient(
+        host=get_cfg(cfg, "mqtt.host"),
+        port=int(get_cfg(cfg, "mqtt.port")),
+        keepalive_s=int(get_cfg(cfg, "mqtt.keepalive_s")),
+        codec=codec,
+    )
@@ -0,0 +1,120 @@
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from src.common.config import get_cfg
+from src.common.models import Message
+
+try:
+    import orjson
+except Exception:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgspec
+except Exception:  # pragma: no cover
+    msgspec = None
+
+
+class JsonCodec:
+    # JSON encode/decode used by MQTT, the RTDB backends and the dashboard.
+    # dumps() always returns bytes so callers can write or publish it as is.
+    name = "stdlib"
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def decode_message(self, data: bytes) -> Message:
+        # Raises on invalid JSON; the caller logs and drops the payload
+        return Message.from_dict(self.loads(data))
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        # Non-str dict keys (e.g. ints) are stringified like json.dumps does
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+if msgspec is not None:
+
+    class _WireMessage(msgspec.Struct, rename={"msg_type": "type"}):
+        msg_id: str = ""
+        device_id: str = ""
+        msg_type: str = ""
+        t_sensor_ms: Optional[int] = None
+        t_intended_ms: Optional[int] = None
+        seq: int = 0
+        values: Dict[str, Any] = msgspec.field(default_factory=dict)
+        alarm: Optional[Dict[str, Any]] = None
+
+
+class MsgspecCodec(JsonCodec):
+    # Decodes a payload straight into typed fields, without building the
+    # top-level dict; payloads that do not match the schema (e.g. a numeric
+    # msg_id) go through the generic path instead of being rejected
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        self._message_decoder = msgspec.json.Decoder(_WireMessage)
+
+    def loads(self, data: bytes) -> Any:
+        return self._decoder.decode(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+    def decode_message(self, data: bytes) -> Message:
+        try:
+            wire = self._message_decoder.decode(data)
+        except msgspec.ValidationError:
+            return Message.from_dict(self.loads(data))
+        return Message(
+            msg_id=wire.msg_id,
+            device_id=wire.device_id,
+            msg_type=wire.msg_type,
+            t_sensor_ms=wire.t_sensor_ms,
+            seq=wire.seq,
+            values=wire.values,
+            alarm=wire.alarm,
+            t_intended_ms=wire.t_intended_ms,
+        )
+
+
+CODECS = {"stdlib": JsonCodec, "orjson": OrjsonCodec, "msgspec": MsgspecCodec}
+_AVAILABLE = {"stdlib": True, "orjson": orjson is not None, "msgspec": msgspec is not None}
+_cache: Dict[str, JsonCodec] = {}
+
+
+def available_codecs() -> Dict[str, bool]:
+    return dict(_AVAILABLE)
+
+
+def get_codec(name: str = "auto") -> JsonCodec:
+    # "auto" prefers msgspec, then orjson, then the stdlib json module
+    if name == "auto":
+        name = next(n for n in ("msgspec", "orjson", "stdlib") if _AVAILABLE[n])
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec {name!r}; expected one of {sorted(CODECS)} or 'auto'")
+    if not _AVAILABLE[name]:
+        raise ValueError(f"Codec {name!r} is not installed")
+    if name not in _cache:
+        _cache[name] = CODECS[name]()
+    return _cache[name]
+
+
+def codec_from_cfg(cfg: Dict[str, object]) -> JsonCodec:
+    name = str(get_cfg(cfg, "codec.json", "auto"))
+    if name != "auto" and not _AVAILABLE.get(name, True):
+        logging.getLogger("codec").warning("JSON codec %s is not installed, using auto", name)
+        name = "auto"
+    return get_codec(name)
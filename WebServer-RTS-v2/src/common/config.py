@@ -23,24 +23,83 @@ def _apply_defaults(cfg: Dict[str, Any]) -> Dict[str, Any]:
         "mqtt.host": "localhost",
         "mqtt.port": 1883,
         "mqtt.keepalive_s": 60,
+        "mqtt.transport": "mqtt",
         "mqtt.alert_topic": "fire_system/alert",
         "mqtt.telemetry_topic": "fire_system/sensor/data",
         "mqtt.status_topic": "fire_system/status",
         "deadlines.alarm_deadline_ms": 150,
         "deadlines.telemetry_deadline_ms": 300,
         "pipeline.inject_jitter_telemetry_ms": 0,
+        "pipeline.workers": 1,
+        "pipeline.mode": "thread",
+        "pipeline.scheduler": "fifo",
+        "pipeline.shed_expired": False,
+        "pipeline.async.shards": 64,
+        "pipeline.process.ring_kb": 4096,
+        "pipeline.process.result_batch": 256,
+        "pipeline.process.result_interval_ms": 50,
+        "pipeline.process.alarm_put_timeout_ms": 100,
         "pipeline.telemetry_queue_max": 10000,
         "pipeline.telemetry_drop_policy": "none",
         "pipeline.alarm_queue_max": 1000,
+        "pipeline.classify_batch": 1,
+        "rules.thresholds": {"temp": 60.0, "smoke": 0.7, "gas": 0.7, "flame": 1.0},
+        "rules.zones": {},
+        "rules.devices": {},
         "rtdb.mode": "mock",
         "rtdb.write_mode": "sync",
         "rtdb.mock.ack_delay_ms": 20,
+        "rtdb.sim.latency.model": "lognormal",
+        "rtdb.sim.latency.ack_delay_ms": 20,
+        "rtdb.sim.latency.median_ms": 40,
+        "rtdb.sim.latency.sigma": 0.5,
+        "rtdb.sim.latency.path": "",
+        "rtdb.sim.per_op_ms": 0.0,
+        "rtdb.sim.rate_limit.writes_per_s": 0,
+        "rtdb.sim.rate_limit.burst": 100,
+        "rtdb.sim.rate_limit.mode": "delay",
+        "rtdb.sim.stall.every_s": 0,
+        "rtdb.sim.stall.duration_ms": 2000,
+        "rtdb.sim.error_rate": 0.0,
+        "rtdb.sim.seed": 1,
+        "rtdb.alarm_write.strategy": "serial",
+        "rtdb.alarm_write.hedge.percentile": 95,
+        "rtdb.alarm_write.hedge.min_delay_ms": 5,
+        "rtdb.alarm_write.hedge.window": 256,
+        "rtdb.alarm_write.hedge.budget": 0.1,
         "rtdb.writer.flush_interval_ms": 200,
         "rtdb.writer.batch_limit": 100,
         "rtdb.writer.telemetry_drop_policy": "keep_latest",
         "rtdb.writer.telemetry_queue_max": 2000,
         "rtdb.writer.alarm_queue_max": 1000,
         "rtdb.writer.state_queue_max": 1000,
+        "rtdb.writer.scheduler": "fifo",
+        "rtdb.writer.inflight": 1,
+        "rtdb.writer.alarm_reserved": 0,
+        "rtdb.writer.wal.enabled": False,
+        "rtdb.writer.wal.dir": "wal",
+        "rtdb.writer.wal.fsync_interval_ms": 10,
+        "rtdb.writer.wal.segment_mb": 16,
+        "rtdb.writer.wal.types": ["alarm"],
+        "rtdb.writer.wal.retry.max_attempts": 5,
+        "rtdb.writer.wal.retry.backoff_ms": 50,
+        "rtdb.writer.wal.retry.backoff_max_ms": 2000,
+        "rtdb.state_cache.enabled": False,
+        "rtdb.state_cache.deadband": {"temp": 0.5, "smoke": 0.02, "gas": 0.02, "flame": 0.0},
+        "rtdb.state_cache.refresh_margin_ms": 200,
+        "codec.json": "auto",
+        "trace.format": "csv",
+        "trace.max_mb": 50,
+        "trace.flush_interval_ms": 200,
+        "trace.flush_batch": 512,
+        "trace.buffer_max": 100000,
+        "trace.fsync": "none",
+        "metrics.sketch_alpha": 0.01,
+        "metrics.window_s": 60,
+        "metrics.window_slots": 6,
+        "metrics.http.enabled": False,
+        "metrics.http.host": "127.0.0.1",
+        "metrics.http.port": 9108,
         "freshness.avi_state_ms": 2000,
         "freshness.avi_telemetry_ms": 5000,
         "freshness.avi_alarm_ms": 10000,
@@ -48,10 +107,26 @@ def _apply_defaults(cfg: Dict[str, Any]) -> Dict[str, Any]:
         "sensor_sim.alarm_rate": 0.2,
         "sensor_sim.device_count": 3,
         "sensor_sim.device_id_prefix": "esp32-",
+        "sensor_sim.wire_format": "json",
         "sensor_sim.burst_rate": 200,
         "sensor_sim.burst_duration_s": 5,
         "sensor_sim.burst_start_s": 10,
         "sensor_sim.adaptive": False,
+        "sensor_sim.processes": 1,
+        "sensor_sim.max_lag_ms": 0,
+        "sensor_sim.arrival.model": "constant",
+        "sensor_sim.arrival.seed": 1,
+        "sensor_sim.arrival.mmpp.mean_low_s": 10,
+        "sensor_sim.arrival.mmpp.mean_high_s": 2,
+        "sensor_sim.arrival.diurnal.period_s": 60,
+        "sensor_sim.arrival.replay.path": "",
+        "sensor_sim.arrival.replay.speed": 1.0,
+        "sensor_sim.fire_spread.enabled": False,
+        "sensor_sim.fire_spread.origin": 0,
+        "sensor_sim.fire_spread.start_s": 10,
+        "sensor_sim.fire_spread.spread_ms": 2000,
+        "sensor_sim.fire_spread.alarm_repeat_ms": 1000,
+        "sensor_sim.fire_spread.max_devices": 0,
         "feedback.enabled": True,
         "feedback.interval_s": 5,
         "feedback.min_freshness_ratio": 0.8,
@@ -64,6 +139,18 @@ def _apply_defaults(cfg: Dict[str, Any]) -> Dict[str, Any]:
     return cfg
 
 
+_SENSORS = ("temp", "smoke", "gas", "flame")
+
+
+def _validate_thresholds(path: str, thresholds: Any) -> None:
+    # A threshold per sensor; null disables that sensor's check
+    if not isinstance(thresholds, dict) or not set(thresholds) <= set(_SENSORS):
+        raise ConfigError(f"{path} must map any of {', '.join(_SENSORS)} to a number or null")
+    for sensor, value in thresholds.items():
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ConfigError(f"{path}.{sensor} must be a number or null")
+
+
 def _validate(cfg: Dict[str, Any]) -> None:
     required_paths = [
         "mqtt.host",
@@ -77,14 +164,116 @@ def _validate(cfg: Dict[str, Any]) -> None:
         if get_cfg(cfg, path, default=None) is None:
             raise ConfigError(f"Missing required config: {path}")
 
+    if get_cfg(cfg, "mqtt.transport", "mqtt") not in ("mqtt", "local", "loopback"):
+        raise ConfigError("mqtt.transport must be 'mqtt', 'local' or 'loopback'")
+
     rtdb_mode = get_cfg(cfg, "rtdb.mode", "mock")
-    if rtdb_mode not in ("mock", "firebase"):
-        raise ConfigError("rtdb.mode must be 'mock' or 'firebase'")
+    if rtdb_mode not in ("mock", "sim", "firebase"):
+        raise ConfigError("rtdb.mode must be 'mock', 'sim' or 'firebase'")
+    if rtdb_mode == "sim":
+        latency_model = get_cfg(cfg, "rtdb.sim.latency.model", "lognormal")
+        if latency_model not in ("constant", "lognormal", "empirical"):
+            raise ConfigError("rtdb.sim.latency.model must be 'constant', 'lognormal' or 'empirical'")
+        if latency_model == "empirical" and not get_cfg(cfg, "rtdb.sim.latency.path", ""):
+            raise ConfigError("rtdb.sim.latency.model 'empirical' needs rtdb.sim.latency.path")
+        if float(get_cfg(cfg, "rtdb.sim.latency.median_ms", 40)) <= 0:
+            raise ConfigError("rtdb.sim.latency.median_ms must be > 0")
+        if float(get_cfg(cfg, "rtdb.sim.latency.sigma", 0.5)) < 0:
+            raise ConfigError("rtdb.sim.latency.sigma must be >= 0")
+        if get_cfg(cfg, "rtdb.sim.rate_limit.mode", "delay") not in ("delay", "reject"):
+            raise ConfigError("rtdb.sim.rate_limit.mode must be 'delay' or 'reject'")
+        if not 0.0 <= float(get_cfg(cfg, "rtdb.sim.error_rate", 0.0)) <= 1.0:
+            raise ConfigError("rtdb.sim.error_rate must be between 0 and 1")
+
+    if get_cfg(cfg, "rtdb.alarm_write.strategy", "serial") not in ("serial", "batch", "hedged"):
+        raise ConfigError("rtdb.alarm_write.strategy must be 'serial', 'batch' or 'hedged'")
+    if not 0 < float(get_cfg(cfg, "rtdb.alarm_write.hedge.percentile", 95)) < 100:
+        raise ConfigError("rtdb.alarm_write.hedge.percentile must be between 0 and 100")
+    if float(get_cfg(cfg, "rtdb.alarm_write.hedge.min_delay_ms", 5)) < 0:
+        raise ConfigError("rtdb.alarm_write.hedge.min_delay_ms must be >= 0")
+    if int(get_cfg(cfg, "rtdb.alarm_write.hedge.window", 256)) < 1:
+        raise ConfigError("rtdb.alarm_write.hedge.window must be >= 1")
+    if not 0.0 <= float(get_cfg(cfg, "rtdb.alarm_write.hedge.budget", 0.1)) <= 1.0:
+        raise ConfigError("rtdb.alarm_write.hedge.budget must be between 0 and 1")
 
     write_mode = get_cfg(cfg, "rtdb.write_mode", "sync")
     if write_mode not in ("sync", "async"):
         raise ConfigError("rtdb.write_mode must be 'sync' or 'async'")
 
+    pipeline_mode = get_cfg(cfg, "pipeline.mode", "thread")
+    if pipeline_mode not in ("thread", "process"):
+        raise ConfigError("pipeline.mode must be 'thread' or 'process'")
+
+    if int(get_cfg(cfg, "pipeline.process.alarm_put_timeout_ms", 100)) < 0:
+        raise ConfigError("pipeline.process.alarm_put_timeout_ms must be >= 0")
+
+    for path in ("pipeline.scheduler", "rtdb.writer.scheduler"):
+        if get_cfg(cfg, path, "fifo") not in ("fifo", "edf"):
+            raise ConfigError(f"{path} must be 'fifo' or 'edf'")
+
+    wal_types = get_cfg(cfg, "rtdb.writer.wal.types", ["alarm"])
+    if not isinstance(wal_types, list) or not set(wal_types) <= {"alarm", "status", "telemetry"}:
+        raise ConfigError("rtdb.writer.wal.types must be a list of 'alarm', 'status' and 'telemetry'")
+    if int(get_cfg(cfg, "rtdb.writer.wal.fsync_interval_ms", 10)) < 0:
+        raise ConfigError("rtdb.writer.wal.fsync_interval_ms must be >= 0")
+    if int(get_cfg(cfg, "rtdb.writer.wal.segment_mb", 16)) < 1:
+        raise ConfigError("rtdb.writer.wal.segment_mb must be >= 1")
+    if int(get_cfg(cfg, "rtdb.writer.wal.retry.max_attempts", 5)) < 1:
+        raise ConfigError("rtdb.writer.wal.retry.max_attempts must be >= 1")
+    if int(get_cfg(cfg, "rtdb.writer.wal.retry.backoff_ms", 50)) < 0:
+        raise ConfigError("rtdb.writer.wal.retry.backoff_ms must be >= 0")
+    if int(get_cfg(cfg, "rtdb.writer.wal.retry.backoff_max_ms", 2000)) < int(
+        get_cfg(cfg, "rtdb.writer.wal.retry.backoff_ms", 50)
+    ):
+        raise ConfigError("rtdb.writer.wal.retry.backoff_max_ms must be >= rtdb.writer.wal.retry.backoff_ms")
+
+    if get_cfg(cfg, "codec.json", "auto") not in ("auto", "msgspec", "orjson", "stdlib"):
+        raise ConfigError("codec.json must be 'auto', 'msgspec', 'orjson' or 'stdlib'")
+
+    if get_cfg(cfg, "sensor_sim.wire_format", "json") not in ("json", "binary"):
+        raise ConfigError("sensor_sim.wire_format must be 'json' or 'binary'")
+    if int(get_cfg(cfg, "sensor_sim.processes", 1)) < 1:
+        raise ConfigError("sensor_sim.processes must be >= 1")
+    if float(get_cfg(cfg, "sensor_sim.max_lag_ms", 0)) < 0:
+        raise ConfigError("sensor_sim.max_lag_ms must be >= 0")
+    arrival = get_cfg(cfg, "sensor_sim.arrival.model", "constant")
+    if arrival not in ("constant", "poisson", "mmpp", "diurnal", "replay"):
+        raise ConfigError("sensor_sim.arrival.model must be 'constant', 'poisson', 'mmpp', 'diurnal' or 'replay'")
+    for key in (
+        "sensor_sim.arrival.mmpp.mean_low_s",
+        "sensor_sim.arrival.mmpp.mean_high_s",
+        "sensor_sim.arrival.diurnal.period_s",
+        "sensor_sim.arrival.replay.speed",
+        "sensor_sim.fire_spread.alarm_repeat_ms",
+    ):
+        if float(get_cfg(cfg, key, 1)) <= 0:
+            raise ConfigError(f"{key} must be > 0")
+
+    if int(get_cfg(cfg, "pipeline.classify_batch", 1)) < 1:
+        raise ConfigError("pipeline.classify_batch must be >= 1")
+    _validate_thresholds("rules.thresholds", get_cfg(cfg, "rules.thresholds", {}))
+    zones = get_cfg(cfg, "rules.zones", {}) or {}
+    if not isinstance(zones, dict):
+        raise ConfigError("rules.zones must map zone names to {devices, thresholds}")
+    for name, zone in zones.items():
+        devices = zone.get("devices") if isinstance(zone, dict) else None
+        if not isinstance(devices, list) or not all(isinstance(d, str) for d in devices):
+            raise ConfigError(f"rules.zones.{name}.devices must be a list of device ids or patterns")
+        _validate_thresholds(f"rules.zones.{name}.thresholds", zone.get("thresholds") or {})
+    devices = get_cfg(cfg, "rules.devices", {}) or {}
+    if not isinstance(devices, dict):
+        raise ConfigError("rules.devices must map device ids to thresholds")
+    for device_id, thresholds in devices.items():
+        _validate_thresholds(f"rules.devices.{device_id}", thresholds)
+
+    trace_format = get_cfg(cfg, "trace.format", "csv")
+    if trace_format not in ("csv", "binary", "both"):
+        raise ConfigError("trace.format must be 'csv', 'binary' or 'both'")
+
+    fsync = get_cfg(cfg, "trace.fsync", "none")
+    if fsync not in ("none", "flush", "close"):
+        raise ConfigError("trace.fsync must be 'none', 'flush' or 'close'")
+
 
 def load_config(path: str) -> Dict[str, Any]:
     if not os.path.exists(path):
@@ -105,3 +294,20 @@ def get_cfg(cfg: Dict[str, Any], path: str, default: Any = None) -> Any:
             return default
         cur = cur[part]
     return cur
+
+
+def set_cfg(cfg: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split(".")
+    cur = cfg
+    for p in parts[:-1]:
+        if p not in cur or not isinstance(cur[p], dict):
+            cur[p] = {}
+        cur = cur[p]
+    cur[parts[-1]] = value
+
+
+def validate_config(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    # For configs built in memory (e.g. with overrides) rather than loaded
+    data = _apply_defaults(cfg)
+    _validate(data)
+    return data
@@ -1,13 +1,15 @@
-from typing import Iterable, List, Optional
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
 
 def _sorted(values: Iterable[float]) -> List[float]:
     return sorted([v for v in values if v is not None])
 
 
-def percentile(values: Iterable[float], p: float) -> Optional[float]:
-    vals = _sorted(values)
-    if not vals:
+def percentile_sorted(vals: Sequence[float], p: float) -> Optional[float]:
+    # vals must already be sorted ascending with None removed (list or 1-D array)
+    if len(vals) == 0:
         return None
     if p <= 0:
         return vals[0]
@@ -22,14 +24,27 @@ def percentile(values: Iterable[float], p: float) -> Optional[float]:
     return vals[f] + (vals[c] - vals[f]) * d
 
 
-def jitter(values: Iterable[float]) -> Optional[float]:
-    p50 = percentile(values, 50)
-    p99 = percentile(values, 99)
+def percentile(values: Iterable[float], p: float) -> Optional[float]:
+    return percentile_sorted(_sorted(values), p)
+
+
+def percentiles(values: Iterable[float], ps: Iterable[float]) -> Dict[float, Optional[float]]:
+    vals = _sorted(values)
+    return {p: percentile_sorted(vals, p) for p in ps}
+
+
+def jitter_sorted(vals: Sequence[float]) -> Optional[float]:
+    p50 = percentile_sorted(vals, 50)
+    p99 = percentile_sorted(vals, 99)
     if p50 is None or p99 is None:
         return None
     return p99 - p50
 
 
+def jitter(values: Iterable[float]) -> Optional[float]:
+    return jitter_sorted(_sorted(values))
+
+
 def miss_rate(values: Iterable[float], deadline_ms: float) -> Optional[float]:
     vals = [v for v in values if v is not None]
     if not vals:
@@ -44,3 +59,233 @@ def freshness_ratio(flags: Iterable[int]) -> Optional[float]:
         return None
     fresh = sum(1 for v in vals if v == 1)
     return fresh / len(vals)
+
+
+class LatencySketch:
+    # Log-bucketed histogram (DDSketch-style): every value lands in a bucket whose
+    # representative is within `alpha` relative error, so quantiles keep that
+    # accuracy while memory grows only with log(max/min). Merging two sketches
+    # with the same alpha is exact (bucket counts add).
+
+    def __init__(self, alpha: float = 0.01, min_value: float = 1e-3, deadlines: Iterable[float] = ()) -> None:
+        if not 0 < alpha < 1:
+            raise ValueError("alpha must be in (0, 1)")
+        self.alpha = alpha
+        self.min_value = min_value
+        self._gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self._gamma)
+        self._pos: Dict[int, int] = {}
+        self._neg: Dict[int, int] = {}
+        self._zero = 0
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        # Exact over-deadline counters for deadlines known up front
+        self._over: Dict[float, int] = {float(d): 0 for d in deadlines}
+
+    def _index(self, v: float) -> int:
+        return int(math.ceil(math.log(v) / self._log_gamma))
+
+    def _value(self, idx: int) -> float:
+        return 2.0 * self._gamma ** idx / (self._gamma + 1)
+
+    def add(self, value: Optional[float], n: int = 1) -> None:
+        if value is None:
+            return
+        if value > self.min_value:
+            i = self._index(value)
+            self._pos[i] = self._pos.get(i, 0) + n
+        elif value < -self.min_value:
+            i = self._index(-value)
+            self._neg[i] = self._neg.get(i, 0) + n
+        else:
+            self._zero += n
+        self.count += n
+        self.total += value * n
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        for d in self._over:
+            if value > d:
+                self._over[d] += n
+
+    def merge(self, other: "LatencySketch") -> None:
+        if other.alpha != self.alpha or other.min_value != self.min_value:
+            raise ValueError("Cannot merge sketches with different alpha/min_value")
+        for src, dst in ((other._pos, self._pos), (other._neg, self._neg)):
+            for i, c in src.items():
+                dst[i] = dst.get(i, 0) + c
+        self._zero += other._zero
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        # Only deadlines tracked by both sides stay exact
+        self._over = {d: c + other._over[d] for d, c in self._over.items() if d in other._over}
+
+    def copy(self) -> "LatencySketch":
+        # dict() copies are atomic under the GIL, so a reader can snapshot a
+        # sketch that another thread is still adding to without locking
+        out = LatencySketch(self.alpha, self.min_value)
+        out._pos = dict(self._pos)
+        out._neg = dict(self._neg)
+        out._over = dict(self._over)
+        out._zero = self._zero
+        out.count = self.count
+        out.total = self.total
+        out.min = self.min
+        out.max = self.max
+        return out
+
+    def _buckets(self) -> List[Tuple[float, int]]:
+        out = [(-self._value(i), self._neg[i]) for i in sorted(self._neg, reverse=True)]
+        if self._zero:
+            out.append((0.0, self._zero))
+        out.extend((self._value(i), self._pos[i]) for i in sorted(self._pos))
+        return out
+
+    def percentile(self, p: float) -> Optional[float]:
+        return self.percentiles([p])[p]
+
+    def percentiles(self, ps: Iterable[float]) -> Dict[float, Optional[float]]:
+        ps = list(ps)
+        if self.count == 0:
+            return {p: None for p in ps}
+        buckets = self._buckets()
+        out: Dict[float, Optional[float]] = {}
+        for p in ps:
+            if p <= 0:
+                out[p] = self.min
+                continue
+            if p >= 100:
+                out[p] = self.max
+                continue
+            # Same rank definition as percentile(): (n - 1) * p
+            rank = (self.count - 1) * (p / 100.0)
+            seen = 0
+            value = buckets[-1][0]
+            for v, c in buckets:
+                seen += c
+                if seen > rank:
+                    value = v
+                    break
+            out[p] = min(max(value, self.min), self.max)
+        return out
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def miss_rate(self, deadline_ms: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        exact = self._over.get(float(deadline_ms))
+        if exact is not None:
+            return exact / self.count
+        # Untracked deadline: estimate from bucket representatives
+        misses = sum(c for v, c in self._buckets() if v > deadline_ms)
+        return misses / self.count
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "alpha": self.alpha,
+            "min_value": self.min_value,
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min,
+            "max": self.max,
+            "zero": self._zero,
+            "pos": {str(i): c for i, c in self._pos.items()},
+            "neg": {str(i): c for i, c in self._neg.items()},
+            "over": {repr(d): c for d, c in self._over.items()},
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, object]) -> "LatencySketch":
+        sketch = LatencySketch(float(data["alpha"]), float(data.get("min_value", 1e-3)))
+        sketch.count = int(data.get("count", 0))
+        sketch.total = float(data.get("sum", 0.0))
+        sketch.min = data.get("min")
+        sketch.max = data.get("max")
+        sketch._zero = int(data.get("zero", 0))
+        sketch._pos = {int(i): int(c) for i, c in (data.get("pos") or {}).items()}
+        sketch._neg = {int(i): int(c) for i, c in (data.get("neg") or {}).items()}
+        sketch._over = {float(d): int(c) for d, c in (data.get("over") or {}).items()}
+        return sketch
+
+
+class RollingSketch:
+    # Sliding window of `slots` sketches, each covering `window_s / slots` seconds.
+    # add() is meant for a single writer thread; snapshot() may run on any thread.
+
+    def __init__(
+        self,
+        window_s: float = 60.0,
+        slots: int = 6,
+        alpha: float = 0.01,
+        deadlines: Iterable[float] = (),
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.alpha = alpha
+        self.deadlines = tuple(deadlines)
+        self._slot_s = max(0.001, window_s / max(1, slots))
+        self._clock = clock
+        self._ids: List[int] = [-1] * max(1, slots)
+        self._ring: List[LatencySketch] = [LatencySketch(alpha, deadlines=self.deadlines) for _ in self._ids]
+
+    def add(self, value: Optional[float]) -> None:
+        slot_id = int(self._clock() / self._slot_s)
+        pos = slot_id % len(self._ring)
+        if self._ids[pos] != slot_id:
+            # Publish a fresh sketch with one reference swap
+            self._ring[pos] = LatencySketch(self.alpha, deadlines=self.deadlines)
+            self._ids[pos] = slot_id
+        self._ring[pos].add(value)
+
+    def snapshot(self) -> LatencySketch:
+        now_id = int(self._clock() / self._slot_s)
+        out = LatencySketch(self.alpha, deadlines=self.deadlines)
+        for slot_id, sketch in zip(list(self._ids), list(self._ring)):
+            if 0 <= now_id - slot_id < len(self._ring):
+                out.merge(sketch.copy())
+        return out
+
+
+class SketchSet:
+    # Named LatencySketch instances (e.g. per msg_type or per device) sharing one config
+
+    def __init__(self, alpha: float = 0.01, min_value: float = 1e-3, deadlines: Iterable[float] = ()) -> None:
+        self.alpha = alpha
+        self.min_value = min_value
+        self.deadlines = tuple(deadlines)
+        self.sketches: Dict[str, LatencySketch] = {}
+
+    def get(self, key: str) -> LatencySketch:
+        sketch = self.sketches.get(key)
+        if sketch is None:
+            sketch = LatencySketch(self.alpha, self.min_value, self.deadlines)
+            self.sketches[key] = sketch
+        return sketch
+
+    def add(self, key: str, value: Optional[float]) -> None:
+        self.get(key).add(value)
+
+    def merge(self, other: "SketchSet") -> None:
+        for key, sketch in other.sketches.items():
+            self.get(key).merge(sketch)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {key: sketch.to_dict() for key, sketch in sorted(self.sketches.items())}
+
+    @staticmethod
+    def from_dict(data: Dict[str, object]) -> "SketchSet":
+        out = SketchSet()
+        for key, raw in data.items():
+            sketch = LatencySketch.from_dict(raw)
+            out.alpha, out.min_value = sketch.alpha, sketch.min_value
+            out.deadlines = tuple(sketch._over)
+            out.sketches[key] = sketch
+        return out
@@ -1,8 +1,10 @@
-from dataclasses import dataclass, field
-from typing import Any, Dict, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
 
 
-@dataclass
+# Both models are slotted: no per-instance __dict__, and the collector keeps
+# one Message per received payload that every stage fills in place
+@dataclass(slots=True)
 class Message:
     msg_id: str
     device_id: str
@@ -11,21 +13,46 @@ class Message:
     seq: int
     values: Dict[str, Any]
     alarm: Optional[Dict[str, Any]] = None
+    # When the sender meant to send (sensor_sim's schedule); t_sensor_ms is
+    # when it actually did. None for senders without a schedule.
+    t_intended_ms: Optional[int] = None
+
+    # Collector-side timestamps and results, set as the message moves from
+    # receive through rules to the DB write and dashboard emit
+    t_pc_rx_ms: int = 0
+    t_proc_start_ms: int = 0
+    t_proc_end_ms: int = 0
+    t_db_enqueue_ms: Optional[int] = None
+    t_dashboard_emit_ms: Optional[int] = None
+    severity: str = ""
+    notes: str = ""
+    shed: bool = False
+    # Recovered from the DB writer's WAL: sent by an earlier run, so it is
+    # written but gets no ack, DB time or trace row in this one
+    replayed: bool = False
+    worker: int = -1
+
+    def deadline_at(self, deadline_ms: int) -> int:
+        # Absolute deadline; falls back to receive time when the sensor sent no timestamp
+        return (self.t_sensor_ms or self.t_pc_rx_ms) + deadline_ms
 
     @staticmethod
     def from_dict(data: Dict[str, Any]) -> "Message":
+        values = data.get("values")
         return Message(
             msg_id=str(data.get("msg_id", "")),
             device_id=str(data.get("device_id", "")),
             msg_type=str(data.get("type", "")),
             t_sensor_ms=data.get("t_sensor_ms"),
             seq=int(data.get("seq", 0)),
-            values=dict(data.get("values") or {}),
+            # A freshly decoded payload owns its dict, no copy needed
+            values=values if isinstance(values, dict) else dict(values or {}),
             alarm=data.get("alarm"),
+            t_intended_ms=data.get("t_intended_ms"),
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class TraceEvent:
     msg_id: str
     device_id: str
@@ -39,6 +66,25 @@ class TraceEvent:
     deadline_ms: int
     avi_ms: int
     notes: str = ""
+    t_intended_ms: Optional[int] = None
+
+    def to_values(self) -> List[Any]:
+        # Column order of trace.EVENT_FIELDS; missing timestamps are ""
+        return [
+            self.msg_id,
+            self.device_id,
+            self.msg_type,
+            self.t_sensor_ms if self.t_sensor_ms is not None else "",
+            self.t_intended_ms if self.t_intended_ms is not None else "",
+            self.t_pc_rx_ms,
+            self.t_proc_start_ms,
+            self.t_proc_end_ms,
+            self.t_db_enqueue_ms if self.t_db_enqueue_ms is not None else "",
+            self.t_dashboard_emit_ms if self.t_dashboard_emit_ms is not None else "",
+            self.deadline_ms,
+            self.avi_ms,
+            self.notes,
+        ]
 
     def to_row(self) -> Dict[str, Any]:
         return {
@@ -46,6 +92,7 @@ class TraceEvent:
             "device_id": self.device_id,
             "msg_type": self.msg_type,
             "t_sensor_ms": self.t_sensor_ms if self.t_sensor_ms is not None else "",
+            "t_intended_ms": self.t_intended_ms if self.t_intended_ms is not None else "",
             "t_pc_rx_ms": self.t_pc_rx_ms,
             "t_proc_start_ms": self.t_proc_start_ms,
             "t_proc_end_ms": self.t_proc_end_ms,
@@ -0,0 +1,217 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+
+PRIORITY_CLASSES = ("alarm", "status", "telemetry")
+
+
+class _ClassBuffers:
+    # Per-class storage shared by the threaded and asyncio queues: a deque per
+    # class, or a (deadline, seq) heap per class when edf=True
+
+    def __init__(self, capacities: Dict[str, int], classes: Sequence[str], edf: bool) -> None:
+        self.classes = tuple(classes)
+        self.edf = edf
+        self._capacity = {c: int(capacities.get(c, 0)) for c in self.classes}
+        self._fifo: Dict[str, Deque[object]] = {c: deque() for c in self.classes}
+        self._heap: Dict[str, List[Tuple[float, int, object]]] = {c: [] for c in self.classes}
+        self._seq = itertools.count()
+
+    def _size(self, cls: str) -> int:
+        return len(self._heap[cls]) if self.edf else len(self._fifo[cls])
+
+    def _full(self, cls: str) -> bool:
+        cap = self._capacity[cls]
+        return cap > 0 and self._size(cls) >= cap
+
+    def _push(self, cls: str, item: object, deadline: Optional[float]) -> None:
+        if self.edf:
+            key = float("inf") if deadline is None else deadline
+            heapq.heappush(self._heap[cls], (key, next(self._seq), item))
+        else:
+            self._fifo[cls].append(item)
+
+    def _pop(self, cls: str) -> object:
+        if self.edf:
+            return heapq.heappop(self._heap[cls])[2]
+        return self._fifo[cls].popleft()
+
+    def _pop_first(self, classes: Sequence[str]) -> Optional[Tuple[str, object]]:
+        for cls in classes:
+            if self._size(cls):
+                return cls, self._pop(cls)
+        return None
+
+    def depth(self, cls: str) -> int:
+        # Lock-free read for gauges; len() of a deque/list is atomic
+        return self._size(cls)
+
+    def depths(self) -> Dict[str, int]:
+        return {c: self._size(c) for c in self.classes}
+
+    def __len__(self) -> int:
+        return sum(self._size(c) for c in self.classes)
+
+
+class SchedQueue(_ClassBuffers):
+    # Bounded multi-class queue behind a single condition variable. get() always
+    # serves the highest non-empty class (order of `classes`) and wakes as soon
+    # as anything is put, so an alarm never waits behind a telemetry timeout.
+    # With edf=True each class is ordered by the deadline passed to put()
+    # (earliest first, FIFO among equal deadlines) instead of arrival order.
+
+    def __init__(
+        self,
+        capacities: Dict[str, int],
+        classes: Sequence[str] = PRIORITY_CLASSES,
+        edf: bool = False,
+    ) -> None:
+        super().__init__(capacities, classes, edf)
+        self._cond = threading.Condition(threading.Lock())
+        self._blocked_putters = 0
+        self._filtered_getters = 0
+        self._closed = False
+
+    def _notify_put(self) -> None:
+        # Getters and blocked putters share the condition; wake everyone only
+        # when notify() could pick a waiter that cannot take the new item
+        if self._blocked_putters or self._filtered_getters:
+            self._cond.notify_all()
+        else:
+            self._cond.notify()
+
+    def put(self, cls: str, item: object, deadline: Optional[float] = None) -> bool:
+        # Blocks while the class is full; returns False only once closed
+        with self._cond:
+            while self._full(cls) and not self._closed:
+                self._blocked_putters += 1
+                try:
+                    self._cond.wait()
+                finally:
+                    self._blocked_putters -= 1
+            if self._closed:
+                return False
+            self._push(cls, item, deadline)
+            self._notify_put()
+            return True
+
+    def offer(self, cls: str, item: object, deadline: Optional[float] = None) -> bool:
+        with self._cond:
+            if self._closed or self._full(cls):
+                return False
+            self._push(cls, item, deadline)
+            self._notify_put()
+            return True
+
+    def put_evict(self, cls: str, item: object, deadline: Optional[float] = None) -> Optional[object]:
+        # Never blocks: when the class is full its head (oldest, or earliest
+        # deadline under EDF) is evicted and returned to make room
+        with self._cond:
+            evicted = self._pop(cls) if self._full(cls) else None
+            self._push(cls, item, deadline)
+            self._notify_put()
+            return evicted
+
+    def get(
+        self, timeout: Optional[float] = None, only: Optional[Sequence[str]] = None
+    ) -> Optional[Tuple[str, object]]:
+        # Returns (class, item), or None on timeout or once closed and drained.
+        # `only` restricts this call to a subset of classes (e.g. reserved
+        # alarm workers)
+        classes = self.classes if only is None else tuple(c for c in self.classes if c in only)
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                entry = self._pop_first(classes)
+                if entry is not None:
+                    if self._blocked_putters:
+                        self._cond.notify_all()
+                    return entry
+                if self._closed:
+                    return None
+                remaining = None
+                if end is not None:
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                if only is not None:
+                    self._filtered_getters += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    if only is not None:
+                        self._filtered_getters -= 1
+
+    def get_many(self, cls: str, limit: int) -> List[object]:
+        # Up to `limit` items of one class, without waiting and under a single
+        # lock acquisition (micro-batching consumers)
+        with self._cond:
+            items = [self._pop(cls) for _ in range(min(limit, self._size(cls)))]
+            if items and self._blocked_putters:
+                self._cond.notify_all()
+            return items
+
+    def wake(self) -> None:
+        # Lets a consumer waiting in get() re-check state kept outside the queue
+        with self._cond:
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class AsyncSchedQueue(_ClassBuffers):
+    # asyncio twin of SchedQueue for a single event loop. Producers run on the
+    # loop (e.g. an MQTT callback) and cannot wait, so there is no blocking
+    # put: push() ignores the capacity, offer()/put_evict() respect it.
+
+    def __init__(
+        self,
+        capacities: Dict[str, int],
+        classes: Sequence[str] = PRIORITY_CLASSES,
+        edf: bool = False,
+    ) -> None:
+        super().__init__(capacities, classes, edf)
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def push(self, cls: str, item: object, deadline: Optional[float] = None) -> None:
+        self._push(cls, item, deadline)
+        self._ready.set()
+
+    def offer(self, cls: str, item: object, deadline: Optional[float] = None) -> bool:
+        if self._closed or self._full(cls):
+            return False
+        self.push(cls, item, deadline)
+        return True
+
+    def put_evict(self, cls: str, item: object, deadline: Optional[float] = None) -> Optional[object]:
+        evicted = self._pop(cls) if self._full(cls) else None
+        self.push(cls, item, deadline)
+        return evicted
+
+    def get_nowait(self, only: Optional[Sequence[str]] = None) -> Optional[Tuple[str, object]]:
+        # (class, item) from `only` (default: every class), or None if empty
+        return self._pop_first(self.classes if only is None else tuple(c for c in self.classes if c in only))
+
+    async def get(self) -> Optional[Tuple[str, object]]:
+        # Returns (class, item), or None once closed and drained
+        while True:
+            entry = self._pop_first(self.classes)
+            if entry is not None:
+                return entry
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+
+    def close(self) -> None:
+        self._closed = True
+        self._ready.set()
@@ -1,7 +1,13 @@
 import csv
+import io
 import os
 import threading
-from typing import Dict, Optional
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from src.common.config import get_cfg
+from src.common.models import TraceEvent
 
 
 EVENT_FIELDS = [
@@ -9,6 +15,7 @@ EVENT_FIELDS = [
     "device_id",
     "msg_type",
     "t_sensor_ms",
+    "t_intended_ms",
     "t_pc_rx_ms",
     "t_proc_start_ms",
     "t_proc_end_ms",
@@ -24,60 +31,235 @@ ACK_FIELDS = [
     "t_db_ack_ms",
 ]
 
+FSYNC_POLICIES = ("none", "flush", "close")
+
 
-class TraceWriter:
-    def __init__(self, path: str, max_mb: int = 50) -> None:
+class BufferedWriter(ABC):
+    def __init__(
+        self,
+        path: str,
+        max_mb: int = 50,
+        flush_interval_ms: int = 200,
+        flush_batch: int = 512,
+        buffer_max: int = 100000,
+        fsync: str = "none",
+        background: bool = True,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
         self.path = path
         self.max_bytes = max_mb * 1024 * 1024
-        self._lock = threading.Lock()
+        self._flush_interval_s = max(1, flush_interval_ms) / 1000.0
+        self._flush_batch = max(1, flush_batch)
+        self._buffer_max = max(self._flush_batch, buffer_max)
+        self._fsync = fsync
+
+        self._buffer: Deque[object] = deque()
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._closed = False
+
+        self.rows_written = 0
+        self.flush_count = 0
+        self.rotations = 0
+        self.inline_flushes = 0
+        self.dropped_after_close = 0
+
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        self._ensure_header()
+        # Rows are appended to an existing trace only if it has this writer's
+        # column layout; one written with another layout is rotated away
+        if not self._header_matches():
+            self._rotate_out()
+        self._file = open(self.path, "ab")
+        self._bytes = self._file.tell()
+        if self._bytes == 0:
+            self._write_header()
+
+        # Without the flusher thread the owner calls flush() itself (the
+        # asyncio collector does so from an executor)
+        self._thread: Optional[threading.Thread] = None
+        if background:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _append(self, row: object) -> None:
+        if self._closed:
+            # Nothing would ever flush it; late rows (writes still finishing
+            # at shutdown) are counted instead of buffered forever
+            self.dropped_after_close += 1
+            return
+        # deque.append is atomic, so the hot path takes no lock
+        self._buffer.append(row)
+        pending = len(self._buffer)
+        if pending >= self._buffer_max:
+            # Buffer is full: apply backpressure instead of losing trace rows
+            self.inline_flushes += 1
+            self.flush()
+        elif pending >= self._flush_batch:
+            self._wake.set()
+
+    @abstractmethod
+    def _encode(self, rows: List[object]) -> bytes:
+        raise NotImplementedError
 
-    def _ensure_header(self) -> None:
-        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
-            with open(self.path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=EVENT_FIELDS)
-                writer.writeheader()
+    @abstractmethod
+    def _header(self) -> bytes:
+        raise NotImplementedError
 
-    def write_event(self, row: Dict[str, object]) -> None:
-        with self._lock:
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            self._wake.wait(self._flush_interval_s)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._io_lock:
+            if self._file is None or not self._buffer:
+                return
+            rows: List[object] = []
+            while self._buffer:
+                try:
+                    rows.append(self._buffer.popleft())
+                except IndexError:
+                    break
+            data = self._encode(rows)
+            self._file.write(data)
+            self._file.flush()
+            if self._fsync == "flush":
+                os.fsync(self._file.fileno())
+            self._bytes += len(data)
+            self.rows_written += len(rows)
+            self.flush_count += 1
             self._maybe_rotate()
-            with open(self.path, "a", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=EVENT_FIELDS)
-                writer.writerow(row)
 
-    def _maybe_rotate(self) -> None:
-        if self.max_bytes <= 0:
-            return
-        if not os.path.exists(self.path):
-            return
-        if os.path.getsize(self.path) <= self.max_bytes:
-            return
+    def close(self) -> None:
+        self._closed = True
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self.flush()
+        with self._io_lock:
+            if self._file is None:
+                return
+            if self._fsync != "none":
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def _write_header(self) -> None:
+        data = self._header()
+        self._file.write(data)
+        self._file.flush()
+        self._bytes += len(data)
 
-        # Rotate file when it exceeds max_bytes
+    def _header_matches(self) -> bool:
+        expected = self._header()
+        try:
+            with open(self.path, "rb") as f:
+                head = f.read(len(expected))
+        except FileNotFoundError:
+            return True
+        return not head or head == expected
+
+    def _rotate_out(self) -> None:
         rotated = f"{self.path}.1"
         if os.path.exists(rotated):
             os.remove(rotated)
         os.rename(self.path, rotated)
-        self._ensure_header()
+        self.rotations += 1
+
+    def _maybe_rotate(self) -> None:
+        if self.max_bytes <= 0 or self._bytes <= self.max_bytes:
+            return
 
+        # Rotate file when it exceeds max_bytes (tracked, no stat per write)
+        self._file.close()
+        self._rotate_out()
+        self._file = open(self.path, "ab")
+        self._bytes = 0
+        self._write_header()
 
-class AckWriter:
-    def __init__(self, path: str) -> None:
-        self.path = path
-        self._lock = threading.Lock()
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        self._ensure_header()
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._buffer),
+            "rows_written": self.rows_written,
+            "flush_count": self.flush_count,
+            "rotations": self.rotations,
+            "inline_flushes": self.inline_flushes,
+            "dropped_after_close": self.dropped_after_close,
+        }
+
+
+class _BufferedCsvWriter(BufferedWriter):
+    def __init__(self, path: str, fields: List[str], *args: object, **kwargs: object) -> None:
+        self.fields = fields
+        super().__init__(path, *args, **kwargs)
+
+    @abstractmethod
+    def _row_values(self, row: object) -> List[object]:
+        raise NotImplementedError
+
+    def _encode(self, rows: List[object]) -> bytes:
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\r\n")
+        for row in rows:
+            writer.writerow(self._row_values(row))
+        return out.getvalue().encode("utf-8")
+
+    def _header(self) -> bytes:
+        out = io.StringIO()
+        csv.writer(out, lineterminator="\r\n").writerow(self.fields)
+        return out.getvalue().encode("utf-8")
 
-    def _ensure_header(self) -> None:
-        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
-            with open(self.path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=ACK_FIELDS)
-                writer.writeheader()
+
+class TraceWriter(_BufferedCsvWriter):
+    def __init__(
+        self,
+        path: str,
+        max_mb: int = 50,
+        flush_interval_ms: int = 200,
+        flush_batch: int = 512,
+        buffer_max: int = 100000,
+        fsync: str = "none",
+        background: bool = True,
+    ) -> None:
+        super().__init__(path, EVENT_FIELDS, max_mb, flush_interval_ms, flush_batch, buffer_max, fsync, background)
+
+    def write_event(self, event: TraceEvent) -> None:
+        # The event itself is buffered; columns are only built at flush
+        self._append(event)
+
+    def _row_values(self, row: object) -> List[object]:
+        return row.to_values()
+
+
+class AckWriter(_BufferedCsvWriter):
+    def __init__(
+        self,
+        path: str,
+        max_mb: int = 0,
+        flush_interval_ms: int = 200,
+        flush_batch: int = 512,
+        buffer_max: int = 100000,
+        fsync: str = "none",
+        background: bool = True,
+    ) -> None:
+        super().__init__(path, ACK_FIELDS, max_mb, flush_interval_ms, flush_batch, buffer_max, fsync, background)
 
     def write_ack(self, msg_id: str, t_db_ack_ms: Optional[int]) -> None:
         ack_value = t_db_ack_ms if t_db_ack_ms is not None else -1
-        with self._lock:
-            with open(self.path, "a", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=ACK_FIELDS)
-                writer.writerow({"msg_id": msg_id, "t_db_ack_ms": ack_value})
+        self._append((msg_id, ack_value))
+
+    def _row_values(self, row: object) -> List[object]:
+        return list(row)
+
+
+def writer_kwargs(cfg: Dict[str, object]) -> Dict[str, object]:
+    return {
+        "flush_interval_ms": int(get_cfg(cfg, "trace.flush_interval_ms", 200)),
+        "flush_batch": int(get_cfg(cfg, "trace.flush_batch", 512)),
+        "buffer_max": int(get_cfg(cfg, "trace.buffer_max", 100000)),
+        "fsync": str(get_cfg(cfg, "trace.fsync", "none")),
+    }
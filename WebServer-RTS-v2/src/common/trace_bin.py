@@ -0,0 +1,265 @@
+import csv
+import os
+import struct
+import threading
+from abc import abstractmethod
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.common.config import get_cfg
+from src.common.models import TraceEvent
+from src.common.trace import ACK_FIELDS, EVENT_FIELDS, AckWriter, BufferedWriter, TraceWriter, writer_kwargs
+
+try:
+    import numpy as np
+except Exception:  # pragma: no cover
+    np = None
+
+
+EVENTS_BIN = "trace_events.bin"
+ACKS_BIN = "trace_db_ack.bin"
+STRINGS_FILE = "trace_strings.txt"
+
+MAGIC = b"RTSTRC1\n"
+HEADER_SIZE = 16
+NULL_I64 = -(2 ** 63)
+
+# String columns hold an index into the shared string table
+STRING_FIELDS = ("msg_id", "device_id", "msg_type", "notes")
+
+EVENT_STRUCT = struct.Struct("<" + "q" * len(EVENT_FIELDS))
+ACK_STRUCT = struct.Struct("<" + "q" * len(ACK_FIELDS))
+
+
+class StringTable:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._pending: List[str] = []
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            for s in load_strings(path):
+                self._index.setdefault(s, len(self._index))
+        self._file = open(path, "a", encoding="utf-8", newline="\n")
+
+    def intern(self, value: object) -> int:
+        s = "" if value is None else str(value).replace("\n", " ")
+        idx = self._index.get(s)
+        if idx is not None:
+            return idx
+        with self._lock:
+            idx = self._index.get(s)
+            if idx is None:
+                idx = len(self._index)
+                self._index[s] = idx
+                self._pending.append(s)
+            return idx
+
+    def flush(self) -> None:
+        # Must run before any record referencing a new index reaches disk
+        with self._lock:
+            if self._file is None or not self._pending:
+                return
+            self._file.write("".join(s + "\n" for s in self._pending))
+            self._file.flush()
+            self._pending = []
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _to_i64(value: object) -> int:
+    if value is None or value == "":
+        return NULL_I64
+    return int(value)
+
+
+class _BinaryWriter(BufferedWriter):
+    def __init__(self, path: str, fields: List[str], rec: struct.Struct, strings: StringTable, **kwargs: object) -> None:
+        self.fields = fields
+        self._rec = rec
+        self._strings = strings
+        self._str_cols = [i for i, k in enumerate(fields) if k in STRING_FIELDS]
+        # Rotation would orphan records from the string table they index into
+        kwargs["max_mb"] = 0
+        super().__init__(path, **kwargs)
+
+    def _header(self) -> bytes:
+        return MAGIC + struct.pack("<q", len(self.fields))
+
+    @abstractmethod
+    def _row_values(self, row: object) -> List[object]:
+        raise NotImplementedError
+
+    def _encode(self, rows: List[object]) -> bytes:
+        out = bytearray()
+        pack = self._rec.pack
+        intern = self._strings.intern
+        str_cols = self._str_cols
+        for row in rows:
+            values = self._row_values(row)
+            for i in str_cols:
+                values[i] = intern(values[i])
+            out += pack(*[_to_i64(v) for v in values])
+        self._strings.flush()
+        return bytes(out)
+
+
+class BinaryTraceWriter(_BinaryWriter):
+    def __init__(self, path: str, strings: StringTable, **kwargs: object) -> None:
+        super().__init__(path, EVENT_FIELDS, EVENT_STRUCT, strings, **kwargs)
+
+    def write_event(self, event: TraceEvent) -> None:
+        self._append(event)
+
+    def _row_values(self, row: object) -> List[object]:
+        return row.to_values()
+
+
+class BinaryAckWriter(_BinaryWriter):
+    def __init__(self, path: str, strings: StringTable, **kwargs: object) -> None:
+        super().__init__(path, ACK_FIELDS, ACK_STRUCT, strings, **kwargs)
+
+    def write_ack(self, msg_id: str, t_db_ack_ms: Optional[int]) -> None:
+        ack_value = t_db_ack_ms if t_db_ack_ms is not None else -1
+        self._append((msg_id, ack_value))
+
+    def _row_values(self, row: object) -> List[object]:
+        return list(row)
+
+
+def load_strings(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8", newline="\n") as f:
+        return [line[:-1] if line.endswith("\n") else line for line in f]
+
+
+def _check_header(path: str, fields: List[str]) -> None:
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[:8] != MAGIC:
+        raise ValueError(f"Not a binary trace file: {path}")
+    (ncols,) = struct.unpack("<q", header[8:])
+    if ncols != len(fields):
+        raise ValueError(f"Unexpected column count {ncols} in {path}")
+
+
+def _memmap(path: str, fields: List[str]):
+    if np is None:
+        raise RuntimeError("numpy is required to memory-map binary traces")
+    _check_header(path, fields)
+    dtype = np.dtype([(k, "<i8") for k in fields])
+    nbytes = os.path.getsize(path) - HEADER_SIZE
+    count = nbytes // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    # A partially flushed trailing record is ignored
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def load_binary_trace(results_dir: str):
+    # Structured int64 views; columns are zero-copy (strided) slices of the mapping
+    events = _memmap(os.path.join(results_dir, EVENTS_BIN), EVENT_FIELDS)
+    ack_path = os.path.join(results_dir, ACKS_BIN)
+    if os.path.exists(ack_path):
+        acks = _memmap(ack_path, ACK_FIELDS)
+    else:
+        acks = np.zeros(0, dtype=np.dtype([(k, "<i8") for k in ACK_FIELDS]))
+    strings = load_strings(os.path.join(results_dir, STRINGS_FILE))
+    return events, acks, strings
+
+
+def has_binary_trace(results_dir: str) -> bool:
+    return os.path.exists(os.path.join(results_dir, EVENTS_BIN)) and os.path.exists(
+        os.path.join(results_dir, STRINGS_FILE)
+    )
+
+
+def iter_records(path: str, fields: List[str]) -> Iterator[Tuple[int, ...]]:
+    _check_header(path, fields)
+    rec = struct.Struct("<" + "q" * len(fields))
+    with open(path, "rb") as f:
+        f.seek(HEADER_SIZE)
+        data = f.read()
+    usable = len(data) - (len(data) % rec.size)
+    return rec.iter_unpack(data[:usable])
+
+
+def export_csv(results_dir: str) -> None:
+    strings = load_strings(os.path.join(results_dir, STRINGS_FILE))
+    for bin_name, csv_name, fields in (
+        (EVENTS_BIN, "trace_events.csv", EVENT_FIELDS),
+        (ACKS_BIN, "trace_db_ack.csv", ACK_FIELDS),
+    ):
+        bin_path = os.path.join(results_dir, bin_name)
+        if not os.path.exists(bin_path):
+            continue
+        str_cols = {i for i, k in enumerate(fields) if k in STRING_FIELDS}
+        with open(os.path.join(results_dir, csv_name), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            for record in iter_records(bin_path, fields):
+                writer.writerow(
+                    [
+                        strings[v] if i in str_cols else ("" if v == NULL_I64 else v)
+                        for i, v in enumerate(record)
+                    ]
+                )
+
+
+class _TeeWriter:
+    def __init__(self, *writers: BufferedWriter) -> None:
+        self._writers = writers
+
+    def write_event(self, event: TraceEvent) -> None:
+        for w in self._writers:
+            w.write_event(event)
+
+    def write_ack(self, msg_id: str, t_db_ack_ms: Optional[int]) -> None:
+        for w in self._writers:
+            w.write_ack(msg_id, t_db_ack_ms)
+
+
+class TraceSinks:
+    def __init__(self, cfg: Dict[str, object], results_dir: str, background: bool = True) -> None:
+        self.format = str(get_cfg(cfg, "trace.format", "csv"))
+        kwargs = writer_kwargs(cfg)
+        kwargs["background"] = background
+        self._writers: List[BufferedWriter] = []
+        self._strings: Optional[StringTable] = None
+
+        events: List[BufferedWriter] = []
+        acks: List[BufferedWriter] = []
+        if self.format in ("csv", "both"):
+            events.append(
+                TraceWriter(
+                    os.path.join(results_dir, "trace_events.csv"),
+                    max_mb=int(get_cfg(cfg, "trace.max_mb", 50)),
+                    **kwargs,
+                )
+            )
+            acks.append(AckWriter(os.path.join(results_dir, "trace_db_ack.csv"), **kwargs))
+        if self.format in ("binary", "both"):
+            self._strings = StringTable(os.path.join(results_dir, STRINGS_FILE))
+            events.append(BinaryTraceWriter(os.path.join(results_dir, EVENTS_BIN), self._strings, **kwargs))
+            acks.append(BinaryAckWriter(os.path.join(results_dir, ACKS_BIN), self._strings, **kwargs))
+
+        self._writers = events + acks
+        self.events = events[0] if len(events) == 1 else _TeeWriter(*events)
+        self.acks = acks[0] if len(acks) == 1 else _TeeWriter(*acks)
+
+    def flush(self) -> None:
+        for w in self._writers:
+            w.flush()
+
+    def close(self) -> None:
+        for w in self._writers:
+            w.close()
+        if self._strings is not None:
+            self._strings.close()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {os.path.basename(w.path): w.stats() for w in self._writers}
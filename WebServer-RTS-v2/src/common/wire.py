@@ -0,0 +1,114 @@
+import struct
+from typing import Dict, Optional
+
+from src.common.config import get_cfg
+from src.common.models import Message
+
+# Compact telemetry payload, little endian, 28 bytes:
+#
+#   u8  magic (0xB7)      never the first byte of a JSON document
+#   u8  version (1)
+#   u16 send lag ms       t_sensor_ms - t_intended_ms, 0xFFFF if unknown
+#   u32 device index      device_id is f"{prefix}{index:02d}", as sensor_sim names devices
+#   u32 seq
+#   i64 t_sensor_ms
+#   i16 temp in 0.01 C
+#   u16 smoke, gas, flame in 1/10000 (0.0 - 1.0 normalized readings)
+#
+# Fixed point keeps values exact to the sensor's resolution, so decoded
+# values round-trip as short decimals instead of float32 noise. msg_id is
+# not sent; it is rebuilt as f"{device_id}-{seq}", which is unique per run as
+# long as seq is. Collectors accept this and JSON on any topic.
+#
+# The send lag lets the collector rebuild t_intended_ms, the time the
+# simulator's schedule meant to send at; lags over 65.5 s are clamped.
+
+WIRE_MAGIC = 0xB7
+WIRE_VERSION = 1
+TELEMETRY_STRUCT = struct.Struct("<BBHIIqhHHH")
+_DEVICE_STRUCT = struct.Struct("<I")
+_DEVICE_OFFSET = 4
+_TEMP_SCALE = 100
+_RATIO_SCALE = 10000
+_LAG_UNKNOWN = 0xFFFF
+
+
+def _fixed(value: float, scale: int, lo: int, hi: int) -> int:
+    return max(lo, min(hi, int(round(value * scale))))
+
+
+def is_binary(payload: bytes) -> bool:
+    return len(payload) > 0 and payload[0] == WIRE_MAGIC
+
+
+class TelemetryWire:
+    def __init__(self, device_prefix: str = "esp32-") -> None:
+        self.device_prefix = device_prefix
+        self._prefix_len = len(device_prefix)
+        # Decoding many messages from few devices: cache index -> device_id
+        self._device_ids: Dict[int, str] = {}
+
+    def device_id(self, index: int) -> str:
+        device_id = self._device_ids.get(index)
+        if device_id is None:
+            device_id = self._device_ids[index] = f"{self.device_prefix}{index:02d}"
+        return device_id
+
+    def device_index(self, device_id: str) -> int:
+        # Inverse of device_id(); raises ValueError for ids without the prefix
+        if not device_id.startswith(self.device_prefix):
+            raise ValueError(f"device_id {device_id!r} does not start with {self.device_prefix!r}")
+        return int(device_id[self._prefix_len:])
+
+    def encode(
+        self,
+        device_index: int,
+        seq: int,
+        t_sensor_ms: int,
+        values: Dict[str, float],
+        t_intended_ms: Optional[int] = None,
+    ) -> bytes:
+        lag = _LAG_UNKNOWN if t_intended_ms is None else max(0, min(_LAG_UNKNOWN - 1, t_sensor_ms - t_intended_ms))
+        return TELEMETRY_STRUCT.pack(
+            WIRE_MAGIC,
+            WIRE_VERSION,
+            lag,
+            device_index,
+            seq,
+            t_sensor_ms,
+            _fixed(values.get("temp", 0.0), _TEMP_SCALE, -32768, 32767),
+            _fixed(values.get("smoke", 0.0), _RATIO_SCALE, 0, 65535),
+            _fixed(values.get("gas", 0.0), _RATIO_SCALE, 0, 65535),
+            _fixed(values.get("flame", 0.0), _RATIO_SCALE, 0, 65535),
+        )
+
+    def decode(self, payload: bytes) -> Message:
+        # Raises struct.error / ValueError on a truncated or unknown payload
+        magic, version, lag, index, seq, t_sensor_ms, temp, smoke, gas, flame = TELEMETRY_STRUCT.unpack(payload)
+        if magic != WIRE_MAGIC or version != WIRE_VERSION:
+            raise ValueError(f"unsupported wire payload version {version}")
+        device_id = self.device_id(index)
+        return Message(
+            msg_id=f"{device_id}-{seq}",
+            device_id=device_id,
+            msg_type="telemetry",
+            t_sensor_ms=t_sensor_ms,
+            seq=seq,
+            values={
+                "temp": temp / _TEMP_SCALE,
+                "smoke": smoke / _RATIO_SCALE,
+                "gas": gas / _RATIO_SCALE,
+                "flame": flame / _RATIO_SCALE,
+            },
+            t_intended_ms=None if lag == _LAG_UNKNOWN else t_sensor_ms - lag,
+        )
+
+    def peek_device_id(self, payload: bytes) -> Optional[str]:
+        # For sharding without a full decode; None if not a wire payload
+        if not is_binary(payload) or len(payload) < _DEVICE_OFFSET + _DEVICE_STRUCT.size:
+            return None
+        return self.device_id(_DEVICE_STRUCT.unpack_from(payload, _DEVICE_OFFSET)[0])
+
+
+def wire_from_cfg(cfg: Dict[str, object]) -> TelemetryWire:
+    return TelemetryWire(str(get_cfg(cfg, "sensor_sim.device_id_prefix", "esp32-")))
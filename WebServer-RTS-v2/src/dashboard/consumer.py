@@ -1,14 +1,17 @@
-import json
 import logging
-from typing import Dict
+from typing import Dict, Optional
+
+from src.common.codec import JsonCodec, get_codec
 
 
 class DashboardConsumer:
-    def __init__(self, enabled: bool = True) -> None:
+    def __init__(self, enabled: bool = True, codec: Optional[JsonCodec] = None) -> None:
         self._enabled = enabled
+        self._codec = codec or get_codec()
         self._logger = logging.getLogger("dashboard")
 
     def emit(self, record: Dict[str, object]) -> None:
-        if not self._enabled:
+        # Skip encoding entirely when INFO records would be discarded anyway
+        if not self._enabled or not self._logger.isEnabledFor(logging.INFO):
             return
-        self._logger.info("DASHBOARD %s", json.dumps(record, separators=(",", ":")))
+        self._logger.info("DASHBOARD %s", self._codec.dumps(record).decode("utf-8"))
@@ -0,0 +1,164 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.common.config import get_cfg
+from src.common.metrics import LatencySketch, RollingSketch
+
+
+MSG_TYPES = ("alarm", "telemetry", "status")
+QUANTILES = (50, 95, 99)
+
+
+class LiveMetrics:
+    # Scrapes only read (or copy) hot-path state and never take a lock. Writers
+    # that may run on several threads (pipeline workers, sync DB acks) serialise
+    # among themselves with _write_lock; the MQTT thread owns `received`.
+
+    def __init__(self, cfg: Dict[str, object]) -> None:
+        window_s = float(get_cfg(cfg, "metrics.window_s", 60))
+        slots = int(get_cfg(cfg, "metrics.window_slots", 6))
+        alpha = float(get_cfg(cfg, "metrics.sketch_alpha", 0.01))
+
+        self.alarm_deadline_ms = int(get_cfg(cfg, "deadlines.alarm_deadline_ms"))
+        self.telemetry_deadline_ms = int(get_cfg(cfg, "deadlines.telemetry_deadline_ms"))
+        self.avi_state_ms = int(get_cfg(cfg, "freshness.avi_state_ms"))
+        self.avi_telemetry_ms = int(get_cfg(cfg, "freshness.avi_telemetry_ms"))
+        self._tracked = (self.alarm_deadline_ms, self.telemetry_deadline_ms, self.avi_state_ms, self.avi_telemetry_ms)
+        self._alpha = alpha
+
+        self.received: Dict[str, int] = {}
+        self.processed: Dict[str, int] = {t: 0 for t in MSG_TYPES}
+        self._e2e: Dict[str, RollingSketch] = {t: RollingSketch(window_s, slots, alpha, self._tracked) for t in MSG_TYPES}
+        self._db = RollingSketch(window_s, slots, alpha)
+        self._gauges: List[Tuple[str, Dict[str, str], Callable[[], float]]] = []
+        self._write_lock = threading.Lock()
+
+    def add_gauge(self, name: str, labels: Dict[str, str], read: Callable[[], float]) -> None:
+        self._gauges.append((name, labels, read))
+
+    def observe_received(self, msg_type: str) -> None:
+        self.received[msg_type] = self.received.get(msg_type, 0) + 1
+
+    def observe_processed(self, msg_type: str, e2e_ms: Optional[int]) -> None:
+        with self._write_lock:
+            self.processed[msg_type] = self.processed.get(msg_type, 0) + 1
+            sketch = self._e2e.get(msg_type)
+            if sketch is not None:
+                sketch.add(e2e_ms)
+
+    def observe_db(self, db_time_ms: Optional[int]) -> None:
+        with self._write_lock:
+            self._db.add(db_time_ms)
+
+    def snapshot(self) -> Dict[str, object]:
+        e2e = {t: s.snapshot() for t, s in self._e2e.items()}
+        all_types = LatencySketch(self._alpha, deadlines=self._tracked)
+        for sketch in e2e.values():
+            all_types.merge(sketch)
+        db = self._db.snapshot()
+
+        def quantiles(sketch: LatencySketch) -> Dict[str, Optional[float]]:
+            return {f"p{p}": v for p, v in sketch.percentiles(QUANTILES).items()}
+
+        def fresh(sketch: LatencySketch, avi_ms: int) -> Optional[float]:
+            over = sketch.miss_rate(avi_ms)
+            return None if over is None else 1.0 - over
+
+        deadline = {"alarm": self.alarm_deadline_ms, "telemetry": self.telemetry_deadline_ms}
+        return {
+            "received": dict(self.received),
+            "processed": dict(self.processed),
+            "gauges": [
+                {"name": name, "labels": labels, "value": read()} for name, labels, read in self._gauges
+            ],
+            "e2e_ms": {t: dict(quantiles(s), count=s.count) for t, s in e2e.items()},
+            "db_ack_ms": dict(quantiles(db), count=db.count),
+            "deadline_miss_rate": {t: e2e[t].miss_rate(d) for t, d in deadline.items()},
+            "freshness_ratio": {
+                "telemetry": fresh(e2e["telemetry"], self.avi_telemetry_ms),
+                "state": fresh(all_types, self.avi_state_ms),
+            },
+        }
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return "{" + inner + "}"
+
+
+def to_prometheus(snap: Dict[str, object]) -> str:
+    lines: List[str] = []
+
+    def metric(name: str, kind: str, samples: List[Tuple[Dict[str, str], Optional[float]]]) -> None:
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            if value is not None:
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+    metric("rts_received_total", "counter", [({"type": t}, c) for t, c in sorted(snap["received"].items())])
+    metric("rts_processed_total", "counter", [({"type": t}, c) for t, c in sorted(snap["processed"].items())])
+    gauge_names = sorted({g["name"] for g in snap["gauges"]})
+    for name in gauge_names:
+        metric(name, "gauge", [(g["labels"], g["value"]) for g in snap["gauges"] if g["name"] == name])
+
+    e2e_samples = []
+    for t, q in snap["e2e_ms"].items():
+        e2e_samples.extend(({"type": t, "quantile": str(p / 100)}, q[f"p{p}"]) for p in QUANTILES)
+    metric("rts_e2e_latency_ms", "gauge", e2e_samples)
+    db = snap["db_ack_ms"]
+    metric("rts_db_ack_latency_ms", "gauge", [({"quantile": str(p / 100)}, db[f"p{p}"]) for p in QUANTILES])
+    metric(
+        "rts_deadline_miss_ratio",
+        "gauge",
+        [({"type": t}, v) for t, v in snap["deadline_miss_rate"].items()],
+    )
+    metric("rts_freshness_ratio", "gauge", [({"kind": k}, v) for k, v in snap["freshness_ratio"].items()])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    def __init__(self, live: LiveMetrics, host: str = "127.0.0.1", port: int = 9108) -> None:
+        self._logger = logging.getLogger("metrics_server")
+        logger = self._logger
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body = to_prometheus(live.snapshot()).encode("utf-8")
+                    ctype = "text/plain; version=0.0.4"
+                elif path == "/metrics.json":
+                    body = json.dumps(live.snapshot()).encode("utf-8")
+                    ctype = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt: str, *args: object) -> None:
+                logger.debug(fmt, *args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._server.server_address[:2]
+
+    def start(self) -> None:
+        self._thread.start()
+        self._logger.info("Metrics endpoint on http://%s:%s/metrics", *self.address)
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
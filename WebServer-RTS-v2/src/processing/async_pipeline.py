@@ -0,0 +1,176 @@
+import asyncio
+import random
+import zlib
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from src.common.config import get_cfg
+from src.common.models import Message
+from src.common.sched_queue import AsyncSchedQueue
+from src.common.time_utils import wall_ms
+from src.processing.pipeline import SHARD_CLASSES, classify_into, mark_shed
+from src.processing.rules import RuleSet
+
+
+class _AsyncShard:
+    def __init__(
+        self,
+        index: int,
+        cfg: Dict[str, object],
+        on_processed: Callable[[Message], Awaitable[None]],
+        rules: RuleSet,
+    ) -> None:
+        self.index = index
+        self._on_processed = on_processed
+        self._rules = rules
+        self._inject_jitter_ms = int(cfg["pipeline"]["inject_jitter_telemetry_ms"])
+        self._telemetry_drop_policy = str(cfg["pipeline"]["telemetry_drop_policy"])
+        self._edf = str(cfg["pipeline"]["scheduler"]) == "edf"
+        self._shed_expired = bool(cfg["pipeline"]["shed_expired"])
+        self._alarm_deadline_ms = int(cfg["deadlines"]["alarm_deadline_ms"])
+        self._telemetry_deadline_ms = int(cfg["deadlines"]["telemetry_deadline_ms"])
+        telemetry_max = int(cfg["pipeline"]["telemetry_queue_max"])
+        # Status shares the telemetry class to keep per-device order (see _Shard)
+        self._queue = AsyncSchedQueue(
+            {"alarm": int(cfg["pipeline"]["alarm_queue_max"]), "telemetry": telemetry_max},
+            classes=SHARD_CLASSES,
+            edf=self._edf,
+        )
+        self._task: Optional[asyncio.Task] = None
+
+        self.drop_count_telemetry = 0
+        self.queue_max_observed = 0
+        self.processed = 0
+        self.shed_count = 0
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run(), name=f"pipeline-{self.index}")
+
+    def stop(self) -> None:
+        self._queue.close()
+
+    async def join(self, timeout: float) -> None:
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def queue_depths(self) -> Dict[str, int]:
+        return self._queue.depths()
+
+    def enqueue(self, msg: Message) -> bool:
+        msg_type = msg.msg_type
+        deadline = None
+        if self._edf:
+            deadline = msg.deadline_at(self._alarm_deadline_ms if msg_type == "alarm" else self._telemetry_deadline_ms)
+        if msg_type == "alarm":
+            # Nothing on the loop may block, so alarms are never refused
+            self._queue.push("alarm", msg, deadline)
+            return True
+
+        if self._telemetry_drop_policy == "none":
+            self._queue.push("telemetry", msg, deadline)
+        elif self._telemetry_drop_policy == "keep_latest":
+            if self._queue.put_evict("telemetry", msg, deadline) is not None:
+                self.drop_count_telemetry += 1
+        elif not self._queue.offer("telemetry", msg, deadline):
+            self.drop_count_telemetry += 1
+            return False
+
+        depth = self._queue.depth("telemetry")
+        if depth > self.queue_max_observed:
+            self.queue_max_observed = depth
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            entry = await self._queue.get()
+            if entry is None:
+                return
+            _, msg = entry
+            msg.worker = self.index
+
+            t_proc_start_ms = wall_ms()
+            if (
+                self._shed_expired
+                and msg.msg_type == "telemetry"
+                and t_proc_start_ms > msg.deadline_at(self._telemetry_deadline_ms)
+            ):
+                mark_shed(msg, t_proc_start_ms)
+                await self._on_processed(msg)
+                self.shed_count += 1
+                continue
+
+            if msg.msg_type != "alarm" and self._inject_jitter_ms > 0:
+                await asyncio.sleep(random.randint(0, self._inject_jitter_ms) / 1000.0)
+
+            classify_into(msg, t_proc_start_ms, self._rules)
+            await self._on_processed(msg)
+            self.processed += 1
+
+
+class AsyncPipeline:
+    # Pipeline for the asyncio collector: one AsyncSchedQueue and worker task
+    # per device shard, all on the event loop. A shard awaits on_processed
+    # before taking its next message, so per-device order is kept while up to
+    # pipeline.async.shards DB writes are outstanding at once.
+
+    def __init__(self, cfg: Dict[str, object], on_processed: Callable[[Message], Awaitable[None]]) -> None:
+        shards = max(1, int(get_cfg(cfg, "pipeline.async.shards", 64)))
+        rules = RuleSet.from_cfg(cfg)
+        self._shards: List[_AsyncShard] = [_AsyncShard(i, cfg, on_processed, rules) for i in range(shards)]
+
+    @property
+    def workers(self) -> int:
+        return len(self._shards)
+
+    @property
+    def drop_count_telemetry(self) -> int:
+        return sum(s.drop_count_telemetry for s in self._shards)
+
+    @property
+    def queue_max_observed(self) -> int:
+        return max(s.queue_max_observed for s in self._shards)
+
+    @property
+    def shed_count(self) -> int:
+        return sum(s.shed_count for s in self._shards)
+
+    def start(self) -> None:
+        for shard in self._shards:
+            shard.start()
+
+    async def stop(self, timeout: float = 2.0) -> None:
+        # Closed queues are drained before the worker tasks return
+        for shard in self._shards:
+            shard.stop()
+        await asyncio.gather(*(shard.join(timeout) for shard in self._shards))
+
+    def shard_for(self, device_id: str) -> int:
+        if len(self._shards) == 1:
+            return 0
+        return zlib.crc32(device_id.encode("utf-8")) % len(self._shards)
+
+    def queue_depths(self) -> Dict[str, int]:
+        depths = dict.fromkeys(SHARD_CLASSES, 0)
+        for shard in self._shards:
+            for k, v in shard.queue_depths().items():
+                depths[k] += v
+        return depths
+
+    def shard_stats(self) -> List[Dict[str, object]]:
+        return [
+            {
+                "shard": s.index,
+                "processed": s.processed,
+                "dropped": s.drop_count_telemetry,
+                "shed": s.shed_count,
+                "queue_max": s.queue_max_observed,
+                "queue_depth": s.queue_depths(),
+            }
+            for s in self._shards
+        ]
+
+    def enqueue(self, msg: Message) -> bool:
+        return self._shards[self.shard_for(msg.device_id)].enqueue(msg)
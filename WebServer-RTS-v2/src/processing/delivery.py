@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.common.codec import JsonCodec, codec_from_cfg, get_codec
+from src.common.config import get_cfg
+from src.common.models import Message, TraceEvent
+from src.common.time_utils import wall_ms
+from src.common.wire import TelemetryWire, is_binary
+from src.dashboard.consumer import DashboardConsumer
+from src.rtdb.async_backend import AsyncBackend
+from src.rtdb.async_db_writer import AsyncDbWriter
+from src.rtdb.db_writer import DbWriter
+from src.rtdb.firebase_backend import FirebaseBackend
+from src.rtdb.hedge import HEDGE, AsyncHedgedWriter, HedgedWriter, HedgePolicy
+from src.rtdb.mock_backend import MockBackend
+from src.rtdb.payloads import build_alarm, build_state, build_telemetry
+from src.rtdb.rtdb_interface import BatchOp, RTDBInterface, log_write_error
+from src.rtdb.sim_backend import SimBackend, sim_model_from_cfg
+from src.rtdb.state_cache import StateCache
+
+
+_logger = logging.getLogger("delivery")
+_default_wire = TelemetryWire()
+
+
+def decode_message(
+    topic: str, payload: bytes, codec: Optional[JsonCodec] = None, wire: Optional[TelemetryWire] = None
+) -> Optional[Message]:
+    # JSON and compact binary telemetry are told apart by the first byte
+    if is_binary(payload):
+        try:
+            return (wire or _default_wire).decode(payload)
+        except Exception:
+            _logger.warning("Invalid binary payload on %s", topic)
+            return None
+    try:
+        msg = (codec or get_codec()).decode_message(payload)
+    except Exception:
+        _logger.warning("Invalid JSON payload on %s", topic)
+        return None
+
+    if not msg.msg_type:
+        msg.msg_type = topic_msg_type(topic)
+    return msg
+
+
+def topic_msg_type(topic: str) -> str:
+    if topic.endswith("alert"):
+        return "alarm"
+    if topic.endswith("status"):
+        return "status"
+    return "telemetry"
+
+
+def build_backend(cfg: Dict[str, object], results_dir: str) -> RTDBInterface:
+    mock_path = os.path.join(results_dir, "mock_rtdb.jsonl")
+    if get_cfg(cfg, "rtdb.mode", "mock") == "sim":
+        return SimBackend(mock_path, sim_model_from_cfg(cfg), codec_from_cfg(cfg))
+    mock_backend = MockBackend(mock_path, int(get_cfg(cfg, "rtdb.mock.ack_delay_ms", 0)), codec_from_cfg(cfg))
+    if get_cfg(cfg, "rtdb.mode", "mock") == "firebase":
+        return FirebaseBackend(
+            get_cfg(cfg, "rtdb.firebase.service_account_json", ""),
+            get_cfg(cfg, "rtdb.firebase.database_url", ""),
+            fallback=mock_backend,
+        )
+    return mock_backend
+
+
+class Delivery:
+    # DB write (sync or via DbWriter) and dashboard emit for one processed
+    # message; shared by the threaded pipeline and process-pool workers.
+
+    def __init__(
+        self,
+        cfg: Dict[str, object],
+        backend: RTDBInterface,
+        ack_writer: object,
+        db_writer: Optional[DbWriter],
+        dashboard: DashboardConsumer,
+    ) -> None:
+        self._cfg = cfg
+        self._backend = backend
+        self._ack_writer = ack_writer
+        self._db_writer = db_writer
+        self._dashboard = dashboard
+        self._write_mode = get_cfg(cfg, "rtdb.write_mode", "sync")
+        self._alarm_deadline_ms = int(get_cfg(cfg, "deadlines.alarm_deadline_ms"))
+        self._telemetry_deadline_ms = int(get_cfg(cfg, "deadlines.telemetry_deadline_ms"))
+        self._avi_alarm_ms = int(get_cfg(cfg, "freshness.avi_alarm_ms"))
+        self._avi_telemetry_ms = int(get_cfg(cfg, "freshness.avi_telemetry_ms"))
+        self._avi_state_ms = int(get_cfg(cfg, "freshness.avi_state_ms"))
+        # Used by sync writes and AsyncDbWriter; DbWriter keeps its own cache
+        self.state_cache = StateCache.from_cfg(cfg)
+        self.error_count = 0
+        # rtdb.alarm_write.strategy for sync writes: "serial" writes an alarm's
+        # state and document one after the other, "batch" in one write_batch,
+        # "hedged" races that batch against a duplicate of its alarm document
+        # (see hedge.py)
+        self._alarm_strategy = get_cfg(cfg, "rtdb.alarm_write.strategy", "serial")
+        self.hedger: Optional[HedgedWriter] = None
+        if backend is not None and self._write_mode == "sync" and self._alarm_strategy == "hedged":
+            workers = int(get_cfg(cfg, "pipeline.workers", 1))
+            self.hedger = HedgedWriter(backend, HedgePolicy.from_cfg(cfg), workers, self.state_cache.forget)
+
+    def _trace(self, msg: Message) -> TraceEvent:
+        msg_type = msg.msg_type
+        return TraceEvent(
+            msg_id=msg.msg_id,
+            device_id=msg.device_id,
+            msg_type=msg_type,
+            t_sensor_ms=msg.t_sensor_ms,
+            t_intended_ms=msg.t_intended_ms,
+            t_pc_rx_ms=msg.t_pc_rx_ms,
+            t_proc_start_ms=msg.t_proc_start_ms,
+            t_proc_end_ms=msg.t_proc_end_ms,
+            t_db_enqueue_ms=msg.t_db_enqueue_ms,
+            t_dashboard_emit_ms=msg.t_dashboard_emit_ms,
+            deadline_ms=self._alarm_deadline_ms if msg_type == "alarm" else self._telemetry_deadline_ms,
+            avi_ms=self._avi_alarm_ms if msg_type == "alarm" else self._avi_telemetry_ms,
+            notes=msg.notes,
+        )
+
+    def _ops(self, msg: Message) -> List[BatchOp]:
+        ops: List[BatchOp] = []
+        if self.state_cache.should_write(msg.device_id, msg.severity, msg.values):
+            ops.append(("state", msg.device_id, build_state(msg, msg.severity, self._avi_state_ms, "sim")))
+        if msg.msg_type == "alarm":
+            ops.append(("alarm", msg.msg_id, build_alarm(msg, msg.severity)))
+        elif msg.msg_type == "telemetry":
+            ops.append(("telemetry", msg.device_id, build_telemetry(msg)))
+        return ops
+
+    def _write_alarm(self, msg: Message) -> int:
+        # State and alarm document in one write_batch, raced against a
+        # duplicate of the alarm document when hedged; a winning hedge is
+        # noted on the trace row
+        ops = self._ops(msg)
+        if self.hedger is None:
+            return self._backend.write_batch(ops)
+        ack_ms, attempt = self.hedger.write_batch(ops)
+        if attempt == HEDGE:
+            msg.notes = (msg.notes + ";hedge_won").strip(";")
+        return ack_ms
+
+    def _emit(self, msg: Message) -> None:
+        msg.t_dashboard_emit_ms = wall_ms()
+        self._dashboard.emit({"msg_id": msg.msg_id, "type": msg.msg_type, "severity": msg.severity})
+
+    def deliver(self, msg: Message) -> Tuple[TraceEvent, Optional[int]]:
+        # msg arrives classified (or shed) from a pipeline worker
+        if msg.shed:
+            return self._trace(msg), None
+
+        msg_type = msg.msg_type
+        t_db_enqueue_ms = msg.t_db_enqueue_ms = wall_ms()
+        db_time_ms: Optional[int] = None
+
+        if self._write_mode == "sync":
+            ack_ms = None
+            try:
+                if msg_type == "alarm" and self._alarm_strategy != "serial":
+                    ack_ms = self._write_alarm(msg)
+                else:
+                    if self.state_cache.should_write(msg.device_id, msg.severity, msg.values):
+                        state = build_state(msg, msg.severity, self._avi_state_ms, "sim")
+                        ack_ms = self._backend.write_state(msg.device_id, state)
+                    if msg_type == "alarm":
+                        ack_ms = self._backend.write_alarm(msg.msg_id, build_alarm(msg, msg.severity))
+                    elif msg_type == "telemetry":
+                        ack_ms = self._backend.write_telemetry(msg.device_id, build_telemetry(msg))
+            except Exception as exc:
+                self.error_count += 1
+                log_write_error(_logger, self.error_count, exc)
+                self.state_cache.forget(msg.device_id)
+                msg.notes = (msg.notes + ";db_error").strip(";")
+            else:
+                if ack_ms is None:
+                    # Unchanged status: nothing was written, so there is no
+                    # ack and no DB time to record
+                    msg.notes = (msg.notes + ";state_suppressed").strip(";")
+                else:
+                    self._ack_writer.write_ack(msg.msg_id, ack_ms)
+                    db_time_ms = ack_ms - t_db_enqueue_ms
+        else:
+            # DbWriter builds the RTDB documents when it writes the message
+            ok = self._db_writer.enqueue(msg) if self._db_writer else False
+            if not ok:
+                msg.notes = (msg.notes + ";db_drop").strip(";")
+
+        self._emit(msg)
+        return self._trace(msg), db_time_ms
+
+
+class AsyncDelivery(Delivery):
+    # Delivery on the collector's event loop. In write_mode "sync" each
+    # message is one awaited write_batch, so writes for different shards
+    # overlap on a single thread; rtdb.writer.inflight bounds them and
+    # alarm_reserved slots are kept free for alarms. In write_mode "async"
+    # messages go to an AsyncDbWriter, which coalesces and batches them like
+    # DbWriter, and the dashboard emit does not wait for the write.
+
+    def __init__(
+        self,
+        cfg: Dict[str, object],
+        backend: AsyncBackend,
+        ack_writer: object,
+        dashboard: DashboardConsumer,
+        on_db_time: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        super().__init__(cfg, None, ack_writer, None, dashboard)
+        self._async_backend = backend
+        self._on_db_time = on_db_time
+        inflight = max(1, int(get_cfg(cfg, "rtdb.writer.inflight", 1)))
+        reserved = max(0, min(int(get_cfg(cfg, "rtdb.writer.alarm_reserved", 0)), inflight - 1))
+        self._slots = asyncio.Semaphore(inflight)
+        self._bulk_slots = asyncio.Semaphore(inflight - reserved)
+
+        # Alarm writes always go out as one batch; "hedged" races it against
+        # a duplicate of its alarm document
+        self.async_hedger: Optional[AsyncHedgedWriter] = None
+        if self._alarm_strategy == "hedged":
+            self.async_hedger = AsyncHedgedWriter(backend, HedgePolicy.from_cfg(cfg), self.state_cache.forget)
+
+        self.writer: Optional[AsyncDbWriter] = None
+        if self._write_mode == "async":
+            self.writer = AsyncDbWriter(backend, ack_writer, cfg, self.state_cache, self.async_hedger, on_db_time)
+
+    def start(self) -> None:
+        if self.writer is not None:
+            self.writer.start()
+
+    @property
+    def drop_count_telemetry(self) -> int:
+        return self.writer.drop_count if self.writer else 0
+
+    @property
+    def pending_max_observed(self) -> int:
+        return self.writer.queue_max_observed if self.writer else 0
+
+    async def _write(self, msg: Message, ops: List[BatchOp], t_db_enqueue_ms: int) -> Optional[int]:
+        # db time, or None if the write failed
+        try:
+            if msg.msg_type == "alarm":
+                async with self._slots:
+                    if self.async_hedger is None:
+                        ack_ms = await self._async_backend.write_batch(ops)
+                    else:
+                        ack_ms, attempt = await self.async_hedger.write_batch(ops)
+                        if attempt == HEDGE:
+                            msg.notes = (msg.notes + ";hedge_won").strip(";")
+            else:
+                async with self._bulk_slots:
+                    async with self._slots:
+                        ack_ms = await self._async_backend.write_batch(ops)
+        except Exception as exc:
+            self.error_count += 1
+            log_write_error(_logger, self.error_count, exc)
+            self.state_cache.forget(msg.device_id)
+            msg.notes = (msg.notes + ";db_error").strip(";")
+            return None
+        self._ack_writer.write_ack(msg.msg_id, ack_ms)
+        return ack_ms - t_db_enqueue_ms
+
+    async def deliver_async(self, msg: Message) -> Tuple[TraceEvent, Optional[int]]:
+        if msg.shed:
+            return self._trace(msg), None
+
+        t_db_enqueue_ms = msg.t_db_enqueue_ms = wall_ms()
+
+        db_time_ms: Optional[int] = None
+        if self.writer is not None:
+            # The writer builds the RTDB documents when it writes the message
+            if not self.writer.enqueue(msg):
+                msg.notes = (msg.notes + ";db_drop").strip(";")
+        else:
+            ops = self._ops(msg)
+            if not ops:
+                # Unchanged status: nothing to write, no ack or DB time
+                msg.notes = (msg.notes + ";state_suppressed").strip(";")
+            else:
+                db_time_ms = await self._write(msg, ops, t_db_enqueue_ms)
+
+        self._emit(msg)
+        return self._trace(msg), db_time_ms
+
+    async def drain(self) -> None:
+        # Writes what the writer still holds in write_mode "async"; those db
+        # times go to on_db_time rather than the returned trace
+        if self.writer is not None:
+            await self.writer.close()
+        if self.async_hedger is not None:
+            await self.async_hedger.drain()
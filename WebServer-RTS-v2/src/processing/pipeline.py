@@ -1,93 +1,245 @@
 import logging
-import queue
 import random
 import threading
 import time
-from typing import Callable, Dict, Optional
+import zlib
+from typing import Callable, Dict, List, Optional
 
+from src.common.models import Message
+from src.common.sched_queue import SchedQueue
 from src.common.time_utils import wall_ms
-from src.processing import rules
+from src.processing.rules import DEFAULT_RULES, RuleSet
 
 
-class Pipeline:
-    def __init__(self, cfg: Dict[str, object], on_processed: Callable[[Dict[str, object]], None]) -> None:
-        self._logger = logging.getLogger("pipeline")
+# Queue classes of a pipeline shard, highest priority first
+SHARD_CLASSES = ("alarm", "telemetry")
+
+
+def mark_shed(msg: Message, t_now_ms: int) -> None:
+    # Expired telemetry skips rules, DB write and dashboard but still gets a trace row
+    msg.severity = ""
+    msg.notes = "shed_expired"
+    msg.t_proc_start_ms = t_now_ms
+    msg.t_proc_end_ms = t_now_ms
+    msg.shed = True
+
+
+def classify_into(msg: Message, t_proc_start_ms: int, rules: RuleSet = DEFAULT_RULES) -> None:
+    msg.severity, msg.notes = rules.classify(msg)
+    msg.t_proc_start_ms = t_proc_start_ms
+    msg.t_proc_end_ms = wall_ms()
+
+
+def classify_batch_into(msgs: List[Message], t_proc_start_ms: int, rules: RuleSet = DEFAULT_RULES) -> None:
+    # One classification pass and one end timestamp for the whole batch
+    rules.classify_batch(msgs)
+    t_proc_end_ms = wall_ms()
+    for msg in msgs:
+        msg.t_proc_start_ms = t_proc_start_ms
+        msg.t_proc_end_ms = t_proc_end_ms
+
+
+class _Shard:
+    # Alarms preempt everything else; status and telemetry share one class so
+    # a device's status and telemetry are handled in the order they arrived
+    # (with scheduler "edf", in deadline order, which for one device is the
+    # same). Both count against telemetry_queue_max and its drop policy.
+
+    def __init__(
+        self, index: int, cfg: Dict[str, object], on_processed: Callable[[Message], None], rules: RuleSet
+    ) -> None:
+        self.index = index
         self._on_processed = on_processed
+        self._rules = rules
+        # Telemetry is classified in batches of up to this many queued messages
+        self._classify_batch = max(1, int(cfg["pipeline"]["classify_batch"]))
         self._inject_jitter_ms = int(cfg["pipeline"]["inject_jitter_telemetry_ms"])
         self._telemetry_drop_policy = str(cfg["pipeline"]["telemetry_drop_policy"])
-        self._alarm_queue = queue.Queue(maxsize=int(cfg["pipeline"]["alarm_queue_max"]))
-        self._telemetry_queue = queue.Queue(maxsize=int(cfg["pipeline"]["telemetry_queue_max"]))
+        self._edf = str(cfg["pipeline"]["scheduler"]) == "edf"
+        self._shed_expired = bool(cfg["pipeline"]["shed_expired"])
+        self._alarm_deadline_ms = int(cfg["deadlines"]["alarm_deadline_ms"])
+        self._telemetry_deadline_ms = int(cfg["deadlines"]["telemetry_deadline_ms"])
+        telemetry_max = int(cfg["pipeline"]["telemetry_queue_max"])
+        self._queue = SchedQueue(
+            {"alarm": int(cfg["pipeline"]["alarm_queue_max"]), "telemetry": telemetry_max},
+            classes=SHARD_CLASSES,
+            edf=self._edf,
+        )
         self._stop_event = threading.Event()
-        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker = threading.Thread(target=self._run, name=f"pipeline-{index}", daemon=True)
 
         self.drop_count_telemetry = 0
         self.queue_max_observed = 0
+        self.processed = 0
+        self.shed_count = 0
 
     def start(self) -> None:
         self._worker.start()
 
     def stop(self) -> None:
         self._stop_event.set()
-        self._worker.join(timeout=2)
+        self._queue.close()
+
+    def join(self, timeout: float) -> None:
+        self._worker.join(timeout=timeout)
+
+    def queue_depths(self) -> Dict[str, int]:
+        return self._queue.depths()
 
-    def enqueue(self, payload: Dict[str, object]) -> bool:
-        msg_type = str(payload.get("msg_type") or getattr(payload.get("message"), "msg_type", ""))
+    def _deadline(self, msg: Message) -> Optional[int]:
+        if not self._edf:
+            return None
+        return msg.deadline_at(self._alarm_deadline_ms if msg.msg_type == "alarm" else self._telemetry_deadline_ms)
+
+    def enqueue(self, msg: Message) -> bool:
+        msg_type = msg.msg_type
+        deadline = self._deadline(msg)
         if msg_type == "alarm":
-            self._alarm_queue.put(payload)
+            self._queue.put("alarm", msg, deadline)
             return True
 
         # telemetry or status
-        if self._telemetry_queue.full():
-            if self._telemetry_drop_policy == "none":
-                self._telemetry_queue.put(payload)
-                return True
-            if self._telemetry_drop_policy == "keep_latest":
-                try:
-                    _ = self._telemetry_queue.get_nowait()
-                except queue.Empty:
-                    pass
-                self._telemetry_queue.put(payload)
+        if self._telemetry_drop_policy == "none":
+            self._queue.put("telemetry", msg, deadline)
+        elif self._telemetry_drop_policy == "keep_latest":
+            if self._queue.put_evict("telemetry", msg, deadline) is not None:
                 self.drop_count_telemetry += 1
-                return True
+        elif not self._queue.offer("telemetry", msg, deadline):
             # drop policy: drop
             self.drop_count_telemetry += 1
             return False
 
-        self._telemetry_queue.put(payload)
-        qsize = self._telemetry_queue.qsize()
-        if qsize > self.queue_max_observed:
-            self.queue_max_observed = qsize
+        depth = self._queue.depth("telemetry")
+        if depth > self.queue_max_observed:
+            self.queue_max_observed = depth
         return True
 
     def _run(self) -> None:
         while not self._stop_event.is_set():
-            item = None
-            try:
-                item = self._alarm_queue.get_nowait()
-            except queue.Empty:
-                pass
-
-            if item is None:
-                try:
-                    item = self._telemetry_queue.get(timeout=0.05)
-                except queue.Empty:
-                    continue
-
-            if item is None:
+            entry = self._queue.get()
+            if entry is None:
                 continue
+            cls, msg = entry
+            if cls == "telemetry" and self._classify_batch > 1:
+                self._process_batch(msg)
+            else:
+                self._process(msg)
+
+    def _shed(self, msg: Message, t_proc_start_ms: int) -> bool:
+        if (
+            self._shed_expired
+            and msg.msg_type == "telemetry"
+            and t_proc_start_ms > msg.deadline_at(self._telemetry_deadline_ms)
+        ):
+            mark_shed(msg, t_proc_start_ms)
+            self._on_processed(msg)
+            self.shed_count += 1
+            return True
+        return False
+
+    def _process(self, msg: Message) -> None:
+        msg.worker = self.index
+        t_proc_start_ms = wall_ms()
+        if self._shed(msg, t_proc_start_ms):
+            return
+
+        if msg.msg_type != "alarm" and self._inject_jitter_ms > 0:
+            time.sleep(random.randint(0, self._inject_jitter_ms) / 1000.0)
+
+        classify_into(msg, t_proc_start_ms, self._rules)
+        self._on_processed(msg)
+        self.processed += 1
+
+    def _process_batch(self, first: Message) -> None:
+        # Telemetry queued behind `first` is drained and classified in one
+        # pass; alarms arriving meanwhile are still handled before the next
+        # telemetry delivery
+        batch = [first]
+        batch.extend(self._queue.get_many("telemetry", self._classify_batch - 1))
+        t_proc_start_ms = wall_ms()
+        kept = []
+        for msg in batch:
+            msg.worker = self.index
+            if not self._shed(msg, t_proc_start_ms):
+                kept.append(msg)
+        classify_batch_into(kept, t_proc_start_ms, self._rules)
+
+        for msg in kept:
+            while self._queue.depth("alarm"):
+                entry = self._queue.get(timeout=0, only=("alarm",))
+                if entry is None:
+                    break
+                self._process(entry[1])
+            if self._inject_jitter_ms > 0:
+                time.sleep(random.randint(0, self._inject_jitter_ms) / 1000.0)
+            self._on_processed(msg)
+            self.processed += 1
 
-            msg = item["message"]
-            msg_type = msg.msg_type
 
-            t_proc_start_ms = wall_ms()
-            if msg_type != "alarm" and self._inject_jitter_ms > 0:
-                time.sleep(random.randint(0, self._inject_jitter_ms) / 1000.0)
+class Pipeline:
+    # Messages are sharded by device_id so each device is handled by exactly one
+    # worker (per-device FIFO order is kept); alarms still preempt telemetry
+    # inside a shard. on_processed is called concurrently when workers > 1.
+    # With scheduler "edf" each class is served earliest t_sensor_ms + deadline_ms first.
+
+    def __init__(self, cfg: Dict[str, object], on_processed: Callable[[Message], None]) -> None:
+        self._logger = logging.getLogger("pipeline")
+        workers = max(1, int(cfg["pipeline"]["workers"]))
+        rules = RuleSet.from_cfg(cfg)
+        self._shards: List[_Shard] = [_Shard(i, cfg, on_processed, rules) for i in range(workers)]
 
-            severity, rule_note = rules.classify(msg)
-            t_proc_end_ms = wall_ms()
+    @property
+    def workers(self) -> int:
+        return len(self._shards)
 
-            item["severity"] = severity
-            item["rule_note"] = rule_note
-            item["t_proc_start_ms"] = t_proc_start_ms
-            item["t_proc_end_ms"] = t_proc_end_ms
-            self._on_processed(item)
+    @property
+    def drop_count_telemetry(self) -> int:
+        return sum(s.drop_count_telemetry for s in self._shards)
+
+    @property
+    def queue_max_observed(self) -> int:
+        return max(s.queue_max_observed for s in self._shards)
+
+    @property
+    def shed_count(self) -> int:
+        return sum(s.shed_count for s in self._shards)
+
+    def start(self) -> None:
+        for shard in self._shards:
+            shard.start()
+
+    def stop(self) -> None:
+        for shard in self._shards:
+            shard.stop()
+        for shard in self._shards:
+            shard.join(timeout=2)
+
+    def shard_for(self, device_id: str) -> int:
+        if len(self._shards) == 1:
+            return 0
+        # crc32 is stable across processes, unlike hash() on str
+        return zlib.crc32(device_id.encode("utf-8")) % len(self._shards)
+
+    def queue_depths(self) -> Dict[str, int]:
+        depths = dict.fromkeys(SHARD_CLASSES, 0)
+        for shard in self._shards:
+            for k, v in shard.queue_depths().items():
+                depths[k] += v
+        return depths
+
+    def shard_stats(self) -> List[Dict[str, object]]:
+        return [
+            {
+                "shard": s.index,
+                "processed": s.processed,
+                "dropped": s.drop_count_telemetry,
+                "shed": s.shed_count,
+                "queue_max": s.queue_max_observed,
+                "queue_depth": s.queue_depths(),
+            }
+            for s in self._shards
+        ]
+
+    def enqueue(self, msg: Message) -> bool:
+        # msg.t_pc_rx_ms must be set; workers fill in the remaining fields
+        return self._shards[self.shard_for(msg.device_id)].enqueue(msg)
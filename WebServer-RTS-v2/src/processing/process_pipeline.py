@@ -0,0 +1,406 @@
+import logging
+import multiprocessing as mp
+import queue
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from src.common.codec import codec_from_cfg
+from src.common.config import get_cfg
+from src.common.log import setup_logging
+from src.common.models import TraceEvent
+from src.common.time_utils import wall_ms
+from src.common.wire import wire_from_cfg
+from src.dashboard.consumer import DashboardConsumer
+from src.processing.delivery import Delivery, build_backend, decode_message, topic_msg_type
+from src.processing.pipeline import classify_into, mark_shed
+from src.processing.rules import RuleSet
+from src.processing.shm_ring import ShmRing
+from src.rtdb.db_writer import DbWriter
+from src.rtdb.hedge import hedge_summary
+from src.rtdb.sim_backend import SimBackend, sim_summary
+
+
+# Ring record: t_pc_rx_ms, topic length, then topic and raw payload bytes
+_REC = struct.Struct("<qH")
+
+ResultBatch = Tuple[List[Tuple[TraceEvent, Optional[int]]], List[Tuple[str, Optional[int]]], List[int]]
+
+
+def peek_device_id(payload: bytes) -> str:
+    # Cheap byte scan so the MQTT thread can shard without a JSON decode
+    i = payload.find(b'"device_id"')
+    if i < 0:
+        return ""
+    colon = payload.find(b":", i + 11)
+    start = payload.find(b'"', colon + 1) if colon >= 0 else -1
+    end = payload.find(b'"', start + 1) if start >= 0 else -1
+    if end < 0:
+        return ""
+    return payload[start + 1:end].decode("utf-8", "replace")
+
+
+class _ResultSink:
+    def __init__(self, result_queue: "mp.Queue", index: int, batch: int, interval_ms: int) -> None:
+        self._queue = result_queue
+        self._index = index
+        self._batch = batch
+        self._interval_ms = interval_ms
+        self._events: List[Tuple[TraceEvent, Optional[int]]] = []
+        # Acks and DB times may come from the DbWriter thread; deque appends are atomic
+        self._acks: Deque[Tuple[str, Optional[int]]] = deque()
+        self._db_times: Deque[int] = deque()
+        self._last_flush = time.monotonic()
+
+    def write_ack(self, msg_id: str, t_db_ack_ms: Optional[int]) -> None:
+        self._acks.append((msg_id, t_db_ack_ms))
+
+    def add_db_time(self, db_time_ms: int) -> None:
+        self._db_times.append(db_time_ms)
+
+    def add_event(self, trace: TraceEvent, db_time_ms: Optional[int]) -> None:
+        self._events.append((trace, db_time_ms))
+        if len(self._events) >= self._batch:
+            self.flush()
+
+    def maybe_flush(self) -> None:
+        if (time.monotonic() - self._last_flush) * 1000 >= self._interval_ms:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        acks = [self._acks.popleft() for _ in range(len(self._acks))]
+        db_times = [self._db_times.popleft() for _ in range(len(self._db_times))]
+        if not (self._events or acks or db_times):
+            return
+        self._queue.put(("batch", self._index, (self._events, acks, db_times)))
+        self._events = []
+
+
+def _worker_main(
+    index: int,
+    cfg: Dict[str, object],
+    results_dir: str,
+    alarm_ring_name: str,
+    telemetry_ring_name: str,
+    ready: "mp.Semaphore",
+    alarm_space: "mp.Event",
+    result_queue: "mp.Queue",
+    stop_event: "mp.Event",
+) -> None:
+    setup_logging(f"collector_w{index}")
+    logger = logging.getLogger("pipeline")
+    alarm_ring = ShmRing(name=alarm_ring_name)
+    telemetry_ring = ShmRing(name=telemetry_ring_name)
+
+    sink = _ResultSink(
+        result_queue,
+        index,
+        int(get_cfg(cfg, "pipeline.process.result_batch", 256)),
+        int(get_cfg(cfg, "pipeline.process.result_interval_ms", 50)),
+    )
+    backend = build_backend(cfg, results_dir)
+    db_writer: Optional[DbWriter] = None
+    if get_cfg(cfg, "rtdb.write_mode", "sync") == "async":
+        db_writer = DbWriter(backend, sink, cfg, on_db_time=sink.add_db_time, wal_name=f"worker-{index}")
+        db_writer.start()
+    codec = codec_from_cfg(cfg)
+    wire = wire_from_cfg(cfg)
+    delivery = Delivery(cfg, backend, sink, db_writer, DashboardConsumer(enabled=True, codec=codec))
+    rules = RuleSet.from_cfg(cfg)
+    inject_jitter_ms = int(get_cfg(cfg, "pipeline.inject_jitter_telemetry_ms", 0))
+    shed_expired = bool(get_cfg(cfg, "pipeline.shed_expired", False))
+    telemetry_deadline_ms = int(get_cfg(cfg, "deadlines.telemetry_deadline_ms"))
+
+    processed = 0
+    invalid = 0
+    shed = 0
+    while True:
+        if not ready.acquire(timeout=0.05):
+            sink.maybe_flush()
+            if stop_event.is_set():
+                break
+            continue
+
+        # Alarms first: the semaphore counts both rings, so one of them has data
+        data = alarm_ring.get()
+        if data is None:
+            data = telemetry_ring.get()
+        else:
+            # Wakes submit() if it is waiting for room in the alarm ring
+            alarm_space.set()
+        if data is None:
+            continue
+
+        t_pc_rx_ms, topic_len = _REC.unpack_from(data)
+        topic = data[_REC.size:_REC.size + topic_len].decode("utf-8")
+        msg = decode_message(topic, data[_REC.size + topic_len:], codec, wire)
+        if msg is None:
+            invalid += 1
+            continue
+        msg.t_pc_rx_ms = t_pc_rx_ms
+        msg.worker = index
+
+        t_proc_start_ms = wall_ms()
+        if (
+            shed_expired
+            and msg.msg_type == "telemetry"
+            and t_proc_start_ms > msg.deadline_at(telemetry_deadline_ms)
+        ):
+            mark_shed(msg, t_proc_start_ms)
+            sink.add_event(*delivery.deliver(msg))
+            shed += 1
+            sink.maybe_flush()
+            continue
+
+        if msg.msg_type != "alarm" and inject_jitter_ms > 0:
+            time.sleep(random.randint(0, inject_jitter_ms) / 1000.0)
+        classify_into(msg, t_proc_start_ms, rules)
+        sink.add_event(*delivery.deliver(msg))
+        processed += 1
+        sink.maybe_flush()
+
+    state_cache = delivery.state_cache
+    db_stats = {}
+    if db_writer:
+        db_writer.stop()
+        state_cache = db_writer.state_cache
+        db_stats = {"dropped_db": db_writer.drop_count_telemetry, "queue_max_db": db_writer.queue_max_observed}
+        if db_writer.wal:
+            db_stats["wal"] = db_writer.wal_stats()
+    db_stats["db_errors"] = (db_writer or delivery).error_count
+    if (db_writer or delivery).hedger:
+        db_stats["hedge"] = (db_writer or delivery).hedger.policy.stats()
+    if isinstance(backend, SimBackend):
+        db_stats["rtdb_sim"] = backend.model.stats()
+    db_stats["state_written"] = state_cache.written
+    db_stats["state_suppressed"] = state_cache.suppressed
+    sink.flush()
+    result_queue.put(("done", index, dict(processed=processed, invalid=invalid, shed=shed, **db_stats)))
+    alarm_ring.close()
+    telemetry_ring.close()
+    logger.info("Pipeline worker %s stopped after %s messages", index, processed)
+
+
+class ProcessPipeline:
+    # The MQTT thread only timestamps the payload and copies the raw bytes into
+    # a per-worker shared-memory ring (alarm and telemetry rings per worker);
+    # worker processes decode, classify and write to the RTDB, then send trace
+    # rows and acks back in batches. Messages are sharded by device_id. Rings are
+    # FIFO, so pipeline.scheduler has no effect here; shed_expired does.
+
+    def __init__(
+        self,
+        cfg: Dict[str, object],
+        results_dir: str,
+        on_result: Callable[[ResultBatch], None],
+    ) -> None:
+        self._logger = logging.getLogger("pipeline")
+        self._cfg = cfg
+        self._results_dir = results_dir
+        self._on_result = on_result
+        self._wire = wire_from_cfg(cfg)
+        self._ctx = mp.get_context("spawn")
+        worker_count = max(1, int(get_cfg(cfg, "pipeline.workers", 1)))
+        ring_bytes = int(get_cfg(cfg, "pipeline.process.ring_kb", 4096)) * 1024
+
+        self._alarm_rings = [ShmRing(ring_bytes) for _ in range(worker_count)]
+        self._telemetry_rings = [ShmRing(ring_bytes) for _ in range(worker_count)]
+        self._ready = [self._ctx.Semaphore(0) for _ in range(worker_count)]
+        self._alarm_space = [self._ctx.Event() for _ in range(worker_count)]
+        self._alarm_put_timeout_s = int(get_cfg(cfg, "pipeline.process.alarm_put_timeout_ms", 100)) / 1000.0
+        self._result_queue = self._ctx.Queue()
+        self._stop_event = self._ctx.Event()
+        self._procs: List[mp.Process] = []
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._stopping = threading.Event()
+
+        self._drops = [0] * worker_count
+        self._alarm_drops = [0] * worker_count
+        self._queue_max = [0] * worker_count
+        self._worker_stats: Dict[int, Dict[str, int]] = {}
+
+    @property
+    def workers(self) -> int:
+        return len(self._ready)
+
+    @property
+    def drop_count_telemetry(self) -> int:
+        return sum(self._drops)
+
+    @property
+    def drop_count_alarm(self) -> int:
+        return sum(self._alarm_drops)
+
+    @property
+    def queue_max_observed(self) -> int:
+        return max(self._queue_max)
+
+    @property
+    def shed_count(self) -> int:
+        return sum(s.get("shed", 0) for s in self._worker_stats.values())
+
+    @property
+    def state_cache_stats(self) -> Dict[str, int]:
+        return {
+            "written": sum(s.get("state_written", 0) for s in self._worker_stats.values()),
+            "suppressed": sum(s.get("state_suppressed", 0) for s in self._worker_stats.values()),
+        }
+
+    @property
+    def db_errors(self) -> int:
+        return sum(s.get("db_errors", 0) for s in self._worker_stats.values())
+
+    @property
+    def rtdb_sim_stats(self) -> Optional[Dict[str, int]]:
+        stats = [s["rtdb_sim"] for s in self._worker_stats.values() if "rtdb_sim" in s]
+        return sim_summary(stats) if stats else None
+
+    @property
+    def wal_stats(self) -> Optional[Dict[str, int]]:
+        stats = [s["wal"] for s in self._worker_stats.values() if "wal" in s]
+        if not stats:
+            return None
+        return {k: sum(s[k] for s in stats) for k in stats[0]}
+
+    @property
+    def hedge_stats(self) -> Optional[Dict[str, object]]:
+        stats = [s["hedge"] for s in self._worker_stats.values() if "hedge" in s]
+        return hedge_summary(stats) if stats else None
+
+    @property
+    def db_stats(self) -> Tuple[int, int]:
+        dropped = sum(s.get("dropped_db", 0) for s in self._worker_stats.values())
+        queue_max = max([s.get("queue_max_db", 0) for s in self._worker_stats.values()] or [0])
+        return dropped, queue_max
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            proc = self._ctx.Process(
+                target=_worker_main,
+                args=(
+                    i,
+                    self._cfg,
+                    self._results_dir,
+                    self._alarm_rings[i].name,
+                    self._telemetry_rings[i].name,
+                    self._ready[i],
+                    self._alarm_space[i],
+                    self._result_queue,
+                    self._stop_event,
+                ),
+                name=f"pipeline-{i}",
+                daemon=True,
+            )
+            proc.start()
+            self._procs.append(proc)
+        self._collector.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._stop_event.set()
+        for proc in self._procs:
+            proc.join(timeout=10)
+            if proc.is_alive():
+                self._logger.warning("Pipeline worker %s did not exit, terminating", proc.name)
+                proc.terminate()
+        self._collector.join(timeout=5)
+        for ring in self._alarm_rings + self._telemetry_rings:
+            ring.close()
+
+    def shard_for(self, device_id: str) -> int:
+        if self.workers == 1:
+            return 0
+        return zlib.crc32(device_id.encode("utf-8")) % self.workers
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {
+            "alarm": sum(len(r) for r in self._alarm_rings),
+            "telemetry": sum(len(r) for r in self._telemetry_rings),
+        }
+
+    def shard_stats(self) -> List[Dict[str, object]]:
+        out = []
+        for i in range(self.workers):
+            worker = self._worker_stats.get(i, {})
+            out.append(
+                {
+                    "shard": i,
+                    "processed": worker.get("processed"),
+                    "invalid": worker.get("invalid"),
+                    "shed": worker.get("shed"),
+                    "dropped": self._drops[i],
+                    "dropped_alarm": self._alarm_drops[i],
+                    "queue_max": self._queue_max[i],
+                    "queue_depth": {"alarm": len(self._alarm_rings[i]), "telemetry": len(self._telemetry_rings[i])},
+                }
+            )
+        return out
+
+    def submit(self, topic: str, payload: bytes, t_pc_rx_ms: int) -> bool:
+        if self._stopping.is_set():
+            return False
+        device_id = self._wire.peek_device_id(payload)
+        shard = self.shard_for(device_id if device_id is not None else peek_device_id(payload))
+        topic_b = topic.encode("utf-8")
+        data = _REC.pack(t_pc_rx_ms, len(topic_b)) + topic_b + payload
+
+        # Priority comes from the topic since the payload is not decoded here
+        if topic_msg_type(topic) == "alarm":
+            if not self._put_alarm(shard, data):
+                return False
+        else:
+            ring = self._telemetry_rings[shard]
+            if not ring.put(data):
+                # Producer cannot evict from the ring, so every policy drops the newest
+                self._drops[shard] += 1
+                return False
+            depth = len(ring)
+            if depth > self._queue_max[shard]:
+                self._queue_max[shard] = depth
+        self._ready[shard].release()
+        return True
+
+    def _put_alarm(self, shard: int, data: bytes) -> bool:
+        # Runs on the MQTT thread, so a full alarm ring is waited on for at
+        # most alarm_put_timeout_ms (the worker sets alarm_space whenever it
+        # takes an alarm); after that the alarm is dropped and counted
+        ring = self._alarm_rings[shard]
+        space = self._alarm_space[shard]
+        end = time.monotonic() + self._alarm_put_timeout_s
+        while not ring.put(data):
+            remaining = end - time.monotonic()
+            if self._stopping.is_set() or remaining <= 0:
+                if not self._stopping.is_set():
+                    self._alarm_drops[shard] += 1
+                    if self._alarm_drops[shard] == 1:
+                        self._logger.warning("Alarm ring of worker %s full, dropping alarms", shard)
+                return False
+            space.clear()
+            # Re-checked after clear() so a get() in between is not missed
+            if ring.put(data):
+                break
+            space.wait(remaining)
+        return True
+
+    def _collect(self) -> None:
+        done = 0
+        while done < self.workers:
+            # Checked before the get: whatever an exited worker put is already
+            # in the pipe, so an empty get after that means nothing is left
+            exited = self._stopping.is_set() and not any(p.is_alive() for p in self._procs)
+            try:
+                kind, index, body = self._result_queue.get(timeout=0.2)
+            except queue.Empty:
+                if exited:
+                    break
+                continue
+            if kind == "batch":
+                self._on_result(body)
+            elif kind == "done":
+                self._worker_stats[index] = body
+                done += 1
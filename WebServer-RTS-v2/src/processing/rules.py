@@ -1,7 +1,17 @@
-from typing import Dict, Tuple
+import fnmatch
+import threading
+from itertools import chain
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
 
+from src.common.config import get_cfg
 from src.common.models import Message
 
+try:
+    import numpy as np
+except Exception:  # pragma: no cover
+    np = None
+
 
 DEFAULT_THRESHOLDS = {
     "temp": 60.0,
@@ -10,23 +20,184 @@ DEFAULT_THRESHOLDS = {
     "flame": 1.0,
 }
 
+# Checked in this order; the first reading at or over its threshold decides
+SENSORS = ("flame", "smoke", "gas", "temp")
+_RESULTS = (("ALARM", "flame"), ("WARN", "smoke"), ("WARN", "gas"), ("WARN", "temp"), ("NORMAL", "ok"))
+_FLAME, _SMOKE, _GAS, _TEMP, _OK = _RESULTS
+_ALARM_TYPE = ("ALARM", "alarm_type")
+_ALARM_PAYLOAD = ("ALARM", "alarm_payload")
+_READINGS = itemgetter(*SENSORS)
+_VALUES = attrgetter("values")
+_DEVICE = attrgetter("device_id")
+_ALARM = attrgetter("alarm")
+_TYPE = attrgetter("msg_type")
+# NumPy dtype kinds (bool, int, uint, float) of readings the vectorised path
+# compares like classify() does
+_NUMERIC_KINDS = "biuf"
+
+Evaluator = Callable[[Mapping[str, Any]], Tuple[str, str]]
+
+
+def _compile(thresholds: Sequence[float]) -> Evaluator:
+    # One closure per distinct threshold set, thresholds bound as cell
+    # variables: no dict lookups or loops per message
+    flame, smoke, gas, temp = thresholds
+
+    def evaluate(values: Mapping[str, Any]) -> Tuple[str, str]:
+        get = values.get
+        if get("flame", 0) >= flame:
+            return _FLAME
+        if get("smoke", 0) >= smoke:
+            return _SMOKE
+        if get("gas", 0) >= gas:
+            return _GAS
+        if get("temp", 0) >= temp:
+            return _TEMP
+        return _OK
+
+    return evaluate
+
+
+def _alarm_payload(alarm: Optional[Dict[str, Any]]) -> bool:
+    return bool(alarm) and (alarm.get("fire_detected") is True or alarm.get("level") == "ALARM")
+
+
+class _DeviceTable(dict):
+    # device_id -> index of its threshold set, resolved on first sight
+    def __init__(self, rules: "RuleSet") -> None:
+        super().__init__()
+        self._rules = rules
+
+    def __missing__(self, device_id: str) -> int:
+        index = self[device_id] = self._rules._resolve(device_id)
+        return index
+
+
+class RuleSet:
+    # Thresholds per device: rules.thresholds, overridden by the first zone in
+    # rules.zones whose `devices` (ids or fnmatch patterns) match, overridden
+    # by rules.devices[device_id]. A threshold of None disables that check.
+    # Every distinct set is compiled once; devices are mapped to their set the
+    # first time they are seen.
+
+    def __init__(
+        self,
+        thresholds: Optional[Mapping[str, Optional[float]]] = None,
+        zones: Optional[Mapping[str, Mapping[str, Any]]] = None,
+        devices: Optional[Mapping[str, Mapping[str, Optional[float]]]] = None,
+    ) -> None:
+        self._base = dict(DEFAULT_THRESHOLDS)
+        self._base.update(thresholds or {})
+        self._zones = [
+            (tuple(zone.get("devices") or ()), dict(zone.get("thresholds") or {})) for zone in (zones or {}).values()
+        ]
+        self._devices = {device_id: dict(t) for device_id, t in (devices or {}).items()}
+        self._uniform = not self._zones and not self._devices
+
+        # Pipeline shards share one RuleSet; new sets are added under the lock
+        self._lock = threading.Lock()
+        self._sets: Dict[Tuple[float, ...], int] = {}
+        self._keys: List[Tuple[float, ...]] = []
+        self._evaluators: List[Evaluator] = []
+        self._table: Any = None
+        self._by_device = _DeviceTable(self)
+        self._default = self._add(self._base)
+
+    @classmethod
+    def from_cfg(cls, cfg: Dict[str, object]) -> "RuleSet":
+        return cls(
+            get_cfg(cfg, "rules.thresholds", DEFAULT_THRESHOLDS),
+            get_cfg(cfg, "rules.zones", {}),
+            get_cfg(cfg, "rules.devices", {}),
+        )
+
+    def _add(self, thresholds: Mapping[str, Optional[float]]) -> int:
+        key = tuple(float("inf") if thresholds[s] is None else float(thresholds[s]) for s in SENSORS)
+        with self._lock:
+            index = self._sets.get(key)
+            if index is None:
+                index = len(self._evaluators)
+                self._evaluators.append(_compile(key))
+                self._keys.append(key)
+                self._sets[key] = index
+                self._table = None
+            return index
+
+    def _resolve(self, device_id: str) -> int:
+        merged = dict(self._base)
+        for patterns, thresholds in self._zones:
+            if any(fnmatch.fnmatchcase(device_id, p) for p in patterns):
+                merged.update(thresholds)
+                break
+        merged.update(self._devices.get(device_id, {}))
+        return self._add(merged)
+
+    def evaluator(self, device_id: str) -> Evaluator:
+        return self._evaluators[self._default if self._uniform else self._by_device[device_id]]
+
+    def classify(self, message: Message) -> Tuple[str, str]:
+        if message.msg_type == "alarm":
+            return _ALARM_TYPE
+        if message.alarm and _alarm_payload(message.alarm):
+            return _ALARM_PAYLOAD
+        return self.evaluator(message.device_id)(message.values or {})
+
+    def classify_batch(self, messages: Sequence[Message]) -> None:
+        # Sets severity and notes of every message, with one vectorised
+        # comparison per sensor column for the whole batch. Messages missing a
+        # reading, or with one that is not a number, fall back to classify().
+        n = len(messages)
+        if np is None or n < 2:
+            self._classify_each(messages)
+            return
+        # Readings, threshold rows and results are gathered with map() over
+        # C-level getters; the only Python loop left stores the results.
+        # The readings' dtype is inferred rather than forced to float64, which
+        # would convert "1.5" or None where classify() raises: a string, None
+        # or an int too large for int64 gives a non-numeric dtype instead.
+        try:
+            readings = np.array(list(chain.from_iterable(map(_READINGS, map(_VALUES, messages)))))
+            if readings.dtype.kind not in _NUMERIC_KINDS:
+                raise TypeError("non-numeric reading")
+            readings = readings.reshape(n, 4)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            self._classify_each(messages)
+            return
+
+        if self._uniform:
+            limits = self._table_array()[self._default]
+        else:
+            # Devices seen for the first time may add threshold sets, so the
+            # table is fetched after their lookup
+            index = np.fromiter(map(self._by_device.__getitem__, map(_DEVICE, messages)), dtype=np.intp, count=n)
+            limits = self._table_array()[index]
+        # Column i is True where sensor i is over its threshold; column 4 is
+        # always True, so argmax is the first sensor over, or 4 for "ok"
+        over = np.ones((n, 5), dtype=bool)
+        np.greater_equal(readings, limits, out=over[:, :4])
+        code = over.argmax(axis=1)
+
+        for msg, result in zip(messages, map(_RESULTS.__getitem__, code.tolist())):
+            msg.severity, msg.notes = result
+        if any(map(_ALARM, messages)) or "alarm" in map(_TYPE, messages):
+            for msg in messages:
+                if msg.alarm or msg.msg_type == "alarm":
+                    msg.severity, msg.notes = self.classify(msg)
+
+    def _classify_each(self, messages: Sequence[Message]) -> None:
+        for msg in messages:
+            msg.severity, msg.notes = self.classify(msg)
+
+    def _table_array(self) -> Any:
+        table = self._table
+        if table is None:
+            with self._lock:
+                table = self._table = np.array(self._keys, dtype=np.float64).reshape(-1, 4)
+        return table
 
-def classify(message: Message) -> Tuple[str, str]:
-    if message.msg_type == "alarm":
-        return "ALARM", "alarm_type"
 
-    alarm = message.alarm or {}
-    if alarm.get("fire_detected") is True or alarm.get("level") == "ALARM":
-        return "ALARM", "alarm_payload"
+DEFAULT_RULES = RuleSet()
 
-    values = message.values or {}
-    if values.get("flame", 0) >= DEFAULT_THRESHOLDS["flame"]:
-        return "ALARM", "flame"
-    if values.get("smoke", 0) >= DEFAULT_THRESHOLDS["smoke"]:
-        return "WARN", "smoke"
-    if values.get("gas", 0) >= DEFAULT_THRESHOLDS["gas"]:
-        return "WARN", "gas"
-    if values.get("temp", 0) >= DEFAULT_THRESHOLDS["temp"]:
-        return "WARN", "temp"
 
-    return "NORMAL", "ok"
+def classify(message: Message, rules: Optional[RuleSet] = None) -> Tuple[str, str]:
+    return (rules or DEFAULT_RULES).classify(message)
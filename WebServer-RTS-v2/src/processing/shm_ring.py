@@ -0,0 +1,89 @@
+import struct
+from multiprocessing import shared_memory
+from typing import Optional
+
+
+# Header: head (bytes written), tail (bytes consumed), puts, gets; all u64 and
+# monotonically increasing. Only the producer writes head/puts and only the
+# consumer writes tail/gets, so a single-producer/single-consumer ring needs no
+# lock. Callers pair put()/get() with a semaphore, which also orders the memory
+# accesses between the two processes.
+_HEADER = struct.Struct("<QQQQ")
+_HEADER_SIZE = 64
+_LEN = struct.Struct("<I")
+_WRAP = 0xFFFFFFFF
+
+
+class ShmRing:
+    def __init__(self, capacity: int = 4 * 1024 * 1024, name: Optional[str] = None) -> None:
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + capacity)
+            self._owner = True
+            _HEADER.pack_into(self._shm.buf, 0, 0, 0, 0, 0)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+        self.capacity = self._shm.size - _HEADER_SIZE
+        self._buf = self._shm.buf
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def _read(self, idx: int) -> int:
+        return struct.unpack_from("<Q", self._buf, idx * 8)[0]
+
+    def _write(self, idx: int, value: int) -> None:
+        struct.pack_into("<Q", self._buf, idx * 8, value)
+
+    def __len__(self) -> int:
+        if self._buf is None:
+            return 0
+        return self._read(2) - self._read(3)
+
+    def put(self, data: bytes) -> bool:
+        need = _LEN.size + len(data)
+        if need > self.capacity:
+            return False
+        head = self._read(0)
+        tail = self._read(1)
+        off = head % self.capacity
+        contiguous = self.capacity - off
+        skip = contiguous if contiguous < need else 0
+        if head + skip + need - tail > self.capacity:
+            return False
+        if skip:
+            if contiguous >= _LEN.size:
+                _LEN.pack_into(self._buf, _HEADER_SIZE + off, _WRAP)
+            head += skip
+            off = 0
+        _LEN.pack_into(self._buf, _HEADER_SIZE + off, len(data))
+        start = _HEADER_SIZE + off + _LEN.size
+        self._buf[start:start + len(data)] = data
+        # Publish the record only after its bytes are in place
+        self._write(0, head + need)
+        self._write(2, self._read(2) + 1)
+        return True
+
+    def get(self) -> Optional[bytes]:
+        head = self._read(0)
+        tail = self._read(1)
+        if tail == head:
+            return None
+        off = tail % self.capacity
+        contiguous = self.capacity - off
+        if contiguous < _LEN.size or _LEN.unpack_from(self._buf, _HEADER_SIZE + off)[0] == _WRAP:
+            tail += contiguous
+            off = 0
+        (length,) = _LEN.unpack_from(self._buf, _HEADER_SIZE + off)
+        start = _HEADER_SIZE + off + _LEN.size
+        data = bytes(self._buf[start:start + length])
+        self._write(1, tail + _LEN.size + length)
+        self._write(3, self._read(3) + 1)
+        return data
+
+    def close(self) -> None:
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
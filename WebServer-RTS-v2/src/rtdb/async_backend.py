@@ -0,0 +1,108 @@
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional
+
+from src.common.codec import JsonCodec, codec_from_cfg, get_codec
+from src.common.config import get_cfg
+from src.common.time_utils import wall_ms
+from src.rtdb.firebase_backend import FirebaseBackend
+from src.rtdb.mock_backend import _PATHS, MockBackend
+from src.rtdb.rtdb_interface import BatchOp, RTDBInterface
+from src.rtdb.sim_backend import RtdbSimModel, RtdbWriteError, sim_model_from_cfg
+
+
+class AsyncBackend(ABC):
+    @abstractmethod
+    async def write_batch(self, ops: List[BatchOp]) -> int:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        # Blocking I/O; the collector calls it from an executor
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class AsyncMockBackend(AsyncBackend):
+    # The ack delay is an asyncio.sleep, so many writes can be in flight on one
+    # thread; lines are buffered and appended by flush() off the loop
+
+    def __init__(self, output_path: str, ack_delay_ms: int = 0, codec: Optional[JsonCodec] = None) -> None:
+        self.output_path = output_path
+        self.ack_delay_ms = ack_delay_ms
+        self._codec = codec or get_codec()
+        self._pending: Deque[bytes] = deque()
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    async def write_batch(self, ops: List[BatchOp]) -> int:
+        for kind, key, data in ops:
+            self._pending.append(self._codec.dumps({"path": _PATHS[kind].format(key), "data": data}) + b"\n")
+        return await self._ack(len(ops))
+
+    async def _ack(self, ops: int) -> int:
+        if self.ack_delay_ms > 0:
+            await asyncio.sleep(self.ack_delay_ms / 1000.0)
+        return wall_ms()
+
+    def flush(self) -> None:
+        lines = [self._pending.popleft() for _ in range(len(self._pending))]
+        if lines:
+            with open(self.output_path, "ab") as f:
+                f.write(b"".join(lines))
+
+    async def close(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+
+class AsyncSimBackend(AsyncMockBackend):
+    # AsyncMockBackend with acks from an RtdbSimModel (see sim_backend)
+
+    def __init__(self, output_path: str, model: RtdbSimModel, codec: Optional[JsonCodec] = None) -> None:
+        super().__init__(output_path, 0, codec)
+        self.model = model
+
+    async def _ack(self, ops: int) -> int:
+        ack_at, error = self.model.plan(ops, time.time() * 1000.0)
+        delay_s = (ack_at - time.time() * 1000.0) / 1000.0
+        if delay_s > 0:
+            await asyncio.sleep(delay_s)
+        if error is not None:
+            raise RtdbWriteError(error)
+        return wall_ms()
+
+
+class ExecutorBackend(AsyncBackend):
+    # Blocking backends (firebase_admin) run on a bounded thread pool; the pool
+    # size caps how many requests are in flight against the service
+
+    def __init__(self, backend: RTDBInterface, max_workers: int) -> None:
+        self._backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="rtdb")
+
+    async def write_batch(self, ops: List[BatchOp]) -> int:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._backend.write_batch, ops)
+
+    async def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def build_async_backend(cfg: Dict[str, object], results_dir: str) -> AsyncBackend:
+    mock_path = os.path.join(results_dir, "mock_rtdb.jsonl")
+    ack_delay_ms = int(get_cfg(cfg, "rtdb.mock.ack_delay_ms", 0))
+    codec = codec_from_cfg(cfg)
+    if get_cfg(cfg, "rtdb.mode", "mock") == "firebase":
+        backend = FirebaseBackend(
+            get_cfg(cfg, "rtdb.firebase.service_account_json", ""),
+            get_cfg(cfg, "rtdb.firebase.database_url", ""),
+            fallback=MockBackend(mock_path, ack_delay_ms, codec),
+        )
+        return ExecutorBackend(backend, int(get_cfg(cfg, "rtdb.writer.inflight", 1)))
+    if get_cfg(cfg, "rtdb.mode", "mock") == "sim":
+        return AsyncSimBackend(mock_path, sim_model_from_cfg(cfg), codec)
+    return AsyncMockBackend(mock_path, ack_delay_ms, codec)
+
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+from src.common.models import Message
+from src.common.sched_queue import AsyncSchedQueue
+from src.common.time_utils import monotonic_ms
+from src.rtdb.async_backend import AsyncBackend
+from src.rtdb.db_writer import TelemetryCoalescer, build_ops
+from src.rtdb.hedge import AsyncHedgedWriter
+from src.rtdb.rtdb_interface import log_write_error
+from src.rtdb.state_cache import StateCache
+
+
+class AsyncDbWriter:
+    # DbWriter on the collector's event loop (AsyncDelivery, write_mode
+    # async): alarms and status through the scheduler, telemetry coalesced
+    # per device and flushed in batches of up to batch_limit every
+    # flush_interval_ms. `inflight` writer tasks each keep one backend write
+    # in flight, `alarm_reserved` of them only take alarms. Producers run on
+    # the loop and cannot block, so a full status queue drops (DbWriter
+    # waits). There is no WAL; collector_async refuses rtdb.writer.wal.
+
+    def __init__(
+        self,
+        backend: AsyncBackend,
+        ack_writer: object,
+        cfg: Dict[str, object],
+        state_cache: StateCache,
+        hedger: Optional[AsyncHedgedWriter] = None,
+        on_db_time: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        self._logger = logging.getLogger("db_writer")
+        self._backend = backend
+        self._ack_writer = ack_writer
+        self._on_db_time = on_db_time
+        self.state_cache = state_cache
+        self.hedger = hedger
+
+        writer_cfg = cfg["rtdb"]["writer"]
+        self._flush_interval_ms = int(writer_cfg["flush_interval_ms"])
+        self._batch_limit = int(writer_cfg["batch_limit"])
+        self._inflight = max(1, int(writer_cfg["inflight"]))
+        self._alarm_reserved = min(int(writer_cfg["alarm_reserved"]), self._inflight - 1)
+        self._edf = str(writer_cfg["scheduler"]) == "edf"
+        self._alarm_deadline_ms = int(cfg["deadlines"]["alarm_deadline_ms"])
+        self._telemetry_deadline_ms = int(cfg["deadlines"]["telemetry_deadline_ms"])
+        self._avi_state_ms = int(cfg["freshness"]["avi_state_ms"])
+
+        self._queue = AsyncSchedQueue(
+            {"alarm": int(writer_cfg["alarm_queue_max"]), "status": int(writer_cfg["state_queue_max"])},
+            edf=self._edf,
+        )
+        self._wake = asyncio.Event()
+        self._telemetry = TelemetryCoalescer(
+            int(writer_cfg["telemetry_queue_max"]),
+            str(writer_cfg["telemetry_drop_policy"]),
+            self._batch_limit,
+            self._wake.set,
+        )
+        self._next_flush = monotonic_ms() + self._flush_interval_ms
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+
+        self.drop_count_status = 0
+        self.error_count = 0
+
+    def start(self) -> None:
+        # Needs the running loop
+        self._tasks = [
+            asyncio.ensure_future(self._run(alarms_only=i < self._alarm_reserved)) for i in range(self._inflight)
+        ]
+
+    @property
+    def drop_count(self) -> int:
+        # Non-alarm writes dropped: telemetry over telemetry_queue_max and
+        # status over state_queue_max
+        return self._telemetry.drop_count + self.drop_count_status
+
+    @property
+    def queue_max_observed(self) -> int:
+        return self._telemetry.max_observed
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {
+            "alarm": self._queue.depth("alarm"),
+            "state": self._queue.depth("status"),
+            "telemetry": len(self._telemetry),
+        }
+
+    def enqueue(self, msg: Message) -> bool:
+        # Same contract as DbWriter.enqueue
+        msg_type = msg.msg_type
+        if msg_type == "status" and not self.state_cache.should_write(msg.device_id, msg.severity, msg.values):
+            msg.notes = (msg.notes + ";state_suppressed").strip(";")
+            return True
+        if msg_type == "alarm":
+            self._queue.push(msg_type, msg, self._deadline(msg))
+        elif msg_type == "status":
+            if not self._queue.offer(msg_type, msg, self._deadline(msg)):
+                self.drop_count_status += 1
+                return False
+        else:
+            return self._telemetry.add(msg)
+        self._wake.set()
+        return True
+
+    async def close(self) -> None:
+        # Writes everything queued, then the writer tasks exit
+        self._closing = True
+        self._wake.set()
+        await asyncio.gather(*self._tasks)
+
+    def _deadline(self, msg: Message) -> Optional[int]:
+        if not self._edf:
+            return None
+        return msg.deadline_at(self._alarm_deadline_ms if msg.msg_type == "alarm" else self._telemetry_deadline_ms)
+
+    async def _run(self, alarms_only: bool) -> None:
+        only = ("alarm",) if alarms_only else None
+        while True:
+            entry = self._queue.get_nowait(only)
+            if entry is not None:
+                await self._write_records([entry[1]])
+                continue
+            timeout = None
+            if not alarms_only and self._telemetry:
+                wait_ms = self._claim_flush()
+                if wait_ms is None:
+                    await self._write_records(self._telemetry.take(self._batch_limit))
+                    continue
+                timeout = wait_ms / 1000.0
+            elif self._closing:
+                return
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _claim_flush(self) -> Optional[int]:
+        # As DbWriter._claim_flush; while closing everything is due
+        now = monotonic_ms()
+        if self._closing or now >= self._next_flush or len(self._telemetry) >= self._batch_limit:
+            self._next_flush = now + self._flush_interval_ms
+            return None
+        return self._next_flush - now
+
+    async def _write_records(self, records: List[Message]) -> None:
+        ops = build_ops(records, self.state_cache, self._avi_state_ms)
+        try:
+            if self.hedger is not None and records[0].msg_type == "alarm":
+                ack_ms = (await self.hedger.write_batch(ops))[0]
+            else:
+                ack_ms = await self._backend.write_batch(ops)
+        except Exception as exc:
+            self.error_count += 1
+            log_write_error(self._logger, self.error_count, exc)
+            for kind, key, _ in ops:
+                if kind == "state":
+                    self.state_cache.forget(key)
+            return
+
+        for msg in records:
+            self._ack_writer.write_ack(msg.msg_id, ack_ms)
+            if self._on_db_time is not None and msg.t_db_enqueue_ms is not None:
+                self._on_db_time(ack_ms - msg.t_db_enqueue_ms)
@@ -1,20 +1,120 @@
+import heapq
+import itertools
 import logging
-import queue
+import os
 import threading
-import time
 from collections import deque
-from typing import Deque, Dict, Optional
+from typing import Callable, Deque, Dict, List, Optional, Tuple
 
+from src.common.codec import codec_from_cfg
+from src.common.metrics import LatencySketch
+from src.common.models import Message
+from src.common.sched_queue import SchedQueue
 from src.common.time_utils import monotonic_ms
-from src.rtdb.rtdb_interface import RTDBInterface
+from src.rtdb.hedge import HedgedWriter, HedgePolicy
+from src.rtdb.payloads import build_alarm, build_state, build_telemetry
+from src.rtdb.rtdb_interface import BatchOp, RTDBInterface, log_write_error
+from src.rtdb.state_cache import StateCache
+from src.rtdb.wal import WriteAheadLog
 from src.common.trace import AckWriter
 
 
+class TelemetryCoalescer:
+    # Latest unwritten telemetry per device, handed out oldest device first.
+    # With `capacity` devices waiting, keep_latest evicts the oldest device's
+    # reading and drop refuses the new device. wake() is called when a new
+    # device makes the first or the batch_limit-th entry, so a writer can arm
+    # its flush timer or flush a full batch; readings that will never be
+    # written (superseded, evicted, refused) go to on_discard. Not
+    # thread-safe: DbWriter holds its telemetry lock around it.
+
+    def __init__(
+        self,
+        capacity: int,
+        drop_policy: str,
+        batch_limit: int,
+        wake: Callable[[], None],
+        on_discard: Optional[Callable[[Message], None]] = None,
+    ) -> None:
+        self.capacity = capacity
+        self.drop_policy = drop_policy
+        self._batch_limit = batch_limit
+        self._wake = wake
+        self._on_discard = on_discard
+        self.latest: Dict[str, Message] = {}
+        self._order: Deque[str] = deque()
+        self.drop_count = 0
+        self.max_observed = 0
+
+    def __len__(self) -> int:
+        return len(self.latest)
+
+    def _discard(self, msg: Optional[Message]) -> None:
+        if msg is not None and self._on_discard is not None:
+            self._on_discard(msg)
+
+    def add(self, msg: Message) -> bool:
+        latest = self.latest
+        device_id = msg.device_id
+        if device_id in latest:
+            self._discard(latest[device_id])
+            latest[device_id] = msg
+        else:
+            if len(latest) >= self.capacity:
+                if self.drop_policy == "keep_latest" and self._order:
+                    self._discard(latest.pop(self._order.popleft(), None))
+                    self.drop_count += 1
+                else:
+                    self.drop_count += 1
+                    self._discard(msg)
+                    return False
+            latest[device_id] = msg
+            self._order.append(device_id)
+            if len(latest) in (1, self._batch_limit):
+                self._wake()
+
+        if len(latest) > self.max_observed:
+            self.max_observed = len(latest)
+        return True
+
+    def take(self, limit: int) -> List[Message]:
+        records = []
+        while self._order and len(records) < limit:
+            record = self.latest.pop(self._order.popleft(), None)
+            if record is not None:
+                records.append(record)
+        return records
+
+
+def build_ops(records: List[Message], state_cache: StateCache, avi_state_ms: int) -> List[BatchOp]:
+    # State and payload for every record, written as one backend batch, so a
+    # flush costs one round trip instead of two per record
+    ops: List[BatchOp] = []
+    for msg in records:
+        device_id = msg.device_id
+        # Status records passed the state cache when they were queued
+        if msg.msg_type == "status" or state_cache.should_write(device_id, msg.severity, msg.values):
+            ops.append(("state", device_id, build_state(msg, msg.severity, avi_state_ms, "sim")))
+        if msg.msg_type == "alarm":
+            ops.append(("alarm", msg.msg_id, build_alarm(msg, msg.severity)))
+        elif msg.msg_type == "telemetry":
+            ops.append(("telemetry", device_id, build_telemetry(msg)))
+    return ops
+
+
 class DbWriter:
-    def __init__(self, backend: RTDBInterface, ack_writer: AckWriter, cfg: Dict[str, object]) -> None:
+    def __init__(
+        self,
+        backend: RTDBInterface,
+        ack_writer: AckWriter,
+        cfg: Dict[str, object],
+        on_db_time: Optional[Callable[[int], None]] = None,
+        wal_name: str = "",
+    ) -> None:
         self._logger = logging.getLogger("db_writer")
         self._backend = backend
         self._ack_writer = ack_writer
+        self._on_db_time = on_db_time
 
         writer_cfg = cfg["rtdb"]["writer"]
         self._flush_interval_ms = int(writer_cfg["flush_interval_ms"])
@@ -23,127 +123,324 @@ class DbWriter:
         self._telemetry_queue_max = int(writer_cfg["telemetry_queue_max"])
         self._alarm_queue_max = int(writer_cfg["alarm_queue_max"])
         self._state_queue_max = int(writer_cfg["state_queue_max"])
+        self._inflight = max(1, int(writer_cfg["inflight"]))
+        self._alarm_reserved = min(int(writer_cfg["alarm_reserved"]), self._inflight - 1)
+        self._edf = str(writer_cfg["scheduler"]) == "edf"
+        self._alarm_deadline_ms = int(cfg["deadlines"]["alarm_deadline_ms"])
+        self._telemetry_deadline_ms = int(cfg["deadlines"]["telemetry_deadline_ms"])
+        self._avi_state_ms = int(cfg["freshness"]["avi_state_ms"])
 
-        self._alarm_queue: queue.Queue = queue.Queue(maxsize=self._alarm_queue_max)
-        self._state_queue: queue.Queue = queue.Queue(maxsize=self._state_queue_max)
-        self._telemetry_latest: Dict[str, Dict[str, object]] = {}
-        self._telemetry_order: Deque[str] = deque()
+        # Alarms and status go through the scheduler; telemetry is coalesced
+        # per device below and flushed in batches by the writer threads
+        self._queue = SchedQueue(
+            {"alarm": self._alarm_queue_max, "status": self._state_queue_max},
+            edf=self._edf,
+        )
+        self._telemetry = TelemetryCoalescer(
+            self._telemetry_queue_max,
+            self._telemetry_drop_policy,
+            self._batch_limit,
+            self._queue.wake,
+            self._wal_forget,
+        )
+        self._telemetry_lock = threading.Lock()
 
+        # `inflight` writer threads each keep one backend write in flight;
+        # `alarm_reserved` of them only take alarms so an alarm never waits
+        # for a slot held by telemetry or status writes
         self._stop_event = threading.Event()
-        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._next_flush = monotonic_ms() + self._flush_interval_ms
+        self._flush_lock = threading.Lock()
+        self._sketch_lock = threading.Lock()
+        self._threads = [
+            threading.Thread(
+                target=self._run_alarms if i < self._alarm_reserved else self._run,
+                name=f"db-writer-{i}",
+                daemon=True,
+            )
+            for i in range(self._inflight)
+        ]
+
+        # Messages of the wal.types are logged before they are queued and
+        # acked in the log once written; wal_name separates the logs of
+        # several writers (process pipeline workers) under wal.dir
+        wal_cfg = writer_cfg["wal"]
+        self.wal: Optional[WriteAheadLog] = None
+        self._wal_types: Tuple[str, ...] = ()
+        if bool(wal_cfg["enabled"]):
+            self.wal = WriteAheadLog(
+                os.path.join(str(wal_cfg["dir"]), wal_name),
+                int(wal_cfg["fsync_interval_ms"]),
+                int(wal_cfg["segment_mb"]) * 1024 * 1024,
+                codec_from_cfg(cfg),
+            )
+            self._wal_types = tuple(wal_cfg["types"])
 
-        self.drop_count_telemetry = 0
-        self.queue_max_observed = 0
+        # A logged message whose write failed is retried after an exponential
+        # backoff, (monotonic due ms, seq, msg) in _retry_heap, for at most
+        # max_attempts writes in all; after that it stays pending in the log
+        # and is replayed on the next start
+        retry_cfg = wal_cfg["retry"]
+        self._retry_max_attempts = max(1, int(retry_cfg["max_attempts"]))
+        self._retry_backoff_ms = int(retry_cfg["backoff_ms"])
+        self._retry_backoff_max_ms = int(retry_cfg["backoff_max_ms"])
+        self._retry_heap: List[Tuple[int, int, Message]] = []
+        self._retry_seq = itertools.count()
+        self._retry_lock = threading.Lock()
+        self._attempts: Dict[str, int] = {}
+
+        # rtdb.alarm_write.strategy: hedged races every alarm's batch against
+        # a duplicate of its alarm document (never the state, see hedge.py);
+        # alarms are written one record per batch, so a hedge never repeats
+        # a telemetry push
+        self.state_cache = StateCache.from_cfg(cfg)
+        self.hedger: Optional[HedgedWriter] = None
+        if cfg["rtdb"]["alarm_write"]["strategy"] == "hedged":
+            self.hedger = HedgedWriter(backend, HedgePolicy.from_cfg(cfg), self._inflight, self.state_cache.forget)
+
+        self.error_count = 0
+        self.retry_count = 0
+        self.gave_up_count = 0
+        self.replay_count = 0
+        self.db_time_sketch = LatencySketch(float(cfg["metrics"]["sketch_alpha"]))
 
     def start(self) -> None:
-        self._thread.start()
+        recovered = self.wal.open() if self.wal else []
+        for thread in self._threads:
+            thread.start()
+        # Writes left unacknowledged by a previous run go out first
+        for msg in recovered:
+            msg.replayed = True
+            if msg.msg_type == "telemetry":
+                with self._telemetry_lock:
+                    self._telemetry.add(msg)
+            else:
+                self._queue.put(msg.msg_type, msg, self._deadline(msg))
+
+    @property
+    def drop_count_telemetry(self) -> int:
+        return self._telemetry.drop_count
+
+    @property
+    def queue_max_observed(self) -> int:
+        return self._telemetry.max_observed
 
     def stop(self) -> None:
         self._stop_event.set()
-        self._thread.join(timeout=2)
-        self._flush_all()
+        self._queue.close()
+        stuck = []
+        for thread in self._threads:
+            thread.join(timeout=2)
+            if thread.is_alive():
+                stuck.append(thread.name)
+        if stuck:
+            # A thread still inside a backend write would race the final
+            # flush; what is queued is left (logged types stay in the WAL)
+            self._logger.warning(
+                "DB writer threads %s did not exit, not flushing %s queued writes",
+                ", ".join(stuck),
+                len(self._queue) + len(self._telemetry),
+            )
+        else:
+            self._flush_all()
+        if self.hedger:
+            self.hedger.close()
+        if self.wal:
+            # Whatever failed to write stays in the log for the next start
+            self.wal.close()
 
-    def enqueue(self, record: Dict[str, object]) -> bool:
-        msg_type = str(record.get("msg_type"))
-        device_id = str(record.get("device_id"))
+    def wal_stats(self) -> Optional[Dict[str, int]]:
+        if self.wal is None:
+            return None
+        return {
+            "appended": self.wal.appended,
+            "acked": self.wal.acked,
+            "pending": self.wal.pending(),
+            "recovered": self.wal.recovered,
+            "replayed": self.replay_count,
+            "skipped": self.wal.skipped,
+            "retried": self.retry_count,
+            "gave_up": self.gave_up_count,
+            "commits": self.wal.commits,
+        }
 
-        if msg_type == "alarm":
-            self._alarm_queue.put(record)
+    def queue_depths(self) -> Dict[str, int]:
+        return {
+            "alarm": self._queue.depth("alarm"),
+            "state": self._queue.depth("status"),
+            "telemetry": len(self._telemetry),
+        }
+
+    def enqueue(self, msg: Message) -> bool:
+        # msg must carry severity and t_db_enqueue_ms; the RTDB documents are
+        # built at write time, so coalesced telemetry never builds any
+        msg_type = msg.msg_type
+        if msg_type == "status" and not self.state_cache.should_write(msg.device_id, msg.severity, msg.values):
+            # Unchanged status: nothing to write, so it is not queued and gets
+            # no ack or DB time; checked here so the note reaches the trace
+            msg.notes = (msg.notes + ";state_suppressed").strip(";")
             return True
+        if msg_type in self._wal_types:
+            self.wal.append(msg)
 
-        if msg_type == "status":
-            self._state_queue.put(record)
+        if msg_type in ("alarm", "status"):
+            self._queue.put(msg_type, msg, self._deadline(msg))
             return True
 
-        # telemetry path
-        if device_id in self._telemetry_latest:
-            self._telemetry_latest[device_id] = record
-        else:
-            if len(self._telemetry_latest) >= self._telemetry_queue_max:
-                if self._telemetry_drop_policy == "keep_latest":
-                    if self._telemetry_order:
-                        oldest = self._telemetry_order.popleft()
-                        self._telemetry_latest.pop(oldest, None)
-                        self.drop_count_telemetry += 1
-                    else:
-                        self.drop_count_telemetry += 1
-                        return False
-                else:
-                    self.drop_count_telemetry += 1
-                    return False
-            self._telemetry_latest[device_id] = record
-            self._telemetry_order.append(device_id)
+        # telemetry path; pipeline workers may enqueue concurrently
+        with self._telemetry_lock:
+            return self._telemetry.add(msg)
 
-        qsize = len(self._telemetry_latest)
-        if qsize > self.queue_max_observed:
-            self.queue_max_observed = qsize
-        return True
+    def _deadline(self, msg: Message) -> Optional[int]:
+        if not self._edf:
+            return None
+        return msg.deadline_at(self._alarm_deadline_ms if msg.msg_type == "alarm" else self._telemetry_deadline_ms)
+
+    def _wal_forget(self, msg: Optional[Message]) -> None:
+        # Telemetry superseded or dropped on purpose is done as far as the
+        # log is concerned
+        if msg is not None and msg.msg_type in self._wal_types:
+            self.wal.ack(msg.msg_id)
 
     def _run(self) -> None:
-        next_flush = monotonic_ms() + self._flush_interval_ms
         while not self._stop_event.is_set():
-            item = None
-            try:
-                item = self._alarm_queue.get_nowait()
-            except queue.Empty:
-                pass
-
-            if item is None:
-                try:
-                    item = self._state_queue.get_nowait()
-                except queue.Empty:
-                    pass
-
-            if item is not None:
-                self._write_record(item)
-                continue
+            retry_ms = self._requeue_due()
+            entry = self._queue.get(timeout=0)
+            if entry is None:
+                # Idle wait is bounded so a wake() racing this check is never lost
+                timeout = max(self._flush_interval_ms, 10) / 1000.0
+                if self._telemetry:
+                    wait_ms = self._claim_flush()
+                    if wait_ms is None:
+                        self._flush_batch(self._batch_limit)
+                        continue
+                    timeout = wait_ms / 1000.0
+                if retry_ms is not None:
+                    timeout = min(timeout, retry_ms / 1000.0)
+                entry = self._queue.get(timeout=timeout)
 
-            now = monotonic_ms()
-            if self._telemetry_latest and (now >= next_flush or len(self._telemetry_latest) >= self._batch_limit):
-                self._flush_batch(self._batch_limit)
-                next_flush = monotonic_ms() + self._flush_interval_ms
-                continue
+            if entry is not None:
+                self._write_record(entry[1])
 
-            time.sleep(0.01)
+    def _run_alarms(self) -> None:
+        while not self._stop_event.is_set():
+            retry_ms = self._requeue_due()
+            timeout = 0.5 if retry_ms is None else min(0.5, retry_ms / 1000.0)
+            entry = self._queue.get(timeout=timeout, only=("alarm",))
+            if entry is not None:
+                self._write_record(entry[1])
+
+    def _claim_flush(self) -> Optional[int]:
+        # None when this thread should flush a batch now (and the timer is
+        # re-armed for the others), else milliseconds until the next flush
+        with self._flush_lock:
+            now = monotonic_ms()
+            if now >= self._next_flush or len(self._telemetry) >= self._batch_limit:
+                self._next_flush = now + self._flush_interval_ms
+                return None
+            return self._next_flush - now
 
     def _flush_batch(self, limit: int) -> None:
-        count = 0
-        while self._telemetry_order and count < limit:
-            device_id = self._telemetry_order.popleft()
-            record = self._telemetry_latest.pop(device_id, None)
-            if record is None:
-                continue
-            self._write_record(record)
-            count += 1
+        with self._telemetry_lock:
+            records = self._telemetry.take(limit)
+        if records:
+            self._write_records(records)
 
     def _flush_all(self) -> None:
-        self._flush_batch(len(self._telemetry_order))
-        while not self._alarm_queue.empty():
-            try:
-                item = self._alarm_queue.get_nowait()
-                self._write_record(item)
-            except queue.Empty:
-                break
-        while not self._state_queue.empty():
-            try:
-                item = self._state_queue.get_nowait()
-                self._write_record(item)
-            except queue.Empty:
-                break
-
-    def _write_record(self, record: Dict[str, object]) -> None:
-        msg_id = str(record.get("msg_id"))
-        device_id = str(record.get("device_id"))
-        msg_type = str(record.get("msg_type"))
-
-        state = record.get("state") or {}
-        alarm = record.get("alarm") or {}
-        telemetry = record.get("telemetry") or {}
-
-        ack_ms = self._backend.write_state(device_id, state)
-        if msg_type == "alarm":
-            ack_ms = self._backend.write_alarm(msg_id, alarm)
-        elif msg_type == "telemetry":
-            ack_ms = self._backend.write_telemetry(device_id, telemetry)
-
-        self._ack_writer.write_ack(msg_id, ack_ms)
+        self._flush_batch(len(self._telemetry))
+        entry = self._queue.get(timeout=0)
+        while entry is not None:
+            self._write_record(entry[1])
+            entry = self._queue.get(timeout=0)
+
+    def _retry(self, records: List[Message]) -> None:
+        # Logged messages whose write failed wait out their backoff before
+        # _requeue_due() queues them again
+        due_ms = monotonic_ms()
+        with self._retry_lock:
+            for msg in records:
+                attempts = self._attempts.get(msg.msg_id, 0) + 1
+                if attempts >= self._retry_max_attempts:
+                    self._attempts.pop(msg.msg_id, None)
+                    self.gave_up_count += 1
+                    continue
+                self._attempts[msg.msg_id] = attempts
+                delay_ms = min(self._retry_backoff_max_ms, self._retry_backoff_ms * 2 ** (attempts - 1))
+                heapq.heappush(self._retry_heap, (due_ms + delay_ms, next(self._retry_seq), msg))
+        self._queue.wake()
+
+    def _requeue_due(self) -> Optional[int]:
+        # Queues the retries whose backoff has passed; milliseconds until the
+        # next one is due, or None if none is waiting
+        if not self._retry_heap:
+            return None
+        now = monotonic_ms()
+        due: List[Message] = []
+        with self._retry_lock:
+            heap = self._retry_heap
+            while heap and heap[0][0] <= now:
+                due.append(heapq.heappop(heap)[2])
+            wait_ms = heap[0][0] - now if heap else None
+        # If there is no room (or a newer reading of the device is queued)
+        # they stay in the log, pending until replayed
+        retried = 0
+        done: List[str] = []
+        for msg in due:
+            if msg.msg_type == "telemetry":
+                with self._telemetry_lock:
+                    if msg.device_id in self._telemetry.latest:
+                        done.append(msg.msg_id)
+                        self._wal_forget(msg)
+                        continue
+                    queued = self._telemetry.add(msg)
+            else:
+                queued = self._queue.offer(msg.msg_type, msg, self._deadline(msg))
+            if queued:
+                retried += 1
+            else:
+                done.append(msg.msg_id)
+        with self._retry_lock:
+            self.retry_count += retried
+            for msg_id in done:
+                self._attempts.pop(msg_id, None)
+        return wait_ms
+
+    def _write_record(self, record: Message) -> None:
+        self._write_records([record])
+
+    def _write_records(self, records: List[Message]) -> None:
+        ops = build_ops(records, self.state_cache, self._avi_state_ms)
+        try:
+            if self.hedger is not None and records[0].msg_type == "alarm":
+                ack_ms = self.hedger.write_batch(ops)[0]
+            else:
+                ack_ms = self._backend.write_batch(ops)
+        except Exception as exc:
+            self.error_count += 1
+            log_write_error(self._logger, self.error_count, exc)
+            for kind, key, _ in ops:
+                if kind == "state":
+                    self.state_cache.forget(key)
+            if self._wal_types and not self._stop_event.is_set():
+                self._retry([msg for msg in records if msg.msg_type in self._wal_types])
+            return
+
+        for msg in records:
+            if msg.msg_type in self._wal_types:
+                self.wal.ack(msg.msg_id)
+                if self._attempts:
+                    with self._retry_lock:
+                        self._attempts.pop(msg.msg_id, None)
+            if msg.replayed:
+                # Its msg_id is not in this run's trace and t_db_enqueue_ms
+                # is from the run that logged it
+                self.replay_count += 1
+                continue
+            self._ack_writer.write_ack(msg.msg_id, ack_ms)
+            t_db_enqueue_ms = msg.t_db_enqueue_ms
+            if ack_ms is not None and t_db_enqueue_ms is not None:
+                db_time_ms = ack_ms - t_db_enqueue_ms
+                with self._sketch_lock:
+                    self.db_time_sketch.add(db_time_ms)
+                if self._on_db_time is not None:
+                    self._on_db_time(db_time_ms)
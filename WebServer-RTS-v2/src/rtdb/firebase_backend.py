@@ -1,10 +1,12 @@
 import logging
 import os
-from typing import Dict, Optional
+import random
+import threading
+from typing import Dict, List, Optional
 
 from src.common.time_utils import wall_ms
 from src.rtdb.mock_backend import MockBackend
-from src.rtdb.rtdb_interface import RTDBInterface
+from src.rtdb.rtdb_interface import BatchOp, RTDBInterface
 
 try:
     import firebase_admin
@@ -16,6 +18,41 @@ except Exception:  # pragma: no cover
     db = None
 
 
+_PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+
+class _PushIds:
+    # Client-side push keys (same scheme as the Firebase SDKs: 8 chars of
+    # timestamp + 12 random chars, bumped within one millisecond) so batched
+    # telemetry can be appended without a push() round trip per record
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_rand = [0] * 12
+
+    def next(self) -> str:
+        now = wall_ms()
+        with self._lock:
+            if now == self._last_ms:
+                i = 11
+                while i >= 0 and self._last_rand[i] == 63:
+                    self._last_rand[i] = 0
+                    i -= 1
+                if i >= 0:
+                    self._last_rand[i] += 1
+            else:
+                self._last_ms = now
+                self._last_rand = [random.randrange(64) for _ in range(12)]
+            rand = list(self._last_rand)
+
+        ts_chars = []
+        for _ in range(8):
+            ts_chars.append(_PUSH_CHARS[now % 64])
+            now //= 64
+        return "".join(reversed(ts_chars)) + "".join(_PUSH_CHARS[r] for r in rand)
+
+
 class FirebaseBackend(RTDBInterface):
     def __init__(
         self,
@@ -26,6 +63,7 @@ class FirebaseBackend(RTDBInterface):
         self._logger = logging.getLogger("firebase")
         self._enabled = False
         self._fallback = fallback
+        self._push_ids = _PushIds()
 
         if firebase_admin is None:
             self._logger.warning("firebase_admin not installed, using mock backend")
@@ -66,5 +104,24 @@ class FirebaseBackend(RTDBInterface):
             return wall_ms()
         return self._fallback.write_telemetry(device_id, telemetry_dict) if self._fallback else wall_ms()
 
+    def write_batch(self, ops: List[BatchOp]) -> int:
+        if not self._enabled:
+            return self._fallback.write_batch(ops) if self._fallback else wall_ms()
+
+        # One multi-location update on the root; state keys are flattened so
+        # the merge matches update() on the state node rather than replacing it
+        updates: Dict[str, object] = {}
+        for kind, key, data in ops:
+            if kind == "state":
+                for field, value in data.items():
+                    updates[f"devices/{key}/state/{field}"] = value
+            elif kind == "alarm":
+                updates[f"alarms/{key}"] = data
+            else:
+                updates[f"telemetry/{key}/{self._push_ids.next()}"] = data
+        if updates:
+            self._ref("/").update(updates)
+        return wall_ms()
+
     def healthcheck(self) -> bool:
         return self._enabled or (self._fallback is not None)
@@ -0,0 +1,282 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+from src.common.config import get_cfg
+from src.common.metrics import percentile_sorted
+from src.rtdb.async_backend import AsyncBackend
+from src.rtdb.rtdb_interface import BatchOp, RTDBInterface
+
+# rtdb.alarm_write.strategy: hedged. An alarm's /alarms/{msg_id} document is
+# written with set(), so writing it twice leaves the RTDB exactly as writing
+# it once. An alarm batch that has not been acked after the hedge delay gets
+# a second write of its alarm document, and whichever is acked first wins;
+# the other finishes in the background and is ignored.
+#
+# The device state (/devices/{id}, update()) is never repeated: a duplicate
+# landing after a newer state update would roll the device back. It is
+# written once, by the primary attempt (the whole batch, one round trip as
+# with "batch"). If the hedge wins after the primary failed, the state is
+# written once after it; if the primary fails after the hedge won, the
+# device is passed to on_state_lost (the caller's StateCache.forget) so its
+# next state is written rather than suppressed.
+#
+# The delay is the hedge.percentile of recent write times (every attempt,
+# winners and losers, so hedging does not bias it), at least min_delay_ms.
+# Hedges are rationed to `budget` per alarm write so a slow or throttled
+# service does not get twice the load exactly when it is struggling.
+#
+# Telemetry is never hedged: its writes are pushes, not idempotent.
+
+STRATEGIES = ("serial", "batch", "hedged")
+PRIMARY = 0
+HEDGE = 1
+# Op kinds a hedge repeats
+HEDGEABLE = ("alarm",)
+_MIN_SAMPLES = 20
+_REFRESH_EVERY = 16
+
+
+class HedgePolicy:
+    def __init__(self, percentile: float = 95, min_delay_ms: float = 5, window: int = 256, budget: float = 0.1) -> None:
+        self.percentile = percentile
+        self.min_delay_ms = min_delay_ms
+        self.budget = budget
+        self._samples: Deque[float] = deque(maxlen=max(_MIN_SAMPLES, window))
+        self._lock = threading.Lock()
+        self._added = 0
+        self._delay_ms: Optional[float] = None
+        # Starts with room for one hedge; every write adds `budget`
+        self._tokens = 1.0
+
+        self.writes = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.rescued = 0
+        self.skipped = 0
+
+    @classmethod
+    def from_cfg(cls, cfg: Dict[str, object]) -> "HedgePolicy":
+        return cls(
+            float(get_cfg(cfg, "rtdb.alarm_write.hedge.percentile", 95)),
+            float(get_cfg(cfg, "rtdb.alarm_write.hedge.min_delay_ms", 5)),
+            int(get_cfg(cfg, "rtdb.alarm_write.hedge.window", 256)),
+            float(get_cfg(cfg, "rtdb.alarm_write.hedge.budget", 0.1)),
+        )
+
+    def add(self, elapsed_ms: float) -> None:
+        with self._lock:
+            self._samples.append(elapsed_ms)
+            self._added += 1
+            if len(self._samples) >= _MIN_SAMPLES and (self._delay_ms is None or self._added % _REFRESH_EVERY == 0):
+                p = percentile_sorted(sorted(self._samples), self.percentile)
+                self._delay_ms = max(self.min_delay_ms, p)
+
+    def start(self) -> Optional[float]:
+        # Counts a write; its hedge delay in ms, or None while there are too
+        # few samples to estimate one
+        with self._lock:
+            self.writes += 1
+            self._tokens = min(self._tokens + self.budget, 1.0 + self.budget)
+            return self._delay_ms
+
+    def take(self) -> bool:
+        # Whether the budget allows a hedge now
+        with self._lock:
+            if self._tokens < 1.0:
+                self.skipped += 1
+                return False
+            self._tokens -= 1.0
+            self.hedged += 1
+            return True
+
+    def won(self, attempt: int, primary_failed: bool) -> None:
+        if attempt == HEDGE:
+            with self._lock:
+                self.hedge_wins += 1
+                if primary_failed:
+                    self.rescued += 1
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "writes": self.writes,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "rescued": self.rescued,
+            "skipped": self.skipped,
+            "delay_ms": round(self._delay_ms, 3) if self._delay_ms is not None else None,
+        }
+
+
+def split_hedgeable(ops: List[BatchOp]) -> Tuple[List[BatchOp], List[BatchOp]]:
+    # (ops a hedge repeats, ops written once)
+    hedged = [op for op in ops if op[0] in HEDGEABLE]
+    return hedged, [op for op in ops if op[0] not in HEDGEABLE]
+
+
+def _state_lost(
+    on_state_lost: Optional[Callable[[str], None]], once: List[BatchOp], error: Optional[BaseException]
+) -> None:
+    # A primary that lost the race to its hedge has finished; if it failed,
+    # the state it carried was never written
+    if error is not None and on_state_lost is not None:
+        for kind, key, _ in once:
+            if kind == "state":
+                on_state_lost(key)
+
+
+def hedge_summary(stats: Sequence[Dict[str, object]]) -> Dict[str, object]:
+    # Totals over several writers (process pipeline workers)
+    out: Dict[str, object] = {
+        k: sum(int(s.get(k) or 0) for s in stats) for k in ("writes", "hedged", "hedge_wins", "rescued", "skipped")
+    }
+    delays = [s["delay_ms"] for s in stats if s.get("delay_ms") is not None]
+    out["delay_ms"] = max(delays) if delays else None
+    return out
+
+
+class HedgedWriter:
+    # For the threaded writers (sync Delivery and DbWriter). Attempts run on
+    # a pool of 2 * max_writes threads, so every concurrent caller can have
+    # its write and its hedge in flight.
+
+    def __init__(
+        self,
+        backend: RTDBInterface,
+        policy: HedgePolicy,
+        max_writes: int = 1,
+        on_state_lost: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self._backend = backend
+        self.policy = policy
+        self._on_state_lost = on_state_lost
+        self._pool = ThreadPoolExecutor(max_workers=2 * max(1, max_writes), thread_name_prefix="rtdb-hedge")
+
+    def _attempt(self, ops: List[BatchOp]) -> int:
+        t0 = time.perf_counter()
+        ack_ms = self._backend.write_batch(ops)
+        self.policy.add((time.perf_counter() - t0) * 1000.0)
+        return ack_ms
+
+    def write_batch(self, ops: List[BatchOp]) -> Tuple[int, int]:
+        # (ack ms of the first successful attempt, PRIMARY or HEDGE); raises
+        # the last error if every attempt failed
+        hedged, once = split_hedgeable(ops)
+        if not hedged:
+            return self._backend.write_batch(ops), PRIMARY
+        ack_ms, attempt, primary = self._race(ops, hedged)
+        if attempt == HEDGE and once:
+            if primary.done() and primary.exception() is not None:
+                ack_ms = max(ack_ms, self._backend.write_batch(once))
+            else:
+                primary.add_done_callback(lambda f: _state_lost(self._on_state_lost, once, f.exception()))
+        return ack_ms, attempt
+
+    def _race(self, ops: List[BatchOp], hedge_ops: List[BatchOp]) -> Tuple[int, int, Future]:
+        delay_ms = self.policy.start()
+        attempts: List[Future] = [self._pool.submit(self._attempt, ops)]
+        pending: Set[Future] = set(attempts)
+        primary_failed = False
+        while True:
+            can_hedge = delay_ms is not None and len(attempts) == 1 and not primary_failed
+            done, pending = wait(pending, timeout=delay_ms / 1000.0 if can_hedge else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                attempt = attempts.index(future)
+                if future.exception() is None:
+                    self.policy.won(attempt, primary_failed)
+                    return future.result(), attempt, attempts[PRIMARY]
+                if attempt == PRIMARY:
+                    primary_failed = True
+                error = future.exception()
+            if not done and self.policy.take():
+                hedge = self._pool.submit(self._attempt, hedge_ops)
+                attempts.append(hedge)
+                pending.add(hedge)
+            elif not pending:
+                raise error
+            elif not done:
+                # Over budget: wait for the primary alone
+                delay_ms = None
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+class AsyncHedgedWriter:
+    # Same race on the collector's event loop (AsyncDelivery, AsyncDbWriter)
+
+    def __init__(
+        self, backend: AsyncBackend, policy: HedgePolicy, on_state_lost: Optional[Callable[[str], None]] = None
+    ) -> None:
+        self._backend = backend
+        self.policy = policy
+        self._on_state_lost = on_state_lost
+        self._attempts: Set[asyncio.Task] = set()
+
+    async def _attempt(self, ops: List[BatchOp]) -> int:
+        t0 = time.perf_counter()
+        ack_ms = await self._backend.write_batch(ops)
+        self.policy.add((time.perf_counter() - t0) * 1000.0)
+        return ack_ms
+
+    def _spawn(self, ops: List[BatchOp]) -> asyncio.Task:
+        task = asyncio.ensure_future(self._attempt(ops))
+        self._attempts.add(task)
+        task.add_done_callback(self._attempt_done)
+        return task
+
+    def _attempt_done(self, task: asyncio.Task) -> None:
+        self._attempts.discard(task)
+        if not task.cancelled():
+            # A losing attempt's error is of no interest; retrieve it so
+            # asyncio does not log it as unhandled
+            task.exception()
+
+    async def write_batch(self, ops: List[BatchOp]) -> Tuple[int, int]:
+        hedged, once = split_hedgeable(ops)
+        if not hedged:
+            return await self._backend.write_batch(ops), PRIMARY
+        ack_ms, attempt, primary = await self._race(ops, hedged)
+        if attempt == HEDGE and once:
+            if primary.done() and primary.exception() is not None:
+                ack_ms = max(ack_ms, await self._backend.write_batch(once))
+            else:
+                primary.add_done_callback(
+                    lambda t: t.cancelled() or _state_lost(self._on_state_lost, once, t.exception())
+                )
+        return ack_ms, attempt
+
+    async def _race(self, ops: List[BatchOp], hedge_ops: List[BatchOp]) -> Tuple[int, int, asyncio.Task]:
+        delay_ms = self.policy.start()
+        attempts = [self._spawn(ops)]
+        pending: Set[asyncio.Task] = set(attempts)
+        primary_failed = False
+        while True:
+            can_hedge = delay_ms is not None and len(attempts) == 1 and not primary_failed
+            done, pending = await asyncio.wait(
+                pending, timeout=delay_ms / 1000.0 if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                attempt = attempts.index(task)
+                if task.exception() is None:
+                    self.policy.won(attempt, primary_failed)
+                    return task.result(), attempt, attempts[PRIMARY]
+                if attempt == PRIMARY:
+                    primary_failed = True
+                error = task.exception()
+            if not done and self.policy.take():
+                hedge = self._spawn(hedge_ops)
+                attempts.append(hedge)
+                pending.add(hedge)
+            elif not pending:
+                raise error
+            elif not done:
+                delay_ms = None
+
+    async def drain(self) -> None:
+        # Losing attempts still in flight; their writes are part of the run
+        if self._attempts:
+            await asyncio.gather(*list(self._attempts), return_exceptions=True)
@@ -1,24 +1,32 @@
-import json
 import os
 import threading
 import time
-from typing import Dict
+from typing import Dict, List, Optional
 
+from src.common.codec import JsonCodec, get_codec
 from src.common.time_utils import wall_ms
-from src.rtdb.rtdb_interface import RTDBInterface
+from src.rtdb.rtdb_interface import BatchOp, RTDBInterface
+
+
+_PATHS = {
+    "state": "/devices/{}/state",
+    "alarm": "/alarms/{}",
+    "telemetry": "/telemetry/{}",
+}
 
 
 class MockBackend(RTDBInterface):
-    def __init__(self, output_path: str, ack_delay_ms: int = 0) -> None:
+    def __init__(self, output_path: str, ack_delay_ms: int = 0, codec: Optional[JsonCodec] = None) -> None:
         self.output_path = output_path
         self.ack_delay_ms = ack_delay_ms
+        self._codec = codec or get_codec()
         self._lock = threading.Lock()
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
     def _write_line(self, record: Dict[str, object]) -> None:
         with self._lock:
-            with open(self.output_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(record) + "\n")
+            with open(self.output_path, "ab") as f:
+                f.write(self._codec.dumps(record) + b"\n")
 
     def write_state(self, device_id: str, state_dict: Dict[str, object]) -> int:
         self._write_line({"path": f"/devices/{device_id}/state", "data": state_dict})
@@ -32,10 +40,20 @@ class MockBackend(RTDBInterface):
         self._write_line({"path": f"/telemetry/{device_id}", "data": telemetry_dict})
         return self._ack()
 
+    def write_batch(self, ops: List[BatchOp]) -> int:
+        # Same lines as the single writes, but one append and one ack delay
+        dumps = self._codec.dumps
+        lines = b"".join(dumps({"path": _PATHS[kind].format(key), "data": data}) + b"\n" for kind, key, data in ops)
+        with self._lock:
+            with open(self.output_path, "ab") as f:
+                f.write(lines)
+        return self._ack(len(ops))
+
     def healthcheck(self) -> bool:
         return True
 
-    def _ack(self) -> int:
+    def _ack(self, ops: int = 1) -> int:
+        # ops: paths in the write, for backends whose cost depends on it
         if self.ack_delay_ms > 0:
             time.sleep(self.ack_delay_ms / 1000.0)
         return wall_ms()
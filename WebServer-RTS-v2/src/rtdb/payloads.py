@@ -0,0 +1,36 @@
+from typing import Dict
+
+from src.common.models import Message
+from src.common.time_utils import wall_ms
+
+
+# RTDB documents for one message. They are built right before the write,
+# and only for the paths that are actually written.
+
+
+def build_state(msg: Message, severity: str, avi_ms: int, src: str) -> Dict[str, object]:
+    return {
+        "ts_ms": msg.t_sensor_ms or wall_ms(),
+        "severity": severity,
+        "values": msg.values,
+        "avi_ms": avi_ms,
+        "src": src,
+    }
+
+
+def build_alarm(msg: Message, severity: str) -> Dict[str, object]:
+    return {
+        "deviceId": msg.device_id,
+        "ts_ms": msg.t_sensor_ms or wall_ms(),
+        "severity": severity,
+        "values": msg.values,
+        "ack": False,
+        "note": "",
+    }
+
+
+def build_telemetry(msg: Message) -> Dict[str, object]:
+    return {
+        "ts_ms": msg.t_sensor_ms or wall_ms(),
+        "values": msg.values,
+    }
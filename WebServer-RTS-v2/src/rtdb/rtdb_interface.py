@@ -1,5 +1,18 @@
+import logging
 from abc import ABC, abstractmethod
-from typing import Dict
+from typing import Dict, List, Tuple
+
+
+# One write in a batch: (kind, key, data) where kind is "state" (key is the
+# device id), "alarm" (alarm id) or "telemetry" (device id)
+BatchOp = Tuple[str, str, Dict[str, object]]
+
+
+def log_write_error(logger: logging.Logger, errors: int, exc: BaseException) -> None:
+    # Writers count failed writes (the messages get no ack) and keep going;
+    # the first failure and every 100th after it are logged
+    if errors == 1 or errors % 100 == 0:
+        logger.warning("DB write failed (%s so far): %s", errors, exc)
 
 
 class RTDBInterface(ABC):
@@ -15,6 +28,19 @@ class RTDBInterface(ABC):
     def write_telemetry(self, device_id: str, telemetry_dict: Dict[str, object]) -> int:
         raise NotImplementedError
 
+    def write_batch(self, ops: List[BatchOp]) -> int:
+        # Backends that can commit several paths in one round trip override
+        # this; the ack timestamp applies to every op in the batch
+        ack_ms = 0
+        for kind, key, data in ops:
+            if kind == "state":
+                ack_ms = self.write_state(key, data)
+            elif kind == "alarm":
+                ack_ms = self.write_alarm(key, data)
+            else:
+                ack_ms = self.write_telemetry(key, data)
+        return ack_ms
+
     @abstractmethod
     def healthcheck(self) -> bool:
         raise NotImplementedError
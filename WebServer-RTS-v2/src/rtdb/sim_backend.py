@@ -0,0 +1,224 @@
+import bisect
+import csv
+import math
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.common.codec import JsonCodec
+from src.common.config import get_cfg
+from src.common.time_utils import wall_ms
+from src.rtdb.mock_backend import MockBackend
+
+# rtdb.mode: sim. A stand-in for the Realtime Database whose acks follow a
+# latency model instead of a fixed delay, so writer tuning sees tails,
+# throttling and stalls:
+#
+#   latency     constant (ack_delay_ms), lognormal (median_ms, sigma) or
+#               empirical (samples/histogram loaded from latency.path), plus
+#               per_op_ms for every path in a batch
+#   rate_limit  token bucket of writes_per_s with `burst` tokens; over the
+#               limit writes are queued behind the bucket (mode delay) or
+#               fail fast (mode reject)
+#   stall       every every_s the service stops acking for duration_ms;
+#               writes arriving during a stall complete after it
+#   error_rate  probability a write fails (after its latency) with
+#               RtdbWriteError
+#
+# The model only computes when each write is acked; it holds no lock while
+# a write is outstanding, so any number of writes can be in flight (one per
+# DbWriter thread, or one per asyncio task with AsyncSimBackend). Limits are
+# per backend instance, i.e. per worker process in pipeline.mode: process.
+
+LATENCY_MODELS = ("constant", "lognormal", "empirical")
+
+
+class RtdbWriteError(Exception):
+    pass
+
+
+class EmpiricalLatency:
+    # From a CSV file, either
+    #   - a db_time_ms column (trace_final.csv of a real run): samples
+    #   - two columns latency_ms,count: histogram of bin upper edges, sampled
+    #     uniformly within the bin
+    #   - one column: samples
+    # Lines that do not parse as numbers (headers) are skipped.
+    def __init__(self, path: str) -> None:
+        values: List[float] = []
+        weights: List[float] = []
+        histogram = False
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            column: Optional[int] = None
+            for row in reader:
+                if not row:
+                    continue
+                if column is None and "db_time_ms" in row:
+                    column = row.index("db_time_ms")
+                    continue
+                try:
+                    if column is not None:
+                        if column < len(row) and row[column] != "":
+                            values.append(float(row[column]))
+                            weights.append(1.0)
+                    elif len(row) >= 2:
+                        values.append(float(row[0]))
+                        weights.append(float(row[1]))
+                        histogram = True
+                    else:
+                        values.append(float(row[0]))
+                        weights.append(1.0)
+                except ValueError:
+                    continue
+        if not values or sum(weights) <= 0:
+            raise ValueError(f"no latency samples in {path}")
+        pairs = sorted(zip(values, weights))
+        self._values = [v for v, _ in pairs]
+        self._histogram = histogram
+        self._cum: List[float] = []
+        total = 0.0
+        for _, w in pairs:
+            total += w
+            self._cum.append(total)
+
+    def sample(self, rng: random.Random) -> float:
+        i = min(bisect.bisect_right(self._cum, rng.random() * self._cum[-1]), len(self._cum) - 1)
+        if not self._histogram:
+            return self._values[i]
+        lo = self._values[i - 1] if i > 0 else 0.0
+        return rng.uniform(lo, self._values[i])
+
+
+class ConstantLatency:
+    def __init__(self, ms: float) -> None:
+        self.ms = ms
+
+    def sample(self, rng: random.Random) -> float:
+        return self.ms
+
+
+class LognormalLatency:
+    def __init__(self, median_ms: float, sigma: float) -> None:
+        self.mu = math.log(median_ms)
+        self.sigma = sigma
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.lognormvariate(self.mu, self.sigma)
+
+
+class RtdbSimModel:
+    def __init__(
+        self,
+        latency: object,
+        per_op_ms: float = 0.0,
+        writes_per_s: float = 0.0,
+        burst: float = 1.0,
+        reject_throttled: bool = False,
+        stall_every_s: float = 0.0,
+        stall_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 1,
+        start_ms: Optional[float] = None,
+    ) -> None:
+        self.latency = latency
+        self.per_op_ms = per_op_ms
+        self.writes_per_s = writes_per_s
+        self.burst = max(1.0, burst)
+        self.reject_throttled = reject_throttled
+        self.stall_every_ms = stall_every_s * 1000.0
+        self.stall_ms = stall_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._start_ms = float(wall_ms()) if start_ms is None else start_ms
+        self._tokens = self.burst
+        self._refill_ms = self._start_ms
+
+        self.writes = 0
+        self.throttled = 0
+        self.stalled = 0
+        self.errors = 0
+
+    def plan(self, ops: int, now_ms: float) -> Tuple[float, Optional[str]]:
+        # (wall ms at which the write is acked or fails, error or None)
+        with self._lock:
+            self.writes += 1
+            t = now_ms
+            if self.stall_every_ms > 0 and self.stall_ms > 0 and t >= self._start_ms + self.stall_every_ms:
+                into = (t - self._start_ms) % self.stall_every_ms
+                if into < self.stall_ms:
+                    self.stalled += 1
+                    t += self.stall_ms - into
+            if self.writes_per_s > 0:
+                # Token bucket with debt: a negative balance is the queue of
+                # writes admitted ahead of this one
+                self._tokens = min(self.burst, self._tokens + (t - self._refill_ms) * self.writes_per_s / 1000.0)
+                self._refill_ms = t
+                if self._tokens < 1.0:
+                    self.throttled += 1
+                    if self.reject_throttled:
+                        self.errors += 1
+                        return t + self.latency.sample(self._rng), "throttled"
+                self._tokens -= 1.0
+                if self._tokens < 0:
+                    t += -self._tokens * 1000.0 / self.writes_per_s
+            t += self.latency.sample(self._rng) + self.per_op_ms * ops
+            if self.error_rate > 0 and self._rng.random() < self.error_rate:
+                self.errors += 1
+                return t, "injected error"
+            return t, None
+
+    def stats(self) -> Dict[str, int]:
+        return {"writes": self.writes, "throttled": self.throttled, "stalled": self.stalled, "errors": self.errors}
+
+
+def sim_model_from_cfg(cfg: Dict[str, object]) -> RtdbSimModel:
+    model = str(get_cfg(cfg, "rtdb.sim.latency.model", "lognormal"))
+    if model == "constant":
+        latency: object = ConstantLatency(float(get_cfg(cfg, "rtdb.sim.latency.ack_delay_ms", 20)))
+    elif model == "empirical":
+        latency = EmpiricalLatency(str(get_cfg(cfg, "rtdb.sim.latency.path", "")))
+    else:
+        latency = LognormalLatency(
+            float(get_cfg(cfg, "rtdb.sim.latency.median_ms", 40)),
+            float(get_cfg(cfg, "rtdb.sim.latency.sigma", 0.5)),
+        )
+    return RtdbSimModel(
+        latency,
+        per_op_ms=float(get_cfg(cfg, "rtdb.sim.per_op_ms", 0.0)),
+        writes_per_s=float(get_cfg(cfg, "rtdb.sim.rate_limit.writes_per_s", 0)),
+        burst=float(get_cfg(cfg, "rtdb.sim.rate_limit.burst", 100)),
+        reject_throttled=get_cfg(cfg, "rtdb.sim.rate_limit.mode", "delay") == "reject",
+        stall_every_s=float(get_cfg(cfg, "rtdb.sim.stall.every_s", 0)),
+        stall_ms=float(get_cfg(cfg, "rtdb.sim.stall.duration_ms", 0)),
+        error_rate=float(get_cfg(cfg, "rtdb.sim.error_rate", 0.0)),
+        seed=int(get_cfg(cfg, "rtdb.sim.seed", 1)),
+    )
+
+
+class SimBackend(MockBackend):
+    # MockBackend output (mock_rtdb.jsonl) with acks from an RtdbSimModel;
+    # the calling thread sleeps until its write is acked
+    def __init__(self, output_path: str, model: RtdbSimModel, codec: Optional[JsonCodec] = None) -> None:
+        super().__init__(output_path, 0, codec)
+        self.model = model
+
+    def _ack(self, ops: int = 1) -> int:
+        ack_at, error = self.model.plan(ops, time.time() * 1000.0)
+        delay_s = (ack_at - time.time() * 1000.0) / 1000.0
+        if delay_s > 0:
+            time.sleep(delay_s)
+        if error is not None:
+            raise RtdbWriteError(error)
+        return wall_ms()
+
+
+def sim_summary(stats: Sequence[Dict[str, int]]) -> Dict[str, int]:
+    # Totals over several backends (process pipeline workers)
+    out = {"writes": 0, "throttled": 0, "stalled": 0, "errors": 0}
+    for s in stats:
+        for k in out:
+            out[k] += int(s.get(k, 0))
+    return out
@@ -0,0 +1,86 @@
+import threading
+from typing import Dict, Tuple
+
+from src.common.config import get_cfg
+from src.common.time_utils import monotonic_ms
+
+
+class StateCache:
+    # Last written state per device. A new state is written only when the
+    # severity changes, a value moves beyond its deadband, the set of value
+    # keys changes, or the stored state is about to exceed avi_state_ms.
+    # Everything else is counted as suppressed.
+
+    def __init__(
+        self,
+        deadband: Dict[str, float],
+        avi_state_ms: int,
+        refresh_margin_ms: int = 200,
+        enabled: bool = True,
+    ) -> None:
+        self.enabled = enabled
+        self._default_deadband = float(deadband.get("default", 0.0))
+        self._deadband = {k: float(v) for k, v in deadband.items() if k != "default"}
+        self._refresh_after_ms = max(0, avi_state_ms - refresh_margin_ms)
+        # device_id -> (severity, values, monotonic ms of the last write)
+        self._last: Dict[str, Tuple[str, Dict[str, object], int]] = {}
+        self._lock = threading.Lock()
+
+        self.written = 0
+        self.suppressed = 0
+
+    @classmethod
+    def from_cfg(cls, cfg: Dict[str, object]) -> "StateCache":
+        deadband = get_cfg(cfg, "rtdb.state_cache.deadband", {}) or {}
+        if not isinstance(deadband, dict):
+            deadband = {"default": deadband}
+        return cls(
+            deadband,
+            int(get_cfg(cfg, "freshness.avi_state_ms")),
+            int(get_cfg(cfg, "rtdb.state_cache.refresh_margin_ms", 200)),
+            bool(get_cfg(cfg, "rtdb.state_cache.enabled", False)),
+        )
+
+    def _changed(self, old: Dict[str, object], new: Dict[str, object]) -> bool:
+        if old.keys() != new.keys():
+            return True
+        for key, value in new.items():
+            prev = old[key]
+            if isinstance(value, (int, float)) and isinstance(prev, (int, float)):
+                if abs(value - prev) > self._deadband.get(key, self._default_deadband):
+                    return True
+            elif value != prev:
+                return True
+        return False
+
+    def should_write(self, device_id: str, severity: str, values: Dict[str, object]) -> bool:
+        # Takes the state's fields rather than the document so callers only
+        # build the state dict when it is going to be written
+        if not self.enabled:
+            return True
+        values = values or {}
+        now = monotonic_ms()
+        with self._lock:
+            last = self._last.get(device_id)
+            if (
+                last is None
+                or last[0] != severity
+                or now - last[2] >= self._refresh_after_ms
+                or self._changed(last[1], values)
+            ):
+                self._last[device_id] = (severity, dict(values), now)
+                self.written += 1
+                return True
+            self.suppressed += 1
+            return False
+
+    def forget(self, device_id: str) -> None:
+        # should_write() records the state before it is written; a writer
+        # whose write failed drops it so the next state is written, not
+        # suppressed until the refresh
+        if self.enabled:
+            with self._lock:
+                self._last.pop(device_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"written": self.written, "suppressed": self.suppressed, "devices": len(self._last)}
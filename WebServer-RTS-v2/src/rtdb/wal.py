@@ -0,0 +1,261 @@
+import logging
+import os
+import re
+import struct
+import threading
+import zlib
+from dataclasses import fields
+from typing import Dict, List, Optional, Tuple
+
+from src.common.codec import JsonCodec, get_codec
+from src.common.models import Message
+
+# Write-ahead log for DbWriter (rtdb.writer.wal). Messages of the logged
+# types are appended before they are queued and marked acked once the RTDB
+# has acked them; on startup every entry without an ack is replayed, so
+# those writes reach the RTDB at least once across collector crashes.
+#
+# Segment files wal-<n>.log hold records of
+#
+#   u8 kind (1 entry, 2 ack), u32 payload length, u32 crc32, payload
+#
+# where an entry's payload is the Message's fields as a JSON object keyed by
+# field name, and an ack's is the msg_id. Recovery stops at the first torn
+# or corrupt record of a segment. Entries are decoded by name, so fields
+# added to or removed from Message since the log was written do not shift
+# the others; an entry that still does not decode into a Message (missing
+# required fields, or the positional array of older logs) is skipped with a
+# warning.
+#
+# Durability: append() hands the record to the OS with one write() before
+# returning, which is enough to survive a crash of the collector process.
+# Surviving an OS crash or power loss needs fsync, which is group committed:
+# a background thread fsyncs whatever was appended every fsync_interval_ms,
+# so one fsync covers all alarms of that window. fsync_interval_ms: 0
+# fsyncs inside every append instead.
+#
+# Acks are buffered and written with the next entry or commit; an ack lost
+# in a crash only means a duplicate write on replay. Checkpointing deletes
+# the oldest segments once everything in them is acked (in order, so an
+# ack is never deleted before the entry it refers to).
+
+ENTRY = 1
+ACK = 2
+_HEADER = struct.Struct("<BII")
+_SEGMENT = re.compile(r"^wal-(\d+)\.log$")
+_FIELDS = tuple(f.name for f in fields(Message))
+_NAMES = frozenset(_FIELDS)
+
+
+def _record(kind: int, payload: bytes) -> bytes:
+    return _HEADER.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+
+def read_segment(path: str) -> Tuple[List[Tuple[int, bytes]], bool]:
+    # (records, clean); clean is False if the segment ends in a torn or
+    # corrupt record, which is ignored with everything after it
+    with open(path, "rb") as f:
+        data = f.read()
+    records = []
+    pos = 0
+    while pos + _HEADER.size <= len(data):
+        kind, length, crc = _HEADER.unpack_from(data, pos)
+        start = pos + _HEADER.size
+        payload = data[start : start + length]
+        if kind not in (ENTRY, ACK) or len(payload) < length or zlib.crc32(payload) != crc:
+            return records, False
+        records.append((kind, payload))
+        pos = start + length
+    return records, pos == len(data)
+
+
+class WriteAheadLog:
+    def __init__(
+        self,
+        directory: str,
+        fsync_interval_ms: int = 10,
+        segment_bytes: int = 16 * 1024 * 1024,
+        codec: Optional[JsonCodec] = None,
+    ) -> None:
+        self.directory = directory
+        self.fsync_interval_ms = fsync_interval_ms
+        self.segment_bytes = segment_bytes
+        self._codec = codec or get_codec()
+        self._logger = logging.getLogger("wal")
+        self._lock = threading.Lock()
+        self._fd = -1
+        self._segment = 0
+        self._bytes = 0
+        self._ack_buf = bytearray()
+        self._dirty = False
+        # msg_id -> segment of its entry, and unacked entries per segment
+        self._pending: Dict[str, int] = {}
+        self._segment_pending: Dict[int, int] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.appended = 0
+        self.acked = 0
+        self.commits = 0
+        self.recovered = 0
+        self.skipped = 0
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"wal-{segment:06d}.log")
+
+    def _segments(self) -> List[int]:
+        out = []
+        for name in os.listdir(self.directory):
+            m = _SEGMENT.match(name)
+            if m:
+                out.append(int(m.group(1)))
+        return sorted(out)
+
+    def open(self) -> List[Message]:
+        # Recovers unacked entries, compacts them into a fresh segment and
+        # starts the committer. Returns the recovered messages, oldest first.
+        os.makedirs(self.directory, exist_ok=True)
+        old = self._segments()
+        entries: Dict[str, Tuple[bytes, Message]] = {}
+        for segment in old:
+            records, clean = read_segment(self._path(segment))
+            if not clean:
+                self._logger.warning("WAL segment %s has a torn or corrupt tail, ignoring it", segment)
+            skipped = 0
+            for kind, payload in records:
+                if kind == ENTRY:
+                    msg = self._decode(payload)
+                    if msg is None:
+                        skipped += 1
+                    else:
+                        entries[msg.msg_id] = (payload, msg)
+                else:
+                    entries.pop(payload.decode("utf-8", "replace"), None)
+            if skipped:
+                self.skipped += skipped
+                self._logger.warning("WAL segment %s: skipped %s unreadable entries", segment, skipped)
+
+        self._open_segment((old[-1] + 1) if old else 1)
+        recovered = []
+        for msg_id, (payload, msg) in entries.items():
+            self._write(_record(ENTRY, payload))
+            self._track(msg_id)
+            recovered.append(msg)
+        os.fsync(self._fd)
+        for segment in old:
+            os.remove(self._path(segment))
+        self.recovered = len(recovered)
+        if recovered:
+            self._logger.info("WAL: replaying %s unacknowledged writes", len(recovered))
+
+        if self.fsync_interval_ms > 0:
+            self._thread = threading.Thread(target=self._run, name="wal-commit", daemon=True)
+            self._thread.start()
+        return recovered
+
+    def _decode(self, payload: bytes) -> Optional[Message]:
+        try:
+            data = self._codec.loads(payload)
+            return Message(**{k: v for k, v in data.items() if k in _NAMES})
+        except Exception:
+            return None
+
+    def append(self, msg: Message) -> None:
+        payload = self._codec.dumps({f: getattr(msg, f) for f in _FIELDS})
+        record = _record(ENTRY, payload)
+        with self._lock:
+            if self._ack_buf:
+                record = bytes(self._ack_buf) + record
+                self._ack_buf.clear()
+            self._write(record)
+            self._track(msg.msg_id)
+            self.appended += 1
+            if self.fsync_interval_ms <= 0:
+                os.fsync(self._fd)
+                self.commits += 1
+            else:
+                self._dirty = True
+            if self._bytes >= self.segment_bytes:
+                self._rotate()
+
+    def ack(self, msg_id: str) -> None:
+        with self._lock:
+            segment = self._pending.pop(msg_id, None)
+            if segment is None:
+                return
+            self.acked += 1
+            self._ack_buf += _record(ACK, msg_id.encode("utf-8"))
+            self._segment_pending[segment] -= 1
+            self._checkpoint()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def close(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        with self._lock:
+            if self._fd < 0:
+                return
+            self._flush_acks()
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = -1
+            if not self._pending:
+                # Everything acked: nothing to replay next time
+                os.remove(self._path(self._segment))
+
+    def _open_segment(self, segment: int) -> None:
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+        self._fd = os.open(self._path(segment), flags, 0o644)
+        self._segment = segment
+        self._bytes = 0
+        self._segment_pending[segment] = 0
+
+    def _write(self, data: bytes) -> None:
+        os.write(self._fd, data)
+        self._bytes += len(data)
+
+    def _track(self, msg_id: str) -> None:
+        self._pending[msg_id] = self._segment
+        self._segment_pending[self._segment] += 1
+
+    def _flush_acks(self) -> None:
+        if self._ack_buf:
+            self._write(bytes(self._ack_buf))
+            self._ack_buf.clear()
+            self._dirty = True
+
+    def _rotate(self) -> None:
+        self._flush_acks()
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._open_segment(self._segment + 1)
+        self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        # Deletes the oldest closed segments while they have nothing unacked
+        for segment in sorted(self._segment_pending):
+            if segment == self._segment or self._segment_pending[segment] > 0:
+                return
+            del self._segment_pending[segment]
+            os.remove(self._path(segment))
+
+    def _run(self) -> None:
+        interval_s = self.fsync_interval_ms / 1000.0
+        while not self._stop_event.wait(interval_s):
+            with self._lock:
+                self._flush_acks()
+                if not self._dirty or self._fd < 0:
+                    continue
+                self._dirty = False
+                # fsync a duplicate outside the lock so appends never wait
+                # for the disk; rotation may close the original meanwhile
+                fd = os.dup(self._fd)
+            try:
+                os.fsync(fd)
+                self.commits += 1
+            finally:
+                os.close(fd)
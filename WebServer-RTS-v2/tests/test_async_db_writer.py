@@ -0,0 +1,101 @@
+import asyncio
+from typing import List, Optional
+
+from src.common.config import set_cfg, validate_config
+from src.common.models import Message
+from src.common.time_utils import wall_ms
+from src.rtdb.async_backend import AsyncBackend
+from src.rtdb.async_db_writer import AsyncDbWriter
+from src.rtdb.rtdb_interface import BatchOp
+from src.rtdb.state_cache import StateCache
+
+
+class _SlowBackend(AsyncBackend):
+    # Every write takes delay_s; records each batch and the most writes in flight
+    def __init__(self, delay_s: float = 0.01) -> None:
+        self.delay_s = delay_s
+        self.batches: List[List[BatchOp]] = []
+        self.active = 0
+        self.max_active = 0
+
+    async def write_batch(self, ops: List[BatchOp]) -> int:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay_s)
+        self.active -= 1
+        self.batches.append(ops)
+        return wall_ms()
+
+
+class _Acks:
+    def __init__(self) -> None:
+        self.acks: List[str] = []
+
+    def write_ack(self, msg_id: str, ack_ms: Optional[int]) -> None:
+        self.acks.append(msg_id)
+
+
+def _cfg(**writer) -> dict:
+    cfg = validate_config({})
+    for key, value in writer.items():
+        set_cfg(cfg, f"rtdb.writer.{key}", value)
+    return cfg
+
+
+def _msg(device: int, seq: int, msg_type: str = "telemetry") -> Message:
+    msg = Message(
+        msg_id=f"{msg_type}-{device}-{seq}",
+        device_id=f"esp32-{device:02d}",
+        msg_type=msg_type,
+        t_sensor_ms=wall_ms(),
+        seq=seq,
+        values={"temp": 25.0 + seq, "smoke": 0.1, "gas": 0.1, "flame": 0.0},
+        severity="ALARM" if msg_type == "alarm" else "NORMAL",
+    )
+    msg.t_db_enqueue_ms = wall_ms()
+    return msg
+
+
+def _run(cfg: dict, backend: _SlowBackend, acks: _Acks, messages: List[Message]) -> None:
+    # Enqueues one message per loop iteration, then closes the writer
+    async def run() -> None:
+        writer = AsyncDbWriter(backend, acks, cfg, StateCache.from_cfg(cfg))
+        writer.start()
+        for msg in messages:
+            assert writer.enqueue(msg)
+            await asyncio.sleep(0)
+        await writer.close()
+
+    asyncio.run(run())
+
+
+def test_telemetry_is_coalesced_per_device_and_batched():
+    backend = _SlowBackend()
+    cfg = _cfg(flush_interval_ms=50, batch_limit=100, inflight=2)
+    messages = [_msg(device, seq) for seq in range(50) for device in range(3)]
+    acks = _Acks()
+    _run(cfg, backend, acks, messages)
+
+    pushed = [key for batch in backend.batches for kind, key, _ in batch if kind == "telemetry"]
+    # One batch with each device's latest reading, not 150 writes
+    assert len(backend.batches) == 1
+    assert sorted(pushed) == ["esp32-00", "esp32-01", "esp32-02"]
+    assert acks.acks == ["telemetry-0-49", "telemetry-1-49", "telemetry-2-49"]
+
+
+def test_alarms_are_written_alone_within_the_inflight_bound():
+    backend = _SlowBackend()
+    cfg = _cfg(flush_interval_ms=1000, batch_limit=4, inflight=3, alarm_reserved=1)
+    messages = [_msg(device, 0) for device in range(10)] + [_msg(device, 0, "alarm") for device in range(5)]
+    acks = _Acks()
+    _run(cfg, backend, acks, messages)
+
+    alarm_batches = [batch for batch in backend.batches if any(kind == "alarm" for kind, _, _ in batch)]
+    assert len(alarm_batches) == 5
+    assert all(kind != "telemetry" for batch in alarm_batches for kind, _, _ in batch)
+    # Full batches go out without waiting for the flush interval; close()
+    # writes the rest
+    telemetry = [len([op for op in batch if op[0] == "telemetry"]) for batch in backend.batches]
+    assert sorted(n for n in telemetry if n) == [2, 4, 4]
+    assert backend.max_active <= 3
+    assert len(acks.acks) == 15
@@ -0,0 +1,76 @@
+import csv
+
+from src.apps.benchmark_run import (
+    compute_summary,
+    compute_summary_columns,
+    join_trace,
+    join_trace_columns,
+    load_trace_columns_csv,
+)
+from src.common.config import set_cfg, validate_config
+from src.common.trace import ACK_FIELDS, EVENT_FIELDS
+
+
+def _event(msg_id, msg_type, t_emit, notes=""):
+    return {
+        "msg_id": msg_id,
+        "device_id": "esp32-01",
+        "msg_type": msg_type,
+        "t_sensor_ms": 1000,
+        "t_intended_ms": 1000,
+        "t_pc_rx_ms": 1005,
+        "t_proc_start_ms": 1010,
+        "t_proc_end_ms": 1010,
+        "t_db_enqueue_ms": "" if t_emit == "" else 1010,
+        "t_dashboard_emit_ms": t_emit,
+        "deadline_ms": 300 if msg_type == "telemetry" else 100,
+        "avi_ms": 2000,
+        "notes": notes,
+    }
+
+
+def _write_trace(tmp_path):
+    events = [
+        _event("t1", "telemetry", 1100),
+        _event("t2", "telemetry", 1500),
+        _event("t3", "telemetry", "", "shed_expired"),
+        _event("t4", "telemetry", "", "shed_expired"),
+        _event("a1", "alarm", 1050),
+    ]
+    events_path = tmp_path / "trace_events.csv"
+    with open(events_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=EVENT_FIELDS)
+        writer.writeheader()
+        writer.writerows(events)
+    ack_path = tmp_path / "trace_acks.csv"
+    with open(ack_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=ACK_FIELDS)
+        writer.writeheader()
+        writer.writerows({"msg_id": e["msg_id"], "t_db_ack_ms": 1020} for e in events if not e["notes"])
+    return str(events_path), str(ack_path)
+
+
+def test_shed_telemetry_counts_as_deadline_miss_in_both_paths(tmp_path):
+    cfg = validate_config({})
+    set_cfg(cfg, "deadlines.telemetry_deadline_ms", 300)
+    events_path, ack_path = _write_trace(tmp_path)
+    stats_path = str(tmp_path / "missing_stats.json")
+
+    rows = join_trace(events_path, ack_path, str(tmp_path / "final_rows.csv"))
+    by_id = {r["msg_id"]: r for r in rows}
+    assert by_id["t3"]["deadline_miss"] == 1
+    assert by_id["t3"]["notes"] == "shed_expired"
+    row_summary = compute_summary(rows, cfg, 10, stats_path)
+
+    cols = join_trace_columns(load_trace_columns_csv(events_path, ack_path))
+    assert cols["deadline_miss"].tolist() == [0, 1, 1, 1, 0]
+    assert cols["notes"].tolist()[2] == "shed_expired"
+    col_summary = compute_summary_columns(cols, cfg, 10, stats_path)
+
+    for summary in (row_summary, col_summary):
+        # t2 was late and t3/t4 were shed: 3 misses out of 4 telemetry
+        assert summary["telemetry_shed"] == 2
+        assert summary["telemetry_deadline_miss_rate"] == 0.75
+        assert summary["telemetry_response_deadline_miss_rate"] == 0.75
+        assert summary["alarm_deadline_miss_rate"] == 0.0
+    assert row_summary == col_summary
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from typing import List, Optional
+
+from src.common.config import set_cfg, validate_config
+from src.common.models import Message
+from src.common.time_utils import wall_ms
+from src.rtdb.db_writer import DbWriter
+from src.rtdb.mock_backend import MockBackend
+from src.rtdb.rtdb_interface import BatchOp
+
+
+class _FailingBackend(MockBackend):
+    # Raises on the first `failures` writes (every write when None)
+    def __init__(self, path: str, failures: Optional[int] = None) -> None:
+        super().__init__(path)
+        self.failures = failures
+        self.attempts = 0
+        self._lock = threading.Lock()
+
+    def write_batch(self, ops: List[BatchOp]) -> int:
+        with self._lock:
+            self.attempts += 1
+            failing = self.failures is None or self.attempts <= self.failures
+        if failing:
+            raise ConnectionError("RTDB unavailable")
+        return super().write_batch(ops)
+
+
+class _Acks:
+    def __init__(self) -> None:
+        self.acks: List[str] = []
+
+    def write_ack(self, msg_id: str, ack_ms: Optional[int]) -> None:
+        self.acks.append(msg_id)
+
+
+def _cfg(tmp_path, max_attempts: int = 4, backoff_ms: int = 10) -> dict:
+    cfg = validate_config({})
+    set_cfg(cfg, "rtdb.writer.wal.enabled", True)
+    set_cfg(cfg, "rtdb.writer.wal.dir", str(tmp_path / "wal"))
+    set_cfg(cfg, "rtdb.writer.wal.retry.max_attempts", max_attempts)
+    set_cfg(cfg, "rtdb.writer.wal.retry.backoff_ms", backoff_ms)
+    set_cfg(cfg, "rtdb.writer.wal.retry.backoff_max_ms", 1000)
+    return cfg
+
+
+def _alarm(msg_id: str = "alarm-1") -> Message:
+    msg = Message(
+        msg_id=msg_id,
+        device_id="esp32-01",
+        msg_type="alarm",
+        t_sensor_ms=wall_ms(),
+        seq=1,
+        values={"temp": 71.5, "smoke": 0.82, "gas": 0.4, "flame": 1.0},
+        alarm={"fire_detected": True, "level": "ALARM"},
+        severity="ALARM",
+    )
+    msg.t_db_enqueue_ms = wall_ms()
+    return msg
+
+
+def _wait_for(predicate, timeout_s: float = 5.0) -> bool:
+    end = time.monotonic() + timeout_s
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_retries_are_bounded_while_backend_is_down(tmp_path):
+    backend = _FailingBackend(os.path.join(tmp_path, "rtdb.jsonl"))
+    acks = _Acks()
+    writer = DbWriter(backend, acks, _cfg(tmp_path, max_attempts=4, backoff_ms=10))
+    writer.start()
+    writer.enqueue(_alarm())
+    assert _wait_for(lambda: writer.gave_up_count == 1)
+    # Backoff 10, 20, 40 ms: all four attempts are over well within a second,
+    # and none follow once the writer has given up
+    time.sleep(0.3)
+    writer.stop()
+
+    assert backend.attempts == 4
+    assert writer.retry_count == 3
+    assert acks.acks == []
+    stats = writer.wal_stats()
+    assert stats["pending"] == 1
+    assert stats["gave_up"] == 1
+
+
+def test_retry_waits_for_backoff(tmp_path):
+    backend = _FailingBackend(os.path.join(tmp_path, "rtdb.jsonl"))
+    writer = DbWriter(backend, _Acks(), _cfg(tmp_path, max_attempts=10, backoff_ms=200))
+    writer.start()
+    writer.enqueue(_alarm())
+    time.sleep(0.3)
+    writer.stop()
+    # First write at 0 ms, retry at 200 ms, next not before 600 ms
+    assert backend.attempts == 2
+    assert writer.wal_stats()["pending"] == 1
+
+
+def test_write_is_acked_once_backend_recovers(tmp_path):
+    backend = _FailingBackend(os.path.join(tmp_path, "rtdb.jsonl"), failures=2)
+    acks = _Acks()
+    writer = DbWriter(backend, acks, _cfg(tmp_path, max_attempts=4, backoff_ms=10))
+    writer.start()
+    writer.enqueue(_alarm())
+    assert _wait_for(lambda: acks.acks == ["alarm-1"])
+    writer.stop()
+
+    assert backend.attempts == 3
+    assert writer.gave_up_count == 0
+    assert writer.wal_stats()["pending"] == 0
+
+
+def test_pending_entry_is_replayed_on_next_start(tmp_path):
+    down = _FailingBackend(os.path.join(tmp_path, "rtdb.jsonl"))
+    writer = DbWriter(down, _Acks(), _cfg(tmp_path, max_attempts=2, backoff_ms=10))
+    writer.start()
+    writer.enqueue(_alarm())
+    assert _wait_for(lambda: writer.gave_up_count == 1)
+    writer.stop()
+
+    up = _FailingBackend(os.path.join(tmp_path, "rtdb.jsonl"), failures=0)
+    acks = _Acks()
+    writer = DbWriter(up, acks, _cfg(tmp_path, max_attempts=2, backoff_ms=10))
+    writer.start()
+    assert _wait_for(lambda: writer.replay_count == 1)
+    writer.enqueue(_alarm("alarm-2"))
+    assert _wait_for(lambda: acks.acks == ["alarm-2"])
+    writer.stop()
+
+    # The replayed alarm is written, but it belongs to the earlier run: no
+    # ack and no DB time from this one
+    assert up.attempts == 2
+    assert writer.db_time_sketch.count == 1
+    stats = writer.wal_stats()
+    assert (stats["recovered"], stats["replayed"], stats["pending"]) == (1, 1, 0)
+
+
+class _BlockingBackend(MockBackend):
+    # Every write waits until `release` is set
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = 0
+
+    def write_batch(self, ops: List[BatchOp]) -> int:
+        self.calls += 1
+        self.started.set()
+        self.release.wait(10)
+        return super().write_batch(ops)
+
+
+def test_stop_does_not_flush_while_a_write_is_stuck(tmp_path):
+    backend = _BlockingBackend(os.path.join(tmp_path, "rtdb.jsonl"))
+    cfg = _cfg(tmp_path)
+    set_cfg(cfg, "rtdb.writer.inflight", 1)
+    set_cfg(cfg, "rtdb.writer.alarm_reserved", 0)
+    writer = DbWriter(backend, _Acks(), cfg)
+    writer.start()
+    writer.enqueue(_alarm("alarm-1"))
+    assert backend.started.wait(5)
+    writer.enqueue(_alarm("alarm-2"))
+    writer.stop()
+    # The stuck thread still owns the backend: alarm-2 was not written
+    # concurrently by stop() and stays in the log for the next start
+    assert backend.calls == 1
+    assert writer.wal.pending() == 2
+    backend.release.set()
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from src.rtdb.async_backend import AsyncBackend
+from src.rtdb.hedge import HEDGE, PRIMARY, AsyncHedgedWriter, HedgedWriter, HedgePolicy
+from src.rtdb.mock_backend import MockBackend
+from src.rtdb.rtdb_interface import BatchOp
+
+_OPS: List[BatchOp] = [
+    ("state", "esp32-01", {"severity": "ALARM"}),
+    ("alarm", "alarm-1", {"deviceId": "esp32-01", "severity": "ALARM"}),
+]
+
+
+class _ScriptedBackend(MockBackend):
+    # The n-th write_batch sleeps delays[n] seconds, then raises if fails[n];
+    # later calls are immediate and succeed
+    def __init__(self, path: str, script: List[Tuple[float, bool]]) -> None:
+        super().__init__(path)
+        self.script = script
+        self.calls: List[List[str]] = []
+        self._lock = threading.Lock()
+
+    def write_batch(self, ops: List[BatchOp]) -> int:
+        with self._lock:
+            n = len(self.calls)
+            self.calls.append([kind for kind, _, _ in ops])
+        delay, fail = self.script[n] if n < len(self.script) else (0.0, False)
+        time.sleep(delay)
+        if fail:
+            raise ConnectionError("RTDB unavailable")
+        return super().write_batch(ops)
+
+
+def _policy() -> HedgePolicy:
+    # Enough fast samples for a hedge delay of min_delay_ms (5 ms)
+    policy = HedgePolicy(percentile=95, min_delay_ms=5, budget=1.0)
+    for _ in range(20):
+        policy.add(1.0)
+    return policy
+
+
+def _wait_for(predicate, timeout_s: float = 5.0) -> bool:
+    end = time.monotonic() + timeout_s
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_hedge_repeats_only_the_alarm_document(tmp_path):
+    backend = _ScriptedBackend(str(tmp_path / "rtdb.jsonl"), [(0.3, False)])
+    lost: List[str] = []
+    writer = HedgedWriter(backend, _policy(), on_state_lost=lost.append)
+    assert writer.write_batch(list(_OPS))[1] == HEDGE
+    writer.close()
+    # The primary carried the state; the hedge only the alarm document
+    assert backend.calls == [["state", "alarm"], ["alarm"]]
+    assert lost == []
+
+
+def test_state_of_a_primary_failing_after_the_hedge_won_is_reported_lost(tmp_path):
+    backend = _ScriptedBackend(str(tmp_path / "rtdb.jsonl"), [(0.2, True)])
+    lost: List[str] = []
+    writer = HedgedWriter(backend, _policy(), on_state_lost=lost.append)
+    assert writer.write_batch(list(_OPS))[1] == HEDGE
+    assert _wait_for(lambda: lost == ["esp32-01"])
+    writer.close()
+    assert backend.calls == [["state", "alarm"], ["alarm"]]
+
+
+def test_state_is_written_once_after_a_hedge_rescues_a_failed_primary(tmp_path):
+    # The primary fails while the hedge is in flight; the hedge wins
+    backend = _ScriptedBackend(str(tmp_path / "rtdb.jsonl"), [(0.05, True), (0.15, False)])
+    lost: List[str] = []
+    writer = HedgedWriter(backend, _policy(), on_state_lost=lost.append)
+    assert writer.write_batch(list(_OPS))[1] == HEDGE
+    writer.close()
+    assert backend.calls == [["state", "alarm"], ["alarm"], ["state"]]
+    assert lost == []
+    assert writer.policy.rescued == 1
+
+
+def test_unhedged_write_is_one_batch(tmp_path):
+    backend = _ScriptedBackend(str(tmp_path / "rtdb.jsonl"), [])
+    writer = HedgedWriter(backend, _policy())
+    assert writer.write_batch(list(_OPS))[1] == PRIMARY
+    writer.close()
+    assert backend.calls == [["state", "alarm"]]
+
+
+class _AsyncScriptedBackend(AsyncBackend):
+    def __init__(self, script: List[Tuple[float, bool]]) -> None:
+        self.script = script
+        self.calls: List[List[str]] = []
+
+    async def write_batch(self, ops: List[BatchOp]) -> int:
+        n = len(self.calls)
+        self.calls.append([kind for kind, _, _ in ops])
+        delay, fail = self.script[n] if n < len(self.script) else (0.0, False)
+        await asyncio.sleep(delay)
+        if fail:
+            raise ConnectionError("RTDB unavailable")
+        return int(time.time() * 1000)
+
+
+def test_async_hedge_repeats_only_the_alarm_document():
+    backend = _AsyncScriptedBackend([(0.2, True)])
+    lost: List[str] = []
+    writer = AsyncHedgedWriter(backend, _policy(), on_state_lost=lost.append)
+
+    async def run() -> Optional[int]:
+        attempt = (await writer.write_batch(list(_OPS)))[1]
+        await writer.drain()
+        return attempt
+
+    assert asyncio.run(run()) == HEDGE
+    assert backend.calls == [["state", "alarm"], ["alarm"]]
+    assert lost == ["esp32-01"]
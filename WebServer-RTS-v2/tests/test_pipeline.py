@@ -0,0 +1,123 @@
+from typing import List, Optional
+
+from src.common.config import set_cfg, validate_config
+from src.common.models import Message
+from src.common.time_utils import wall_ms
+from src.processing.pipeline import _Shard
+from src.processing.rules import RuleSet
+
+_VALUES = {"temp": 25.0, "smoke": 0.1, "gas": 0.1, "flame": 0.0}
+
+
+def _msg(msg_id: str, msg_type: str = "telemetry", device_id: str = "esp32-01", t_sensor_ms: Optional[int] = None) -> Message:
+    return Message(
+        msg_id=msg_id,
+        device_id=device_id,
+        msg_type=msg_type,
+        t_sensor_ms=wall_ms() if t_sensor_ms is None else t_sensor_ms,
+        seq=0,
+        values=dict(_VALUES),
+        alarm={"fire_detected": True, "level": "ALARM"} if msg_type == "alarm" else None,
+    )
+
+
+def _shard(processed: List[Message], **overrides: object) -> _Shard:
+    cfg = validate_config({})
+    for path, value in overrides.items():
+        set_cfg(cfg, path.replace("__", "."), value)
+    return _Shard(0, cfg, processed.append, RuleSet())
+
+
+def _drain(shard: _Shard) -> None:
+    # One worker loop without the thread: serve until the queue is empty
+    while True:
+        entry = shard._queue.get(timeout=0)
+        if entry is None:
+            return
+        cls, msg = entry
+        if cls == "telemetry" and shard._classify_batch > 1:
+            shard._process_batch(msg)
+        else:
+            shard._process(msg)
+
+
+def _ids(processed: List[Message]) -> List[str]:
+    return [m.msg_id for m in processed]
+
+
+def test_status_and_telemetry_keep_arrival_order():
+    processed: List[Message] = []
+    shard = _shard(processed)
+    for msg_id, msg_type in (("t1", "telemetry"), ("s1", "status"), ("t2", "telemetry"), ("s2", "status")):
+        shard.enqueue(_msg(msg_id, msg_type))
+    _drain(shard)
+    assert _ids(processed) == ["t1", "s1", "t2", "s2"]
+
+
+def test_status_and_telemetry_keep_arrival_order_under_edf():
+    processed: List[Message] = []
+    shard = _shard(processed, pipeline__scheduler="edf")
+    now = wall_ms()
+    shard.enqueue(_msg("t1", "telemetry", t_sensor_ms=now))
+    shard.enqueue(_msg("s1", "status", t_sensor_ms=now + 1))
+    shard.enqueue(_msg("t2", "telemetry", t_sensor_ms=now + 2))
+    _drain(shard)
+    assert _ids(processed) == ["t1", "s1", "t2"]
+
+
+def test_drop_policy_drops_newest_when_full():
+    processed: List[Message] = []
+    shard = _shard(processed, pipeline__telemetry_queue_max=2, pipeline__telemetry_drop_policy="drop")
+    results = [shard.enqueue(_msg(f"t{i}")) for i in range(4)]
+    assert results == [True, True, False, False]
+    assert shard.enqueue(_msg("a1", "alarm"))
+    _drain(shard)
+    assert _ids(processed) == ["a1", "t0", "t1"]
+    assert shard.drop_count_telemetry == 2
+    assert shard.queue_max_observed == 2
+
+
+def test_keep_latest_policy_evicts_oldest_when_full():
+    processed: List[Message] = []
+    shard = _shard(processed, pipeline__telemetry_queue_max=2, pipeline__telemetry_drop_policy="keep_latest")
+    for i in range(4):
+        assert shard.enqueue(_msg(f"t{i}"))
+    _drain(shard)
+    assert _ids(processed) == ["t2", "t3"]
+    assert shard.drop_count_telemetry == 2
+
+
+def test_expired_telemetry_is_shed_and_alarms_are_not():
+    processed: List[Message] = []
+    shard = _shard(processed, pipeline__shed_expired=True, deadlines__telemetry_deadline_ms=100)
+    old = wall_ms() - 10_000
+    shard.enqueue(_msg("t-old", t_sensor_ms=old))
+    shard.enqueue(_msg("a-old", "alarm", t_sensor_ms=old))
+    shard.enqueue(_msg("t-new"))
+    _drain(shard)
+    by_id = {m.msg_id: m for m in processed}
+    assert set(by_id) == {"t-old", "a-old", "t-new"}
+    assert by_id["t-old"].shed and by_id["t-old"].notes == "shed_expired"
+    assert not by_id["a-old"].shed and by_id["a-old"].severity == "ALARM"
+    assert not by_id["t-new"].shed and by_id["t-new"].severity == "NORMAL"
+    assert shard.shed_count == 1
+    assert shard.processed == 2
+
+
+def test_batch_serves_alarms_between_telemetry_deliveries():
+    processed: List[Message] = []
+
+    def on_processed(msg: Message) -> None:
+        processed.append(msg)
+        # An alarm arrives while the first batched telemetry is delivered
+        if msg.msg_id == "t0":
+            shard.enqueue(_msg("a1", "alarm"))
+
+    cfg = validate_config({})
+    set_cfg(cfg, "pipeline.classify_batch", 8)
+    shard = _Shard(0, cfg, on_processed, RuleSet())
+    for i in range(4):
+        shard.enqueue(_msg(f"t{i}"))
+    _drain(shard)
+    assert _ids(processed) == ["t0", "a1", "t1", "t2", "t3"]
+    assert [m.severity for m in processed] == ["NORMAL", "ALARM", "NORMAL", "NORMAL", "NORMAL"]
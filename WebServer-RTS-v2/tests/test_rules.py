@@ -0,0 +1,60 @@
+import copy
+
+import pytest
+
+from src.bench.rules_bench import _messages, _zoned
+from src.common.models import Message
+from src.processing.rules import RuleSet
+
+
+def _msg(values, msg_type: str = "telemetry", device_id: str = "esp32-0001", alarm=None) -> Message:
+    return Message(
+        msg_id="m", device_id=device_id, msg_type=msg_type, t_sensor_ms=0, seq=0, values=values, alarm=alarm
+    )
+
+
+def _scalar(rules: RuleSet, messages):
+    return [rules.classify(m) for m in messages]
+
+
+def _batch(rules: RuleSet, messages):
+    messages = copy.deepcopy(messages)
+    rules.classify_batch(messages)
+    return [(m.severity, m.notes) for m in messages]
+
+
+@pytest.mark.parametrize("rules", [RuleSet(), _zoned(200)], ids=["default", "zoned"])
+def test_batch_matches_scalar(rules):
+    messages = _messages(2000, 200, seed=3)
+    assert _batch(rules, messages) == _scalar(rules, messages)
+
+
+def test_batch_matches_scalar_for_odd_but_numeric_readings():
+    normal = {"temp": 20.0, "smoke": 0.0, "gas": 0.0, "flame": 0.0}
+    messages = [
+        _msg(dict(normal)),
+        _msg({"temp": 70, "smoke": 0, "gas": 0, "flame": 0}),
+        _msg({"temp": 20.0, "smoke": 0.0, "gas": 0.0, "flame": True}),
+        _msg({"temp": float("nan"), "smoke": 0.9, "gas": 0.0, "flame": 0.0}),
+        _msg({"temp": 10**30, "smoke": 0.0, "gas": 0.0, "flame": 0.0}),
+        _msg({"temp": 2**70, "smoke": 0.0, "gas": 0.0, "flame": 0.0}),
+        _msg({"temp": 90.0, "smoke": 0.0, "gas": 0.0}),
+        _msg(dict(normal), msg_type="alarm"),
+        _msg(dict(normal), alarm={"fire_detected": True}),
+        _msg(dict(normal), msg_type="status"),
+    ]
+    rules = RuleSet(devices={"esp32-0001": {"temp": None}})
+    for subset in (messages, messages[:6]):
+        assert _batch(rules, subset) == _scalar(rules, subset)
+        assert _batch(RuleSet(), subset) == _scalar(RuleSet(), subset)
+
+
+@pytest.mark.parametrize("bad", ["1.5", None, "70", [1.0]])
+def test_batch_rejects_non_numeric_readings_like_scalar(bad):
+    good = _msg({"temp": 20.0, "smoke": 0.0, "gas": 0.0, "flame": 0.0})
+    odd = _msg({"temp": bad, "smoke": 0.0, "gas": 0.0, "flame": 0.0})
+    rules = RuleSet()
+    with pytest.raises(TypeError):
+        rules.classify(odd)
+    with pytest.raises(TypeError):
+        rules.classify_batch([good, odd])
@@ -0,0 +1,98 @@
+import threading
+
+from src.common.sched_queue import SchedQueue
+
+
+def _drain(queue: SchedQueue):
+    out = []
+    while True:
+        entry = queue.get(timeout=0)
+        if entry is None:
+            return out
+        out.append(entry)
+
+
+def test_higher_class_first_and_fifo_within_a_class():
+    queue = SchedQueue({})
+    queue.put("telemetry", "t1")
+    queue.put("status", "s1")
+    queue.put("telemetry", "t2")
+    queue.put("alarm", "a1")
+    queue.put("alarm", "a2")
+    assert _drain(queue) == [
+        ("alarm", "a1"),
+        ("alarm", "a2"),
+        ("status", "s1"),
+        ("telemetry", "t1"),
+        ("telemetry", "t2"),
+    ]
+
+
+def test_edf_orders_by_deadline_and_ties_by_arrival():
+    queue = SchedQueue({}, edf=True)
+    queue.put("telemetry", "late", deadline=300)
+    queue.put("telemetry", "tie-1", deadline=100)
+    queue.put("telemetry", "none")
+    queue.put("telemetry", "early", deadline=50)
+    queue.put("telemetry", "tie-2", deadline=100)
+    queue.put("alarm", "alarm", deadline=1000)
+    assert [item for _, item in _drain(queue)] == ["alarm", "early", "tie-1", "tie-2", "late", "none"]
+
+
+def test_offer_drops_newest_when_full():
+    queue = SchedQueue({"telemetry": 2})
+    assert queue.offer("telemetry", "t1")
+    assert queue.offer("telemetry", "t2")
+    assert not queue.offer("telemetry", "t3")
+    # Other classes have their own capacity (0 = unbounded)
+    assert queue.offer("alarm", "a1")
+    assert _drain(queue) == [("alarm", "a1"), ("telemetry", "t1"), ("telemetry", "t2")]
+
+
+def test_put_evict_evicts_oldest_when_full():
+    queue = SchedQueue({"telemetry": 2})
+    assert queue.put_evict("telemetry", "t1") is None
+    assert queue.put_evict("telemetry", "t2") is None
+    assert queue.put_evict("telemetry", "t3") == "t1"
+    assert [item for _, item in _drain(queue)] == ["t2", "t3"]
+
+
+def test_put_evict_under_edf_evicts_earliest_deadline():
+    queue = SchedQueue({"telemetry": 2}, edf=True)
+    queue.put_evict("telemetry", "t1", deadline=200)
+    queue.put_evict("telemetry", "t2", deadline=100)
+    assert queue.put_evict("telemetry", "t3", deadline=300) == "t2"
+    assert [item for _, item in _drain(queue)] == ["t1", "t3"]
+
+
+def test_get_only_and_get_many():
+    queue = SchedQueue({})
+    for i in range(5):
+        queue.put("telemetry", f"t{i}")
+    queue.put("alarm", "a1")
+    assert queue.get(timeout=0, only=("status",)) is None
+    assert queue.get_many("telemetry", 3) == ["t0", "t1", "t2"]
+    assert queue.get(timeout=0, only=("telemetry",)) == ("telemetry", "t3")
+    assert queue.depths() == {"alarm": 1, "status": 0, "telemetry": 1}
+
+
+def test_put_blocks_until_room_and_close_releases_it():
+    queue = SchedQueue({"telemetry": 1})
+    queue.put("telemetry", "t1")
+    results = []
+    putter = threading.Thread(target=lambda: results.append(queue.put("telemetry", "t2")))
+    putter.start()
+    putter.join(timeout=0.1)
+    assert putter.is_alive()
+    assert queue.get(timeout=1) == ("telemetry", "t1")
+    putter.join(timeout=1)
+    assert results == [True]
+
+    blocked = threading.Thread(target=lambda: results.append(queue.put("telemetry", "t3")))
+    blocked.start()
+    queue.close()
+    blocked.join(timeout=1)
+    assert results == [True, False]
+    # Closed queues still hand out what they hold, then return None
+    assert queue.get() == ("telemetry", "t2")
+    assert queue.get() is None
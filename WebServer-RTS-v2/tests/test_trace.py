@@ -0,0 +1,58 @@
+import os
+
+from src.common.trace import ACK_FIELDS, AckWriter
+from src.common.trace_bin import BinaryAckWriter, StringTable, load_strings
+
+
+def test_rows_after_close_are_dropped(tmp_path):
+    writer = AckWriter(str(tmp_path / "acks.csv"), background=False)
+    writer.write_ack("m1", 5)
+    writer.close()
+    writer.write_ack("late", 6)
+
+    assert writer.stats()["pending"] == 0
+    assert writer.dropped_after_close == 1
+    with open(tmp_path / "acks.csv", encoding="utf-8") as f:
+        assert f.read().split() == [",".join(ACK_FIELDS), "m1,5"]
+
+
+def test_existing_trace_with_same_header_is_appended(tmp_path):
+    path = str(tmp_path / "acks.csv")
+    for i in range(2):
+        writer = AckWriter(path, background=False)
+        writer.write_ack(f"m{i}", i)
+        writer.close()
+
+    assert writer.rotations == 0
+    with open(path, encoding="utf-8") as f:
+        assert f.read().split() == [",".join(ACK_FIELDS), "m0,0", "m1,1"]
+
+
+def test_existing_trace_with_other_header_is_rotated(tmp_path):
+    path = str(tmp_path / "acks.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("msg_id,old_column\r\nold,1\r\n")
+    writer = AckWriter(path, background=False)
+    writer.write_ack("m1", 5)
+    writer.close()
+
+    assert writer.rotations == 1
+    with open(path, encoding="utf-8") as f:
+        assert f.read().split() == [",".join(ACK_FIELDS), "m1,5"]
+    with open(path + ".1", encoding="utf-8") as f:
+        assert f.read().split() == ["msg_id,old_column", "old,1"]
+
+
+def test_binary_trace_with_other_layout_is_rotated(tmp_path):
+    path = str(tmp_path / "acks.bin")
+    with open(path, "wb") as f:
+        f.write(b"RTSTRC1\n" + (99).to_bytes(8, "little"))
+    strings = StringTable(str(tmp_path / "strings.txt"))
+    writer = BinaryAckWriter(path, strings, background=False)
+    writer.write_ack("m1", 5)
+    writer.close()
+    strings.close()
+
+    assert writer.rotations == 1
+    assert os.path.getsize(path + ".1") == 16
+    assert "m1" in load_strings(str(tmp_path / "strings.txt"))
@@ -0,0 +1,190 @@
+import os
+
+from src.common.codec import get_codec
+from src.common.models import Message
+from src.rtdb.wal import _HEADER, ENTRY, WriteAheadLog, _record, read_segment
+
+
+def _msg(msg_id: str, msg_type: str = "alarm") -> Message:
+    return Message(
+        msg_id=msg_id,
+        device_id="esp32-01",
+        msg_type=msg_type,
+        t_sensor_ms=1000,
+        seq=7,
+        values={"temp": 71.5, "smoke": 0.82, "gas": 0.4, "flame": 1.0},
+        alarm={"fire_detected": True, "level": "ALARM"},
+        severity="ALARM",
+        t_db_enqueue_ms=1010,
+    )
+
+
+def _wal(tmp_path, segment_bytes: int = 16 * 1024 * 1024) -> WriteAheadLog:
+    # fsync_interval_ms 0: no committer thread, every append is fsynced
+    return WriteAheadLog(str(tmp_path / "wal"), fsync_interval_ms=0, segment_bytes=segment_bytes)
+
+
+def _segments(tmp_path):
+    return sorted(os.listdir(tmp_path / "wal"))
+
+
+def _ids(messages):
+    return [m.msg_id for m in messages]
+
+
+def _append_raw(tmp_path, payload: bytes) -> None:
+    # Adds an entry record to the newest segment, as another version would
+    directory = tmp_path / "wal"
+    segment = sorted(os.listdir(directory))[-1]
+    with open(directory / segment, "ab") as f:
+        f.write(_record(ENTRY, payload))
+
+
+def test_entries_round_trip_by_field_name(tmp_path):
+    wal = _wal(tmp_path)
+    assert wal.open() == []
+    wal.append(_msg("a1"))
+    wal.close()
+
+    wal = _wal(tmp_path)
+    recovered = wal.open()
+    wal.close()
+    assert len(recovered) == 1
+    msg = recovered[0]
+    assert (msg.msg_id, msg.device_id, msg.seq, msg.severity, msg.t_db_enqueue_ms) == ("a1", "esp32-01", 7, "ALARM", 1010)
+    assert msg.values == _msg("a1").values
+
+
+def test_entries_from_another_message_layout_decode_by_name(tmp_path):
+    wal = _wal(tmp_path)
+    wal.open()
+    wal.append(_msg("a1"))
+    codec = get_codec()
+    # A field this version does not know and a missing optional one
+    _append_raw(
+        tmp_path,
+        codec.dumps(
+            {
+                "msg_id": "a2",
+                "device_id": "esp32-02",
+                "msg_type": "alarm",
+                "t_sensor_ms": 2000,
+                "seq": 3,
+                "values": {},
+                "priority": 9,
+            }
+        ),
+    )
+    wal.close()
+
+    wal = _wal(tmp_path)
+    recovered = wal.open()
+    wal.close()
+    assert [(m.msg_id, m.device_id, m.seq) for m in recovered] == [("a1", "esp32-01", 7), ("a2", "esp32-02", 3)]
+    assert wal.skipped == 0
+
+
+def test_unreadable_entries_are_skipped(tmp_path):
+    wal = _wal(tmp_path)
+    wal.open()
+    wal.append(_msg("a1"))
+    codec = get_codec()
+    # Positional array of older logs, a required field missing, not JSON
+    _append_raw(tmp_path, codec.dumps(["a2", "esp32-01", "alarm", 1000, 1, {}]))
+    _append_raw(tmp_path, codec.dumps({"msg_id": "a3", "device_id": "esp32-01"}))
+    _append_raw(tmp_path, b"\x00not json")
+    wal.close()
+
+    wal = _wal(tmp_path)
+    recovered = wal.open()
+    wal.close()
+    assert [m.msg_id for m in recovered] == ["a1"]
+    assert wal.skipped == 3
+
+
+def test_acked_entries_are_not_replayed_across_restarts(tmp_path):
+    wal = _wal(tmp_path)
+    wal.open()
+    for msg_id in ("a1", "a2", "a3"):
+        wal.append(_msg(msg_id))
+    wal.ack("a2")
+    wal.close()
+
+    # Unacked entries come back oldest first, compacted into one new segment
+    wal = _wal(tmp_path)
+    assert _ids(wal.open()) == ["a1", "a3"]
+    assert _segments(tmp_path) == ["wal-000002.log"]
+    wal.ack("a1")
+    wal.close()
+
+    wal = _wal(tmp_path)
+    assert _ids(wal.open()) == ["a3"]
+    wal.ack("a3")
+    wal.close()
+    # Nothing left to replay: the log is gone
+    assert _segments(tmp_path) == []
+    wal = _wal(tmp_path)
+    assert wal.open() == []
+    wal.close()
+
+
+def test_torn_tail_keeps_the_records_before_it(tmp_path):
+    wal = _wal(tmp_path)
+    wal.open()
+    wal.append(_msg("a1"))
+    wal.append(_msg("a2"))
+    wal.close()
+
+    path = tmp_path / "wal" / _segments(tmp_path)[0]
+    data = path.read_bytes()
+    # A crash in the middle of writing a2
+    path.write_bytes(data[:-5])
+    records, clean = read_segment(str(path))
+    assert len(records) == 1 and not clean
+
+    wal = _wal(tmp_path)
+    assert _ids(wal.open()) == ["a1"]
+    wal.close()
+
+
+def test_corrupt_record_stops_recovery_of_its_segment(tmp_path):
+    wal = _wal(tmp_path)
+    wal.open()
+    wal.append(_msg("a1"))
+    wal.append(_msg("a2"))
+    wal.append(_msg("a3"))
+    wal.close()
+
+    path = tmp_path / "wal" / _segments(tmp_path)[0]
+    data = bytearray(path.read_bytes())
+    # Flip a payload byte of a2: its CRC no longer matches, and a3 after it
+    # is not trusted either
+    records, _ = read_segment(str(path))
+    a1_len = _HEADER.size + len(records[0][1])
+    data[a1_len + _HEADER.size + 3] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    wal = _wal(tmp_path)
+    assert _ids(wal.open()) == ["a1"]
+    wal.close()
+
+
+def test_checkpoint_deletes_oldest_segments_once_fully_acked(tmp_path):
+    # Every append fills its segment, so each entry gets one of its own
+    wal = _wal(tmp_path, segment_bytes=1)
+    wal.open()
+    for msg_id in ("a1", "a2", "a3"):
+        wal.append(_msg(msg_id))
+    assert _segments(tmp_path) == ["wal-000001.log", "wal-000002.log", "wal-000003.log", "wal-000004.log"]
+
+    # a1 is still pending in the oldest segment, so nothing can go yet
+    wal.ack("a2")
+    assert len(_segments(tmp_path)) == 4
+    wal.ack("a1")
+    assert _segments(tmp_path) == ["wal-000003.log", "wal-000004.log"]
+    assert wal.pending() == 1
+    wal.close()
+
+    wal = _wal(tmp_path)
+    assert _ids(wal.open()) == ["a3"]
+    wal.close()